@@ -0,0 +1,20 @@
+"""
+This module provides the public interface for the metrics components.
+
+It imports and exposes the following classes:
+- Counter: A monotonically increasing count, e.g. of messages or bytes.
+- Gauge: A value that goes up and down, e.g. a queue depth.
+- Histogram: A distribution of observed values in power-of-two buckets, e.g. of latencies.
+- MetricsRegistry: The observable collection of metrics that codecs and network components publish into.
+- Profiler: Opt-in cProfile, tracemalloc and stage timers around the hot paths, written to disk at exit or on a signal.
+
+This module sets up the public API for the instrumentation of the application.
+
+Attributes:
+    __all__ (list): A list of public objects of this module. These are the names that will be imported
+                    when `from module import *` is used.
+"""
+from .registry import Counter, Gauge, Histogram, MetricsRegistry
+from .profiling import Profiler
+
+__all__ = ["Counter", "Gauge", "Histogram", "MetricsRegistry", "Profiler"]
@@ -0,0 +1,320 @@
+"""
+Opt-in profiling of a running node.
+
+A `Profiler` is switched on by the `PREDICTOR_PROFILE` environment variable, set to
+the directory the reports are written to, or by the "profile" object of the node's
+JSON file. Nothing in the code paths it measures checks whether it is enabled:
+`install` replaces the measured methods on their classes with wrappers, so a node
+that never installs a profiler runs the original methods untouched.
+
+Three instruments are available, each of which can be turned off:
+
+- cProfile: every thread entry point (the handlers of the client and servers and the
+  client's sender thread) runs under a profiler of its own, since a profiler only
+  sees the thread that enabled it. The profiles are merged when a report is written.
+- tracemalloc: allocations are traced from `install` on, and every report lists the
+  `top` source lines holding the most memory.
+- Stage timers: the thread entry points and the codec entry points count their calls
+  and wall-clock time, total and longest.
+
+Reports are written when the process exits and whenever it receives `SIGUSR1`, where
+the platform has it, so a slow node can be inspected without stopping it. The signal
+only starts a thread that writes the report, since it may interrupt the main thread
+while a timed stage holds the profiler's lock. Every report replaces the previous one:
+
+    profile-<pid>.pstats   The merged profiles, for `pstats` or snakeviz.
+    profile-<pid>.txt      The `top` functions by cumulative time.
+    allocations-<pid>.txt  The `top` allocation sites.
+    stages-<pid>.txt       The stage timers.
+
+Attributes:
+    ENVIRONMENT (str): The environment variable naming the report directory.
+    THREAD_ENTRY_POINTS (tuple): The module, class and method of every thread entry point.
+    STAGES (tuple): The module, class and method of every codec entry point timed.
+"""
+import atexit
+import cProfile
+import functools
+import importlib
+import marshal
+import os
+import pstats
+import signal
+import threading
+import tracemalloc
+from time import perf_counter_ns
+from typing import Any, Callable
+
+ENVIRONMENT: str = "PREDICTOR_PROFILE"
+
+THREAD_ENTRY_POINTS: tuple[tuple[str, str, str], ...] = (
+    ("Network.client", "Client", "handler"),
+    ("Network.client", "Client", "_Client__drain"),
+    ("Network.server", "Server", "handler"),
+    ("Network.selector_server", "SelectorServer", "handler"),
+)
+
+STAGES: tuple[tuple[str, str, str], ...] = (
+    ("PayloadCompression.Compression", "Compression", "compress_into"),
+    ("PayloadCompression.Compression", "Compression", "compress_many"),
+    ("PayloadCompression.Decompression", "Decompression", "decompress_into"),
+    ("PayloadCompression.Decompression", "Decompression", "decompress_many"),
+    ("PayloadCompression.StreamCompression", "StreamCompressor", "flush_into"),
+    ("PayloadCompression.StreamDecompression", "StreamDecompressor", "flush_into"),
+    ("Network.codecs", "MessageCodecs", "encode"),
+    ("Network.codecs", "MessageCodecs", "decode"),
+    ("Network.session", "SessionStream", "frame"),
+    ("Network.file_transfer", "FileSender", "send"),
+)
+
+
+class Profiler:
+    """
+    cProfile, tracemalloc and stage timers around the hot paths of a node, written to disk on demand.
+
+    Attributes:
+        _directory (str): The directory the reports are written to.
+        _cprofile (bool): Whether the thread entry points run under cProfile.
+        _tracemalloc (bool): Whether allocations are traced.
+        _timers (bool): Whether the stages are timed.
+        _top (int): The number of functions and allocation sites listed in the reports.
+        _profiles (list[cProfile.Profile]): The profiles of every thread entry point run so far.
+        _stages (dict[str, list[int]]): The calls, total and longest nanoseconds of every stage.
+        _lock (threading.Lock): Guards `_profiles`, `_stages` and the writing of the reports.
+        _originals (list[tuple[type, str, Callable]]): The methods replaced by `install`.
+
+    Methods:
+        from_env() -> Profiler | None: The profiler the environment asks for, if any.
+        from_dict(options: dict) -> Profiler: A profiler from the "profile" object of a node's JSON file.
+        install() -> None: Wraps the hot paths and registers the exit and signal handlers.
+        uninstall() -> None: Restores the original methods.
+        dump() -> list[str]: Writes the reports.
+    """
+    def __init__(self, directory: str = "profiles", cprofile: bool = True, tracemalloc: bool = True,
+                 timers: bool = True, top: int = 25) -> None:
+        """
+        Initialize the Profiler object.
+
+        Args:
+            directory (str, optional): The directory the reports are written to, created on
+                                       the first report. Default is "profiles".
+            cprofile (bool, optional): Run the thread entry points under cProfile. Default is True.
+            tracemalloc (bool, optional): Trace allocations. Default is True.
+            timers (bool, optional): Time the thread and codec entry points. Default is True.
+            top (int, optional): The number of functions and allocation sites listed. Default is 25.
+        """
+        self._directory: str = directory
+        self._cprofile: bool = cprofile
+        self._tracemalloc: bool = tracemalloc
+        self._timers: bool = timers
+        self._top: int = top
+        self._profiles: list[cProfile.Profile] = []
+        self._stages: dict[str, list[int]] = {}
+        self._lock: threading.Lock = threading.Lock()
+        self._originals: list[tuple[type, str, Callable]] = []
+
+    @classmethod
+    def from_env(cls) -> "Profiler | None":
+        """
+        Create the profiler asked for by the `PREDICTOR_PROFILE` environment variable.
+
+        Returns:
+            Profiler | None: A profiler with every instrument writing to the directory the
+                             variable names, or None if it is unset or empty.
+        """
+        directory: str = os.environ.get(ENVIRONMENT, "")
+        return cls(directory) if directory else None
+
+    @classmethod
+    def from_dict(cls, options: dict[str, Any]) -> "Profiler":
+        """
+        Create a profiler from the "profile" object of a node's JSON file.
+
+        Args:
+            options (dict): Any of "directory", "cprofile", "tracemalloc", "timers" and "top".
+
+        Returns:
+            Profiler: The profiler, with the defaults of the constructor for missing keys.
+
+        Raises:
+            ValueError: If a key is unknown or a value has the wrong type.
+        """
+        types: dict[str, type] = {"directory": str, "cprofile": bool, "tracemalloc": bool,
+                                  "timers": bool, "top": int}
+        for key, value in options.items():
+            if key not in types:
+                raise ValueError(f"Unknown profile option '{key}'")
+            if not isinstance(value, types[key]) or (types[key] is int and isinstance(value, bool)):
+                raise ValueError(f"Profile option '{key}' must be of type {types[key].__name__}")
+        return cls(**options)
+
+    def install(self) -> None:
+        """
+        Wrap the hot paths, start tracing allocations, and register the report handlers.
+
+        The reports are written at exit, and on `SIGUSR1` where the platform has it and
+        this is the main thread. Installing twice has no further effect.
+        """
+        if self._originals:
+            return
+        if self._cprofile or self._timers:
+            for module, owner, name in THREAD_ENTRY_POINTS:
+                self.__wrap(module, owner, name, self.__thread_entry)
+        if self._timers:
+            for module, owner, name in STAGES:
+                self.__wrap(module, owner, name, self.__stage)
+        if self._tracemalloc and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        atexit.register(self.dump)
+        if hasattr(signal, "SIGUSR1") and threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGUSR1, lambda signum, frame: threading.Thread(target=self.dump, daemon=True).start())
+        print(f"Profiling into {self._directory}")
+
+    def uninstall(self) -> None:
+        """
+        Restore the original methods and stop writing reports at exit.
+        """
+        for owner, name, original in reversed(self._originals):
+            setattr(owner, name, original)
+        self._originals.clear()
+        atexit.unregister(self.dump)
+
+    def __wrap(self, module: str, owner: str, name: str,
+               wrapper: Callable[[str, Callable], Callable]) -> None:
+        """
+        Replace a method on its class with a wrapper of it.
+
+        Args:
+            module (str): The module defining the class, imported only now.
+            owner (str): The class.
+            name (str): The method.
+            wrapper (Callable): Builds the replacement from the stage name and the method.
+        """
+        cls: type = getattr(importlib.import_module(module), owner)
+        original: Callable = cls.__dict__[name]
+        self._originals.append((cls, name, original))
+        setattr(cls, name, wrapper(f"{owner}.{name.lstrip('_').replace(owner + '__', '')}", original))
+
+    def __thread_entry(self, stage: str, method: Callable) -> Callable:
+        """
+        Build the replacement of a thread entry point, profiling and timing every call.
+        """
+        @functools.wraps(method)
+        def profiled(*args, **kwargs):
+            profile: cProfile.Profile | None = None
+            if self._cprofile:
+                profile = cProfile.Profile()
+                with self._lock:
+                    self._profiles.append(profile)
+                profile.enable()
+            start: int = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                if profile is not None:
+                    profile.disable()
+                if self._timers:
+                    self.__record(stage, perf_counter_ns() - start)
+        return profiled
+
+    def __stage(self, stage: str, method: Callable) -> Callable:
+        """
+        Build the replacement of a codec entry point, timing every call.
+        """
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            start: int = perf_counter_ns()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.__record(stage, perf_counter_ns() - start)
+        return timed
+
+    def __record(self, stage: str, elapsed_ns: int) -> None:
+        """
+        Add a call of a stage to its timer.
+        """
+        with self._lock:
+            timer: list[int] | None = self._stages.get(stage)
+            if timer is None:
+                self._stages[stage] = [1, elapsed_ns, elapsed_ns]
+            else:
+                timer[0] += 1
+                timer[1] += elapsed_ns
+                if elapsed_ns > timer[2]:
+                    timer[2] = elapsed_ns
+
+    def dump(self) -> list[str]:
+        """
+        Write the reports of the enabled instruments, replacing the previous ones.
+
+        Returns:
+            list[str]: The paths written.
+
+        Profiles still running are read without stopping them, so a report can be
+        taken from a live node.
+        """
+        with self._lock:
+            os.makedirs(self._directory, exist_ok=True)
+            prefix: str = os.path.join(self._directory, "")
+            pid: int = os.getpid()
+            written: list[str] = []
+            if self._profiles:
+                written += self.__dump_profiles(f"{prefix}profile-{pid}")
+            if tracemalloc.is_tracing():
+                written.append(self.__dump_allocations(f"{prefix}allocations-{pid}.txt"))
+            if self._stages:
+                written.append(self.__dump_stages(f"{prefix}stages-{pid}.txt"))
+        return written
+
+    def __dump_profiles(self, base: str) -> list[str]:
+        """
+        Merge the profiles of every thread and write them as `pstats` data and as a text report.
+        """
+        merged: pstats.Stats | None = None
+        for profile in self._profiles:
+            # `snapshot_stats` reads a profile without disabling it, unlike `create_stats`.
+            profile.snapshot_stats()
+            if not profile.stats:
+                continue
+            with open(base + ".pstats", "wb") as file:
+                marshal.dump(profile.stats, file)
+            if merged is None:
+                merged = pstats.Stats(base + ".pstats")
+            else:
+                merged.add(base + ".pstats")
+        if merged is None:
+            return []
+        merged.dump_stats(base + ".pstats")
+        with open(base + ".txt", "w") as report:
+            merged.stream = report
+            merged.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self._top)
+        return [base + ".pstats", base + ".txt"]
+
+    def __dump_allocations(self, path: str) -> str:
+        """
+        Write the source lines holding the most traced memory.
+        """
+        snapshot: tracemalloc.Snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        statistics: list[tracemalloc.Statistic] = snapshot.statistics("lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        with open(path, "w") as report:
+            report.write(f"Traced memory: {current} bytes, peak {peak} bytes\n")
+            report.write(f"Top {self._top} of {len(statistics)} allocation sites:\n")
+            for statistic in statistics[:self._top]:
+                report.write(f"{statistic}\n")
+        return path
+
+    def __dump_stages(self, path: str) -> str:
+        """
+        Write the calls and wall-clock time of every stage, the longest total first.
+        """
+        with open(path, "w") as report:
+            report.write(f"{'stage':<36} {'calls':>10} {'total ms':>12} {'mean us':>10} {'max us':>10}\n")
+            for stage, (calls, total, longest) in sorted(self._stages.items(), key=lambda item: -item[1][1]):
+                report.write(f"{stage:<36} {calls:>10} {total / 1e6:>12.3f} {total / calls / 1e3:>10.2f} "
+                             f"{longest / 1e3:>10.2f}\n")
+        return path
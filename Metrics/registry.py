@@ -0,0 +1,380 @@
+from typing import Any
+
+from Interfaces import Observable, Observer
+
+class Counter:
+    """
+    A count that only goes up, such as the number of messages or bytes handled.
+
+    Attributes:
+        value (int | float): The current count.
+
+    Methods:
+        inc(amount: int | float = 1) -> None: Adds to the count.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        """
+        Initialize the Counter at zero.
+        """
+        self.value: int | float = 0
+
+    def inc(self, amount: int | float = 1) -> None:
+        """
+        Add to the count.
+
+        Args:
+            amount (int | float, optional): The amount to add. Default is 1.
+        """
+        self.value += amount
+
+
+class Gauge:
+    """
+    A value that goes up and down, such as the depth of a queue.
+
+    Attributes:
+        value (int | float): The last value set.
+
+    Methods:
+        set(value: int | float) -> None: Replaces the value.
+    """
+    __slots__ = ("value",)
+
+    def __init__(self) -> None:
+        """
+        Initialize the Gauge at zero.
+        """
+        self.value: int | float = 0
+
+    def set(self, value: int | float) -> None:
+        """
+        Replace the value of the gauge.
+
+        Args:
+            value (int | float): The new value.
+        """
+        self.value = value
+
+
+class Histogram:
+    """
+    A distribution of non-negative integer observations, such as latencies in nanoseconds.
+
+    Observations are counted in power-of-two buckets: bucket `i` holds the values whose
+    bit length is `i`, that is the values up to `2**i - 1`. Recording an observation is
+    an index computation and two additions, so histograms can stay on in production,
+    at the price of percentiles that are only known to within a factor of two.
+
+    Attributes:
+        BUCKETS (int): The number of buckets, enough for any 64-bit value.
+        count (int): The number of observations.
+        total (int): The sum of all observations.
+        minimum (int | None): The smallest observation, None until the first one.
+        maximum (int): The largest observation.
+        _buckets (list[int]): The number of observations in every bucket.
+
+    Methods:
+        observe(value: int) -> None: Records one observation.
+        percentile(fraction: float) -> int: The upper bound of the bucket holding a percentile.
+        buckets() -> list[tuple[int, int]]: The cumulative count up to every bucket bound.
+        snapshot() -> dict: A summary of the distribution.
+    """
+    BUCKETS = 65
+
+    def __init__(self) -> None:
+        """
+        Initialize the Histogram with no observations.
+        """
+        self.count: int = 0
+        self.total: int = 0
+        self.minimum: int | None = None
+        self.maximum: int = 0
+        self._buckets: list[int] = [0] * Histogram.BUCKETS
+
+    def observe(self, value: int) -> None:
+        """
+        Record one observation.
+
+        Args:
+            value (int): The observed value. Negative values are counted as zero.
+        """
+        value = max(int(value), 0)
+        self._buckets[min(value.bit_length(), Histogram.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += value
+        if self.minimum is None or value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    def percentile(self, fraction: float) -> int:
+        """
+        Estimate a percentile of the observations.
+
+        Args:
+            fraction (float): The percentile as a fraction, e.g. 0.99.
+
+        Returns:
+            int: The upper bound of the bucket holding the percentile, capped at the
+                 largest observation, or 0 without observations.
+        """
+        rank: float = fraction * self.count
+        seen: int = 0
+        for bucket, count in enumerate(self._buckets):
+            seen += count
+            if count and seen >= rank:
+                return min((1 << bucket) - 1, self.maximum)
+        return 0
+
+    def buckets(self) -> list[tuple[int, int]]:
+        """
+        Get the cumulative number of observations up to every bucket bound.
+
+        Returns:
+            list: `(upper bound, cumulative count)` pairs up to the last non-empty bucket.
+        """
+        result: list[tuple[int, int]] = []
+        seen: int = 0
+        last: int = max((i for i, count in enumerate(self._buckets) if count), default=-1)
+        for bucket in range(last + 1):
+            seen += self._buckets[bucket]
+            result.append(((1 << bucket) - 1, seen))
+        return result
+
+    def snapshot(self) -> dict:
+        """
+        Summarize the distribution.
+
+        Returns:
+            dict: The count, sum, minimum, maximum, mean and the 50th, 90th and 99th percentiles.
+        """
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "min": self.minimum or 0,
+            "max": self.maximum,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.50),
+            "p90": self.percentile(0.90),
+            "p99": self.percentile(0.99),
+        }
+
+
+class MetricsRegistry(Observable):
+    """
+    Concrete implementation of the Observable class collecting the metrics of a node.
+
+    Codecs and network components are handed a registry and keep references to the
+    counters, gauges and histograms they update, which are created on first use by
+    name. Every message they handle is also published as an event, a dict starting
+    with its "source", to the attached observers. When no observer is attached no
+    event is built, so the cost of a message is a few additions.
+
+    Updates are not locked: concurrent updates from several threads may, rarely,
+    lose an increment, which is accepted for monitoring data.
+
+    Attributes:
+        _counters (dict[str, Counter]): The counters, by name.
+        _gauges (dict[str, Gauge]): The gauges, by name.
+        _histograms (dict[str, Histogram]): The histograms, by name.
+        _codecs (set[str]): The sources that recorded codec metrics.
+        _observers (list[Observer]): The observers notified of every published event.
+
+    Methods:
+        attach(observer: Observer) -> None: Attaches an observer to the registry.
+        detach(observer: Observer) -> None: Detaches an observer from the registry.
+        _notify(event: dict) -> None: Passes an event to every attached observer.
+        counter(name: str) -> Counter: The counter with a name.
+        gauge(name: str) -> Gauge: The gauge with a name.
+        histogram(name: str) -> Histogram: The histogram with a name.
+        observed -> bool: Whether any observer is attached.
+        publish(source: str, **values: Any) -> None: Passes an event to the observers, if any.
+        record_codec(source: str, raw_bytes: int, coded_bytes: int, hits: int, elapsed_ns: int, raw: bool) -> None:
+            Records one compressed or decompressed message.
+        snapshot() -> dict: The current value of every metric.
+        export() -> str: Every metric in the Prometheus text exposition format.
+    """
+    def __init__(self) -> None:
+        """
+        Initialize the MetricsRegistry with no metrics and no observers.
+        """
+        self._counters: dict[str, Counter] = {}
+        self._gauges: dict[str, Gauge] = {}
+        self._histograms: dict[str, Histogram] = {}
+        self._codecs: set[str] = set()
+        self._observers: list[Observer] = []
+
+    def attach(self, observer: Observer) -> None:
+        """
+        Attach an observer to the registry.
+
+        Args:
+            observer (Observer): The observer instance to attach. Its `update` method
+                                 receives every published event.
+        """
+        self._observers.append(observer)
+
+    def detach(self, observer: Observer) -> None:
+        """
+        Detach an observer from the registry.
+
+        Args:
+            observer (Observer): The observer instance to remove.
+
+        Raises:
+            ValueError: If the observer is not attached.
+        """
+        self._observers.remove(observer)
+
+    def _notify(self, event: dict) -> None:
+        """
+        Pass an event to every attached observer.
+
+        Args:
+            event (dict): The event to pass to the observers' `update` method.
+        """
+        for observer in self._observers:
+            observer.update(event)
+
+    def counter(self, name: str) -> Counter:
+        """
+        Get the counter with a name, creating it on first use.
+
+        Args:
+            name (str): The dotted name of the counter, e.g. "client.messages".
+
+        Returns:
+            Counter: The counter.
+        """
+        metric: Counter | None = self._counters.get(name)
+        if metric is None:
+            metric = self._counters[name] = Counter()
+        return metric
+
+    def gauge(self, name: str) -> Gauge:
+        """
+        Get the gauge with a name, creating it on first use.
+
+        Args:
+            name (str): The dotted name of the gauge.
+
+        Returns:
+            Gauge: The gauge.
+        """
+        metric: Gauge | None = self._gauges.get(name)
+        if metric is None:
+            metric = self._gauges[name] = Gauge()
+        return metric
+
+    def histogram(self, name: str) -> Histogram:
+        """
+        Get the histogram with a name, creating it on first use.
+
+        Args:
+            name (str): The dotted name of the histogram.
+
+        Returns:
+            Histogram: The histogram.
+        """
+        metric: Histogram | None = self._histograms.get(name)
+        if metric is None:
+            metric = self._histograms[name] = Histogram()
+        return metric
+
+    @property
+    def observed(self) -> bool:
+        """
+        Tell whether any observer is attached, i.e. whether events are worth building.
+
+        Returns:
+            bool: True if at least one observer is attached.
+        """
+        return bool(self._observers)
+
+    def publish(self, source: str, **values: Any) -> None:
+        """
+        Pass an event to the attached observers. Does nothing without observers.
+
+        Args:
+            source (str): The component the event comes from, e.g. "client".
+            **values (Any): The measurements of the event.
+        """
+        if self._observers:
+            self._notify({"source": source, **values})
+
+    def record_codec(self, source: str, raw_bytes: int, coded_bytes: int,
+                     hits: int, elapsed_ns: int, raw: bool = False) -> None:
+        """
+        Record one message handled by a codec and publish it as an event.
+
+        Args:
+            source (str): The codec, e.g. "compression".
+            raw_bytes (int): The uncompressed length of the message.
+            coded_bytes (int): The compressed length of the message.
+            hits (int): The number of bytes the guess table predicted correctly.
+            elapsed_ns (int): The time spent in the codec, in nanoseconds.
+            raw (bool, optional): Whether the message was sent uncompressed. Default is False.
+
+        Updates the "<source>.messages", "<source>.raw_messages", "<source>.raw_bytes",
+        "<source>.coded_bytes" and "<source>.hits" counters and the "<source>.codec_ns"
+        histogram.
+        """
+        self._codecs.add(source)
+        self.counter(source + ".messages").inc()
+        self.counter(source + ".raw_messages").inc(raw)
+        self.counter(source + ".raw_bytes").inc(raw_bytes)
+        self.counter(source + ".coded_bytes").inc(coded_bytes)
+        self.counter(source + ".hits").inc(hits)
+        self.histogram(source + ".codec_ns").observe(elapsed_ns)
+        if self._observers:
+            self._notify({"source": source, "raw_bytes": raw_bytes, "coded_bytes": coded_bytes,
+                          "ratio": coded_bytes / raw_bytes if raw_bytes else 1.0,
+                          "hit_rate": hits / raw_bytes if raw_bytes else 0.0,
+                          "codec_ns": elapsed_ns, "raw": raw})
+
+    def snapshot(self) -> dict:
+        """
+        Get the current value of every metric.
+
+        Returns:
+            dict: The "counters" and "gauges" by name, the "histograms" by name as
+                  `Histogram.snapshot` summaries, and for every codec the overall
+                  "ratio" and "hit_rate" under "codecs".
+        """
+        codecs: dict[str, dict] = {}
+        for source in sorted(self._codecs):
+            raw: int = self._counters[source + ".raw_bytes"].value
+            codecs[source] = {
+                "ratio": self._counters[source + ".coded_bytes"].value / raw if raw else 1.0,
+                "hit_rate": self._counters[source + ".hits"].value / raw if raw else 0.0,
+            }
+        return {
+            "counters": {name: metric.value for name, metric in sorted(self._counters.items())},
+            "gauges": {name: metric.value for name, metric in sorted(self._gauges.items())},
+            "histograms": {name: metric.snapshot() for name, metric in sorted(self._histograms.items())},
+            "codecs": codecs,
+        }
+
+    def export(self) -> str:
+        """
+        Format every metric in the Prometheus text exposition format.
+
+        Returns:
+            str: One block per metric, with the dots of the names replaced by underscores.
+        """
+        lines: list[str] = []
+        for name, counter in sorted(self._counters.items()):
+            name = name.replace(".", "_")
+            lines += [f"# TYPE {name} counter", f"{name} {counter.value}"]
+        for name, gauge in sorted(self._gauges.items()):
+            name = name.replace(".", "_")
+            lines += [f"# TYPE {name} gauge", f"{name} {gauge.value}"]
+        for name, histogram in sorted(self._histograms.items()):
+            name = name.replace(".", "_")
+            lines.append(f"# TYPE {name} histogram")
+            lines += [f'{name}_bucket{{le="{bound}"}} {count}' for bound, count in histogram.buckets()]
+            lines += [f'{name}_bucket{{le="+Inf"}} {histogram.count}',
+                      f"{name}_sum {histogram.total}", f"{name}_count {histogram.count}"]
+        return "\n".join(lines) + "\n"
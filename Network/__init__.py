@@ -6,6 +6,18 @@ It imports and exposes the following classes:
 - Server: A class representing the server in the chat application.
 - Connection: A class used for managing the state of the connection between client and server.
 - NetworkComponent: An abstract base class for network components in the chat application.
+- AsyncClient: An asyncio implementation of the client.
+- AsyncServer: An asyncio implementation of the server, serving many peer sessions on one event loop.
+- SelectorServer: A server multiplexing many clients on one thread with non-blocking sockets.
+- DecodePool: A pool of processes decompressing received messages, in order per connection.
+- FrameReader: A class parsing the length-prefixed frames received from a socket.
+- FrameType: An enumeration of the frame types exchanged between nodes.
+- FileSender: A class streaming a file to a peer in pipelined, flow-controlled chunks.
+- FileReceiver: A class writing the files sent by a peer to disk, resuming interrupted transfers.
+- SocketOptions: A class holding the TCP options of a node's sockets.
+- MessageCodec: An abstract base class for the codecs messages are sent with, registered with `register_codec`.
+- MessageCodecs: A class holding the codecs of a session and choosing one per message.
+- SessionStream: A class compressing the messages of a session once for every connection sharing it.
 
 This module sets up the public API for network-related functionalities.
 
@@ -18,5 +30,16 @@ from .client import Client
 from .server import Server
 from .connection import Connection
 from .network_component import NetworkComponent
+from .async_client import AsyncClient
+from .async_server import AsyncServer
+from .selector_server import SelectorServer
+from .decode_pool import DecodePool
+from .framing import FrameReader, FrameType
+from .file_transfer import FileSender, FileReceiver
+from .socket_options import SocketOptions
+from .codecs import MessageCodec, MessageCodecs, register_codec
+from .session import SessionStream
 
-__all__ = ['Client', 'Server', 'Connection', 'NetworkComponent']
+__all__ = ['Client', 'Server', 'Connection', 'NetworkComponent', 'AsyncClient', 'AsyncServer',
+           'SelectorServer', 'DecodePool', 'FrameReader', 'FrameType', 'FileSender', 'FileReceiver',
+           'SocketOptions', 'MessageCodec', 'MessageCodecs', 'register_codec', 'SessionStream']
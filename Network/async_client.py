@@ -0,0 +1,179 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from socket import socket, AF_INET, SOCK_STREAM
+
+from PayloadCompression import StreamCompressor
+from .network_component import NetworkComponent, Connection
+from .framing import FRAME_HEADER_MAX, FrameType, prepend_frame_header
+from .session import Backoff
+
+class AsyncClient(NetworkComponent):
+    """
+    asyncio implementation of the client side of a node.
+
+    The client connects with a non-blocking connect on the event loop and sends
+    message frames through an asyncio stream. As with `Client`, the first connection 
+    attempt is made right away, and failed attempts are retried with exponential backoff, 
+    each bounded by `connect_timeout`. Unlike `Client`, the messages are not sent in a 
+    session (see `session`): a lost connection is not reopened, and ends the chat. Compression can optionally be
+    offloaded to a thread pool; a lock keeps packets in stream order when several
+    tasks send concurrently. The work submitted is bound to the compressor of the
+    connection, which cannot be pickled, so a process pool cannot take it.
+
+    Attributes:
+        _peer_host (str): The host address of the peer server.
+        _peer_port (int): The port number of the peer server.
+        _retries (int): The maximum number of connection attempts.
+        _delay (float): The backoff step after the first failed attempt, doubled for every further one.
+        _max_delay (float): The largest backoff step.
+        _connect_timeout (float): The time a single connection attempt may take.
+        _executor (ThreadPoolExecutor | None): Thread pool compression is offloaded to, None to compress inline.
+        _compressor (StreamCompressor): Compressor of the current connection.
+        _writer (asyncio.StreamWriter): The stream to the peer, set once connected.
+        _send_lock (asyncio.Lock): Serializes compression and writes of concurrent senders.
+
+    Methods:
+        start() -> None: Connects to the peer server with backoff.
+        send_message(msg: str) -> None: Compresses and sends a message.
+        handler() -> None: Sends the lines typed by the user until 'exit'.
+        close() -> None: Closes the connection.
+    """
+    UTF8 = "utf-8"
+
+    def __init__(self, peer_host: str, peer_port: int,
+                       conn: Connection, retries: int = 12,
+                       delay: float = 0.05, executor: ThreadPoolExecutor | None = None,
+                       max_delay: float = 3.0, connect_timeout: float = 5.0) -> None:
+        """
+        Initialize the AsyncClient object.
+
+        Args:
+            peer_host (str): The peer server's host address.
+            peer_port (int): The peer server's port number.
+            conn (Connection): The shared connection object.
+            retries (int, optional): The number of connection attempts. Default is 12.
+            delay (float, optional): The backoff step in seconds after the first failed attempt,
+                                     doubled for every further one. Default is 50 ms.
+            executor (ThreadPoolExecutor | None, optional): Thread pool to compress in. Default is inline.
+            max_delay (float, optional): The largest backoff step in seconds. Default is 3.0.
+            connect_timeout (float, optional): Seconds a connection attempt may take. Default is 5.0.
+        """
+        self._peer_host: str = peer_host
+        self._peer_port: int = peer_port
+        self._retries: int = retries
+        self._delay: float = delay
+        self._max_delay: float = max_delay
+        self._connect_timeout: float = connect_timeout
+        self._executor: ThreadPoolExecutor | None = executor
+        self._compressor: StreamCompressor = StreamCompressor(adaptive=True)
+        self._writer: asyncio.StreamWriter = None
+        self._send_lock: asyncio.Lock = asyncio.Lock()
+        super().__init__(None, None, conn)
+
+    async def start(self) -> None:
+        """
+        Connect to the peer server, retrying with backoff.
+
+        The first attempt is made immediately. Refused, failed and timed out attempts 
+        are retried on a new socket after the next backoff delay until `retries` 
+        attempts were made.
+
+        Raises:
+            ConnectionAbortedError: If the connection cannot be established after all retries.
+        """
+        loop = asyncio.get_running_loop()
+        for _, pause in zip(range(self._retries), Backoff(self._delay, self._max_delay)):
+            await asyncio.sleep(pause)
+            if self._socket is None:
+                self._socket = socket(AF_INET, SOCK_STREAM)
+            self._socket.setblocking(False)
+            try:
+                await asyncio.wait_for(loop.sock_connect(self._socket, (self._peer_host, self._peer_port)),
+                                       self._connect_timeout)
+                break
+            except (OSError, asyncio.TimeoutError):
+                self._socket.close()
+                self._socket = None
+        else:
+            print(f"Peer server's not running. Terminating process.")
+            raise ConnectionAbortedError
+
+        _, self._writer = await asyncio.open_connection(sock=self._socket)
+        self._compressor = StreamCompressor(adaptive=True)
+        print(f"Connected to {self._peer_host}:{self._peer_port}")
+
+    def __build_frame(self, payload: bytes) -> memoryview:
+        """
+        Compress a payload as one packet and return it framed as a message, or as a raw
+        message if it did not compress.
+
+        A fresh buffer is used for every frame because the transport may keep a
+        reference to it until the data has been sent.
+        """
+        self._compressor.feed(payload)
+        buffer: bytearray = bytearray(FRAME_HEADER_MAX + self._compressor.max_packet_size(len(payload)))
+        view: memoryview = memoryview(buffer)
+        length: int = self._compressor.flush_into(view[FRAME_HEADER_MAX:])
+        frame_type: FrameType = FrameType.RAW_MESSAGE if self._compressor.last_packet_raw else FrameType.MESSAGE
+        start: int = prepend_frame_header(view, FRAME_HEADER_MAX, frame_type, length)
+        return view[start:FRAME_HEADER_MAX + length]
+
+    async def send_message(self, msg: str) -> None:
+        """
+        Compress and send a message to the peer server.
+
+        Args:
+            msg (str): The message to be sent.
+
+        Raises:
+            ConnectionError: If the connection is not active.
+            ValueError: If the message is empty.
+        """
+        if not self._conn.state or self._writer is None:
+            raise ConnectionError
+
+        payload: bytes = msg.encode(AsyncClient.UTF8)
+        if not payload:
+            raise ValueError("Empty string passed to compressor")
+
+        async with self._send_lock:
+            if self._executor is None:
+                frame: memoryview = self.__build_frame(payload)
+            else:
+                frame = await asyncio.get_running_loop().run_in_executor(self._executor, self.__build_frame, payload)
+            self._writer.write(frame)
+            await self._writer.drain()
+
+    async def handler(self) -> None:
+        """
+        Send the lines typed by the user to the peer server until 'exit' is typed.
+
+        Console input is read in the loop's default executor so the event loop keeps
+        serving the other sessions meanwhile.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            message: str = await loop.run_in_executor(None, input, "")
+            try:
+                if message.lower() == 'exit':
+                    print("Exiting chat...")
+                    await self.send_message('exit')
+                    self._conn.update_state()
+                    break
+                await self.send_message(message)
+            except ValueError as e:
+                print(str(e))
+            except ConnectionError:
+                break
+
+    def close(self) -> None:
+        """
+        Close the connection to the peer server.
+        """
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._socket = None
+        elif self._socket is not None:
+            self._socket.close()
+            self._socket = None
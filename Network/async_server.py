@@ -0,0 +1,249 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from socket import SOL_SOCKET, SO_REUSEADDR
+
+from PayloadCompression import StreamDecompressor
+from PayloadCompression.Dictionary import get_dictionary
+from .network_component import NetworkComponent, Connection
+from .framing import FrameReader, FrameType
+from .codecs import MessageCodecs, negotiate
+from .session import decode_hello, encode_welcome
+
+class AsyncSession:
+    """
+    Session state of a connection to the `AsyncServer`.
+
+    Attributes:
+        session_id (bytes | None): The id of the session the client introduced, if any.
+        codecs (MessageCodecs | None): The codecs of the session.
+        primed (bool): Whether the Predictor of the session is primed with a dictionary.
+        received (int): The number of messages of the session processed.
+    """
+    def __init__(self) -> None:
+        self.session_id: bytes | None = None
+        self.codecs: MessageCodecs | None = None
+        self.primed: bool = False
+        self.received: int = 0
+
+
+class AsyncServer(NetworkComponent):
+    """
+    asyncio implementation of the server side of a node.
+
+    All peer sessions are served by one event loop through asyncio streams, each
+    with its own stream decompressor and frame reader, so one process can hold
+    thousands of concurrent sessions. Decompression can optionally be offloaded
+    to a thread pool; every session still decodes its frames strictly in order.
+    The work submitted is bound to the decompressor of its session, which cannot be
+    pickled, so a process pool cannot take it (see `DecodePool` for decoding on
+    worker processes).
+
+    A threaded `Client` opens a session with `SESSION_HELLO` (see `session`), which is
+    answered with the codecs both ends support; its messages then arrive as
+    `CODED_MESSAGE` frames. Sessions are not kept after their connection closes, so a
+    reconnecting client starts a new one.
+
+    Attributes:
+        _executor (ThreadPoolExecutor | None): Thread pool decompression is offloaded to, None to decompress inline.
+        _backlog (int): The listen backlog of the server socket.
+        _close_on_exit (bool): Whether an 'exit' message toggles the shared connection state.
+        _server (asyncio.Server): The asyncio server, set once started.
+        _sessions (dict[asyncio.StreamWriter, asyncio.Task]): The writers of the open sessions and
+                                                              the tasks serving them.
+
+    Methods:
+        start() -> None: Binds the server socket and serves sessions until closed.
+        __open_session(session: AsyncSession, payload: memoryview) -> bytearray: Answers a session hello.
+        handler(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None: Serves one session.
+        close() -> None: Stops the server and closes every session.
+        wait_closed() -> None: Waits until the sessions closed by `close` have ended.
+    """
+    UTF8 = "utf-8"
+
+    def __init__(self, host: str, port: int, conn: Connection,
+                       executor: ThreadPoolExecutor | None = None, backlog: int = 1024,
+                       close_on_exit: bool = False) -> None:
+        """
+        Initialize the AsyncServer object.
+
+        Args:
+            host (str): The host address on which the server listens for connections.
+            port (int): The port number on which the server listens for connections.
+            conn (Connection): The shared connection object for maintaining the connection state.
+            executor (ThreadPoolExecutor | None, optional): Thread pool to decompress in. Default is inline.
+            backlog (int, optional): The listen backlog. Default is 1024.
+            close_on_exit (bool, optional): Toggle the shared connection state when a peer sends
+                                            'exit', as the threaded Server does. Default is False,
+                                            which only ends that peer's session.
+        """
+        super().__init__(host, port, conn)
+        self._socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self._executor: ThreadPoolExecutor | None = executor
+        self._backlog: int = backlog
+        self._close_on_exit: bool = close_on_exit
+        self._server: asyncio.Server = None
+        self._sessions: dict[asyncio.StreamWriter, asyncio.Task] = {}
+
+    @property
+    def sessions(self) -> int:
+        """
+        Get the number of open sessions.
+
+        Returns:
+            int: The number of connected peers.
+        """
+        return len(self._sessions)
+
+    async def start(self) -> None:
+        """
+        Bind the server socket and serve peer sessions until the server is closed.
+
+        Raises:
+            OSError: If the socket cannot be bound.
+        """
+        self._socket.bind(('0.0.0.0', self._port))
+        self._socket.listen(self._backlog)
+        self._socket.setblocking(False)
+        self._server = await asyncio.start_server(self.handler, sock=self._socket)
+        print(f"Server listening on {self._host}:{self._port}")
+
+        try:
+            await self._server.serve_forever()
+        except asyncio.CancelledError:
+            pass
+
+    def __open_session(self, session: AsyncSession, payload: memoryview) -> bytearray:
+        """
+        Start the session a client identified itself with, or acknowledge it if it is already open.
+
+        Args:
+            session (AsyncSession): The session state of the connection.
+            payload (memoryview): The `SESSION_HELLO` payload.
+
+        Returns:
+            bytearray: The `SESSION_WELCOME` frame to answer with.
+
+        Raises:
+            ValueError: If the payload is truncated.
+        """
+        session_id, offered, dictionary = decode_hello(payload)
+        resumed: bool = session_id == session.session_id
+        if not resumed:
+            if dictionary is not None:
+                try:
+                    get_dictionary(dictionary)
+                except ValueError as e:
+                    print(f"{e}, the session is not primed")
+                    dictionary = None
+            session.session_id = session_id
+            session.codecs = MessageCodecs(negotiate(offered), None, dictionary)
+            session.primed = dictionary is not None
+            session.received = 0
+        return encode_welcome(resumed, session.received, session.codecs.negotiated, session.primed)
+
+    async def __decompress_data(self, decompressor: StreamDecompressor, codecs: MessageCodecs | None,
+                                frame_type: int, payload: memoryview) -> str:
+        """
+        Decompress the payload of a message frame into a string.
+
+        Args:
+            decompressor (StreamDecompressor): The decompressor of a peer without a session.
+            codecs (MessageCodecs | None): The codecs of the session, if the peer opened one.
+            frame_type (int): `FrameType.CODED_MESSAGE`, or `FrameType.MESSAGE`, or
+                              `FrameType.RAW_MESSAGE` for a raw packet.
+            payload (memoryview): The compressed packet.
+
+        Returns:
+            str: The decompressed message.
+
+        Raises:
+            ValueError: If the codec was not negotiated or the payload is corrupt.
+        """
+        def decompress() -> str:
+            if frame_type == FrameType.CODED_MESSAGE:
+                if codecs is None or not payload:
+                    raise ValueError("Coded message outside of a session")
+                return str(codecs.decode(payload[0], payload[1:]), AsyncServer.UTF8)
+            if frame_type == FrameType.RAW_MESSAGE:
+                decompressor.feed_raw(payload)
+            else:
+                decompressor.feed(payload)
+            return decompressor.flush().decode(AsyncServer.UTF8)
+
+        if self._executor is None:
+            return decompress()
+        return await asyncio.get_running_loop().run_in_executor(self._executor, decompress)
+
+    async def handler(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """
+        Serve one peer session: receive frames, decompress and display the messages.
+
+        Args:
+            reader (asyncio.StreamReader): The stream the peer's frames arrive on.
+            writer (asyncio.StreamWriter): The stream back to the peer.
+
+        The session ends when the peer disconnects or sends an 'exit' message. Answers to
+        a session hello are drained before the next frame is handled, so a client that
+        does not read them is held back by flow control.
+        """
+        print(f"{writer.get_extra_info('peername')} connected")
+        self._sessions[writer] = asyncio.current_task()
+        decompressor: StreamDecompressor = StreamDecompressor()
+        session: AsyncSession = AsyncSession()
+        frames: FrameReader = FrameReader(capacity=4096)
+        try:
+            while True:
+                data: bytes = await reader.read(64 * 1024)
+                if not data:
+                    if not writer.is_closing():
+                        # Otherwise `close()` ended the session.
+                        print("Peer has disconnected.")
+                    return
+
+                frames.feed(data)
+                for frame_type, payload in frames.frames():
+                    if frame_type == FrameType.SESSION_HELLO:
+                        writer.write(self.__open_session(session, payload))
+                        await writer.drain()
+                        continue
+                    if frame_type not in (FrameType.CODED_MESSAGE, FrameType.MESSAGE, FrameType.RAW_MESSAGE):
+                        continue
+
+                    message: str = await self.__decompress_data(decompressor, session.codecs, frame_type, payload)
+                    session.received += 1
+                    print(f"Received message: {message}")
+
+                    if message == 'exit':
+                        print("Peer requested disconnection.")
+                        if self._close_on_exit and self._conn.state:
+                            self._conn.update_state()
+                            print("Press Enter to exit")
+                        return
+        except (ConnectionError, ValueError) as e:
+            print(f"Error handling client: {e}")
+        finally:
+            # Also runs when the task is cancelled at shutdown, which then propagates.
+            self._sessions.pop(writer, None)
+            writer.close()
+
+    def close(self) -> None:
+        """
+        Stop accepting sessions and close every open session and the server socket.
+        """
+        if self._server is not None:
+            self._server.close()
+            self._server = None
+        for writer in list(self._sessions):
+            writer.close()
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    async def wait_closed(self) -> None:
+        """
+        Wait until the sessions closed by `close` have ended.
+
+        Their handlers see the end of their streams and return, rather than being
+        cancelled when the event loop shuts down.
+        """
+        await asyncio.gather(*self._sessions.values(), return_exceptions=True)
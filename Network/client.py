@@ -1,7 +1,15 @@
 from .network_component import NetworkComponent, Connection
-from socket import error as sockerror, SHUT_RDWR
-from PayloadCompression import Compression
-from time import sleep
+from socket import socket, error as sockerror, SHUT_RDWR
+from queue import Empty, Full, Queue
+from threading import Thread, current_thread
+from errno import ENOTCONN
+from Metrics import MetricsRegistry
+from .framing import FrameReader, FrameType
+from .codecs import MessageCodecs
+from .file_transfer import FileSender
+from .session import Backoff, SessionStream, connect, decode_welcome
+from .socket_options import SocketOptions
+from time import monotonic, perf_counter_ns, sleep
 
 class Client(NetworkComponent):
     """
@@ -9,22 +17,77 @@ class Client(NetworkComponent):
     and handles the communication. It uses a retry mechanism for establishing 
     the connection and manages the message-sending process.
 
+    Messages are not sent by the thread that submits them. They are put on an outbound 
+    queue, and a sender thread compresses them in order and writes them to the socket. 
+    Frames queued within `coalesce_delay` of each other, up to `coalesce_bytes`, are 
+    written with a single `sendall`, so a burst of messages costs one system call.
+
+    The first connection attempt is made right away and failed attempts are retried 
+    with exponential backoff. A connection lost while sending is reopened by the sender 
+    thread in the same way and resumes the session (see `session`): the frames of the 
+    last `resume_buffer` bytes are kept, and only those the server did not process are 
+    sent again, so both ends keep their compression context.
+
+    Every message is written with the codec expected to deliver it soonest among those 
+    agreed on with the server (see `codecs`). With a `dictionary`, the Predictor of new 
+    sessions starts from its primed guess table if the server has loaded it too.
+
+    Several clients may share one `SessionStream`, so that a message compressed once 
+    is sent to several peers: `send` then takes the frame built by the stream, and the 
+    same bytes are queued to every client. A peer that cannot follow the shared stream, 
+    because it refused a codec or the priming, or joined after its first frames were 
+    dropped, is given a stream of its own instead.
+
     Attributes:
-        _compressor (Compression): Instance of the Compression class for message compression.
+        _stream (SessionStream): The session the messages are compressed in, keeping its state 
+                                 across messages and connections.
+        _group (SessionStream | None): The stream shared with other clients, if any.
+        _written (int): The number of frames of `_stream` the current connection carried.
+        _link_rate (float): The transmission rate in bytes per second the codec choice assumes.
+        _batch (bytearray): Reusable buffer the frames of one write are collected in.
+        _batch_messages (list[str]): The messages of the frames in `_batch`, kept for a shared stream
+                                     in case the peer has to be given a stream of its own.
+        _queue (Queue): The outbound messages, None asking the sender thread to stop.
+        _sender (Thread | None): The thread draining the queue, while connected.
+        _send_failed (bool): Whether the sender thread lost the connection.
+        _coalesce_delay (float): How long the sender waits for more messages to join a write.
+        _coalesce_bytes (int): The largest write the sender collects, 0 to write every frame on its own.
+        _socket_options (SocketOptions | None): The options set on the socket before connecting.
+        _resume_buffer (int): The bytes of recent frames kept by a stream of the client's own.
+        _closing (bool): Whether `close` was called, which stops reconnection attempts.
         _peer_host (str): The host address of the peer server.
         _peer_port (int): The port number of the peer server.
-        _retries (int): The maximum number of connection retry attempts.
-        _delay (float): The delay between each connection retry.
+        _retries (int): The maximum number of connection attempts.
+        _delay (float): The backoff step after the first failed attempt, doubled for every further one.
+        _max_delay (float): The largest backoff step.
+        _connect_timeout (float): The time a single connection attempt may take.
+        _metrics (MetricsRegistry | None): The registry the codec and every sent frame are recorded in, if any.
+        UTF8 (str): The encoding used to turn messages into bytes.
     
     Methods:
         start() -> None: Starts the client and attempts to connect to the peer server.
-        __send_message(msg: str) -> None: Compresses and sends a message to the server.
+        __connect() -> socket: Connects to the peer server with backoff.
+        __open_session(sock: socket) -> None: Opens or resumes the session on a new connection.
+        __reconnect() -> socket: Replaces a lost connection and resumes the session.
+        send(msg: str, framed: tuple[int, bytes] | None = None) -> None: Queues a message for the sender thread.
+        flush() -> None: Waits until every queued message has been sent.
+        __frame_message(item: str | tuple[str, int, bytes]) -> bool: Adds the frame of a message to the pending write.
+        __drain() -> None: Compresses and sends the queued messages, coalescing writes.
+        send_file(path: str) -> None: Streams a file to the server.
         handler() -> None: Handles user input and manages message sending in a loop.
         close() -> None: Closes the client connection and shuts down the socket.
     """
+    UTF8 = "utf-8"
+
     def __init__(self, peer_host: str, peer_port: int, 
-                       conn: Connection, retries: int = 7,
-                       delay: float = 3.0) -> None:
+                       conn: Connection, retries: int = 12,
+                       delay: float = 0.05, metrics: MetricsRegistry | None = None,
+                       socket_options: SocketOptions | None = None, queue_size: int = 4096,
+                       coalesce_delay: float = 0.001, coalesce_bytes: int = 64 * 1024,
+                       max_delay: float = 3.0, connect_timeout: float = 5.0,
+                       resume_buffer: int = 4 * 1024 * 1024, dictionary: int | None = None,
+                       link_rate: float = MessageCodecs.LINK_RATE,
+                       stream: SessionStream | None = None) -> None:
         """
         Initialize the Client object with peer server details and connection parameters.
 
@@ -32,93 +95,397 @@ class Client(NetworkComponent):
             peer_host (str): The peer server's host address.
             peer_port (int): The peer server's port number.
             conn (Connection): The shared connection object.
-            retries (int, optional): The number of connection retry attempts. Default is 7.
-            delay (float, optional): The delay between connection attempts in seconds. Default is 3.0.
+            retries (int, optional): The number of connection attempts. Default is 12.
+            delay (float, optional): The backoff step in seconds after the first failed attempt,
+                                     doubled for every further one. Default is 50 ms.
+            metrics (MetricsRegistry | None, optional): Registry to record the compression and the
+                                                        sending of every message in. Default is None.
+            socket_options (SocketOptions | None, optional): Options to set on the socket. Default
+                                                             is the operating system defaults.
+            queue_size (int, optional): The number of queued messages at which `send` blocks
+                                        until the sender catches up. Default is 4096.
+            coalesce_delay (float, optional): Seconds the sender waits for more messages before
+                                              a write. Default is 1 ms.
+            coalesce_bytes (int, optional): The largest write in bytes; 0 sends every frame with
+                                            its own `sendall`. Default is 64 KiB.
+            max_delay (float, optional): The largest backoff step in seconds. Default is 3.0.
+            connect_timeout (float, optional): Seconds a connection attempt may take. Default is 5.0.
+            resume_buffer (int, optional): The bytes of recent frames kept to resume a session
+                                           after a reconnect. Default is 4 MiB.
+            dictionary (int | None, optional): The id of a loaded dictionary to prime new sessions
+                                               with. Default is None, a blank guess table.
+            link_rate (float, optional): The transmission rate in bytes per second weighed against
+                                         compression time when choosing a codec. Default is 1 Mbit/s.
+            stream (SessionStream | None, optional): A shared stream to send the messages of, which
+                                                     sets the dictionary instead. Default is None,
+                                                     a stream of the client's own.
         
         The Client object uses the Connection object to monitor and manage the connection state.
         """
-        self._compressor: Compression = Compression()
+        self._metrics: MetricsRegistry | None = metrics
+        self._link_rate: float = link_rate
+        self._resume_buffer: int = resume_buffer
+        self._group: SessionStream | None = stream
+        self._stream: SessionStream = stream if stream is not None else \
+            SessionStream(metrics, dictionary, resume_buffer, link_rate)
+        self._written: int = 0
+        self._batch: bytearray = bytearray()
+        self._batch_messages: list[str] = []
+        self._queue: Queue = Queue(queue_size)
+        self._sender: Thread | None = None
+        self._send_failed: bool = False
+        self._coalesce_delay: float = coalesce_delay
+        self._coalesce_bytes: int = coalesce_bytes
+        self._socket_options: SocketOptions | None = socket_options
+        self._closing: bool = False
         self._peer_host: str = peer_host
         self._peer_port: int = peer_port
         self._retries: int = retries
         self._delay:float = delay
+        self._max_delay: float = max_delay
+        self._connect_timeout: float = connect_timeout
         super().__init__(None, None, conn)
 
     def start(self) -> None:
         """
-        Attempt to connect to the peer server with retries.
+        Connect to the peer server, retrying with backoff, and start the sender thread.
 
-        This method tries to establish a connection to the peer server. If the connection 
-        is refused or fails, it retries the connection based on the `retries` and `delay` 
-        settings. If the maximum number of retries is exceeded or a timeout occurs, 
-        appropriate exceptions are raised.
+        The first attempt is made immediately. Every attempt is a non-blocking connect 
+        bounded by `connect_timeout`; refused, failed and timed out attempts are retried 
+        after the next backoff delay until `retries` attempts were made.
 
         Raises:
             ConnectionAbortedError: If the connection cannot be established after all retries.
-            TimeoutError: If the connection attempt times out.
         """
-        retry: int = 0
         try:
-            while retry < self._retries:
-                try:
-                    sleep(self._delay)
-                    self._socket.settimeout(10)
-                    self._socket.connect((self._peer_host, self._peer_port))
-                    print(f"Connected to {self._peer_host}:{self._peer_port}")
-                    break
-                except ConnectionRefusedError:
-                    retry+=1
-
-            if retry >= self._retries:
-                raise ConnectionAbortedError
-        except TimeoutError:
-            print(f"Connection timed out.")
-        except ConnectionAbortedError:
+            sock: socket = self.__connect()
+            self.__open_session(sock)
+        except sockerror:
             print(f"Peer server's not running. Terminating process.")
             raise ConnectionAbortedError
+        self._send_failed = False
+        self._sender = Thread(target=self.__drain, daemon=True)
+        self._sender.start()
+        print(f"Connected to {self._peer_host}:{self._peer_port}")
+
+    def __connect(self) -> socket:
+        """
+        Connect a new socket to the peer server, retrying with backoff.
+
+        Returns:
+            socket: The connected socket, which replaces the client's socket.
+
+        Raises:
+            ConnectionAbortedError: If every attempt failed or the client was closed meanwhile.
+        """
+        for _, pause in zip(range(self._retries), Backoff(self._delay, self._max_delay)):
+            sleep(pause)
+            if self._closing:
+                break
+            try:
+                sock: socket = connect((self._peer_host, self._peer_port), self._connect_timeout,
+                                       self._socket_options)
+            except OSError:
+                continue
+            sock.settimeout(self._connect_timeout)
+            if self._socket is not None:
+                self._socket.close()
+            self._socket = sock
+            return sock
+        raise ConnectionAbortedError
 
-    def __send_message(self, msg: str):
+    def __open_session(self, sock: socket) -> None:
         """
-        Compress and send a message to the peer server.
+        Introduce the session on a new connection and resend what the server did not process.
+
+        Args:
+            sock (socket): The newly connected socket.
+
+        Raises:
+            ConnectionError: If the connection is lost during the handshake.
+
+        If the server resumed the session, the kept frames after the last message it 
+        processed are sent again. Otherwise, or if those frames were no longer kept, a 
+        new session is started with fresh codecs, and the messages the server did not 
+        receive are reported as lost. A new session uses the codecs the server accepted, 
+        and is primed with the dictionary if the server has it.
+
+        A server new to a shared stream is sent all of its frames so far, as long as they 
+        are kept and it accepted the codecs and the priming of the stream; otherwise the 
+        client leaves the shared stream for a new one of its own.
+
+        Only the handshake is bounded by `connect_timeout`: once the session is open, the 
+        socket blocks, since the sender's writes wait for as long as the server holds back 
+        reading, e.g. while its decode pool is full.
+        """
+        resumed, received, primed, codecs = self.__greet(sock)
+        if resumed or self._stream.shared:
+            unsent: tuple[int, list[bytes]] | None = self._stream.unsent(received if resumed else 0)
+            if unsent is not None and self._stream.accepts(codecs, primed):
+                self._written, frames = unsent
+                sock.settimeout(None)
+                if frames:
+                    sock.sendall(b"".join(frames))
+                    print(f"Session resumed, {len(frames)} messages sent again" if resumed
+                          else f"Peer caught up with {len(frames)} earlier messages")
+                return
+
+        if self._stream.shared:
+            print("Peer cannot follow the shared session, compressing for it separately")
+            self._stream = SessionStream(self._metrics, self._stream.dictionary, self._resume_buffer,
+                                         self._link_rate)
+            _, _, primed, codecs = self.__greet(sock)
+        elif self._stream.framed:
+            lost: int = self._stream.framed - received if resumed else self._stream.framed
+            print(f"Session could not be resumed, up to {lost} messages were lost")
+            self._stream.restart()
+            _, _, primed, codecs = self.__greet(sock)
+        self._stream.use(codecs, primed)
+        self._written = 0
+        sock.settimeout(None)
+
+    def __greet(self, sock: socket) -> tuple[bool, int, bool, list[tuple[int, int]]]:
+        """
+        Send the session id, the codecs on offer and the dictionary id, and wait for the server's answer.
+
+        Returns:
+            tuple: Whether the server resumed the session, the number of its messages it
+                   processed, whether the session is primed with the dictionary, and the
+                   codecs the session may use.
+
+        Raises:
+            ConnectionError: If the connection is closed before the server answers.
+        """
+        sock.sendall(self._stream.hello())
+        reader: FrameReader = FrameReader(64)
+        while reader.recv_from(sock):
+            for frame_type, payload in reader.frames():
+                if frame_type == FrameType.SESSION_WELCOME:
+                    return decode_welcome(payload)
+        raise ConnectionError("Connection closed during the session handshake")
+
+    def __reconnect(self) -> socket:
+        """
+        Replace a lost connection and resume the session on it.
+
+        Returns:
+            socket: The new connection.
+
+        Raises:
+            ConnectionAbortedError: If the peer server cannot be reached again.
+        """
+        print("Connection to peer lost, reconnecting...")
+        for _ in range(self._retries):
+            sock: socket = self.__connect()
+            try:
+                self.__open_session(sock)
+                return sock
+            except sockerror:
+                continue
+        raise ConnectionAbortedError
+
+    def send(self, msg: str, framed: tuple[int, bytes] | None = None) -> None:
+        """
+        Queue a message to be compressed and sent by the sender thread.
 
         Args:
             msg (str): The message to be sent to the server.
+            framed (tuple[int, bytes] | None, optional): The result of `frame(msg)` on the shared
+                                                         stream, to send as it is. Default is None,
+                                                         which has the sender compress the message.
+
+        Raises:
+            ConnectionError: If the connection is not active or the sender thread lost it.
+
+        Messages are sent in the order they are queued. When `queue_size` messages are 
+        waiting, this method blocks until the sender makes room. Every message of a shared 
+        stream must be queued, with its frame, to every client sharing it.
+        """
+        if not self._conn.state or self._send_failed or self._sender is None:
+            raise ConnectionError
+        self._queue.put(msg if framed is None else (msg, *framed))
+        if self._metrics is not None:
+            self._metrics.gauge("client.queue_depth").set(self._queue.qsize())
+
+    def flush(self) -> None:
+        """
+        Wait until every queued message has been written to the socket.
+
+        Raises:
+            ConnectionError: If the sender thread lost the connection.
+        """
+        if self._sender is not None:
+            self._queue.join()
+        if self._send_failed:
+            raise ConnectionError
+
+    def __frame_message(self, item: str | tuple[str, int, bytes]) -> bool:
+        """
+        Append the frame of a queued message to the pending write.
+
+        Args:
+            item (str | tuple[str, int, bytes]): The message, or the message with the number
+                                                 and the frame the shared stream gave it.
+
+        Returns:
+            bool: Whether a frame was added; the server already has the frames of the
+                  shared stream it was caught up with.
 
         Raises:
-            ConnectionError: If the connection is not active.
             ValueError: If there is an issue with compressing the message.
-        
-        This method compresses the message using the Compression class before sending 
-        it over the socket. If the connection is not active or the message cannot be 
-        compressed, appropriate exceptions are raised.
+
+        Messages are compressed here unless their frame was built by the stream the client 
+        sends, in which case the frame is written as it is.
+        """
+        if self._group is not None:
+            self._batch_messages.append(item if isinstance(item, str) else item[0])
+        if isinstance(item, str):
+            self._written, frame = self._stream.frame(item)
+        elif self._stream is self._group:
+            if item[1] <= self._written:
+                return False
+            _, self._written, frame = item
+        else:
+            self._written, frame = self._stream.frame(item[0])
+        self._batch += frame
+        return True
+
+    def __drain(self) -> None:
+        """
+        Compress and send the queued messages until asked to stop or the peer is unreachable.
+
+        Runs on the sender thread. After taking a message, the sender collects the ones 
+        queued behind it, and those arriving within `coalesce_delay`, until the batch 
+        reaches `coalesce_bytes`, and writes the whole batch with one `sendall`. If the 
+        write fails, the connection is replaced and the session resumed, which sends the 
+        unprocessed frames again; if the peer was given a stream of its own instead, the 
+        messages of the failed write are compressed again for it. When a metrics registry was given, the size of every 
+        write, the number of frames it carried and the time spent in `sendall` are recorded, and the 
+        `client.queue_depth` gauge follows the messages waiting in the queue.
+        """
+        stopping: bool = False
+        while not stopping:
+            msg: str | tuple[str, int, bytes] | None = self._queue.get()
+            taken: int = 1
+            frames: int = 0
+            stream: SessionStream = self._stream
+            del self._batch[:]
+            del self._batch_messages[:]
+            deadline: float = monotonic() + self._coalesce_delay
+            try:
+                while msg is not None:
+                    try:
+                        frames += self.__frame_message(msg)
+                    except ValueError as e:
+                        print(str(e))
+                    if len(self._batch) >= self._coalesce_bytes:
+                        break
+                    try:
+                        msg = self._queue.get(timeout=max(deadline - monotonic(), 0))
+                    except Empty:
+                        break
+                    taken += 1
+                stopping = msg is None
+                if self._metrics is not None:
+                    self._metrics.gauge("client.queue_depth").set(self._queue.qsize())
+
+                if frames and not self._send_failed:
+                    sock: socket | None = self._socket
+                    if sock is None:
+                        raise ConnectionAbortedError
+                    sent_at: int = perf_counter_ns()
+                    sock.sendall(self._batch)
+                    if self._metrics is not None:
+                        self.__record_send(len(self._batch), frames, perf_counter_ns() - sent_at)
+            except sockerror as e:
+                if self._closing or not self._conn.state:
+                    self._send_failed = True
+                    continue
+                try:
+                    self.__reconnect()
+                    if self._stream is not stream and self._batch_messages:
+                        messages: list[str] = self._batch_messages[:]
+                        del self._batch[:]
+                        for message in messages:
+                            self.__frame_message(message)
+                        self._socket.sendall(self._batch)
+                except sockerror:
+                    print(f"Client Error {e}")
+                    self._send_failed = True
+            finally:
+                for _ in range(taken):
+                    self._queue.task_done()
+
+    def __record_send(self, wire_bytes: int, frames: int, elapsed_ns: int) -> None:
         """
+        Record a write of one or more frames in the metrics registry.
+
+        Args:
+            wire_bytes (int): The size of the frames, headers included.
+            frames (int): The number of frames written.
+            elapsed_ns (int): The time `sendall` took, in nanoseconds.
+        """
+        self._metrics.counter("client.messages").inc(frames)
+        self._metrics.counter("client.wire_bytes").inc(wire_bytes)
+        self._metrics.histogram("client.send_ns").observe(elapsed_ns)
+        self._metrics.histogram("client.frames_per_write").observe(frames)
+        self._metrics.publish("client", wire_bytes=wire_bytes, frames=frames, send_ns=elapsed_ns)
+
+    def send_file(self, path: str) -> None:
+        """
+        Stream a file to the peer server, which writes it to its download directory.
+
+        Args:
+            path (str): The file to be sent.
+
+        Raises:
+            ConnectionError: If the connection is not active or is lost during the transfer.
+
+        The file is sent in independently compressed chunks by a `FileSender`, which 
+        compresses the next chunks on worker processes while the current one is on the 
+        wire and waits for the server's acknowledgements when too much is in flight. 
+        A transfer of the same file interrupted earlier resumes where the server's 
+        partial copy ends. Errors reading the file or reported by the server are printed. 
+        If the connection is lost, it is reopened so that the file can be sent again.
+        """
+        self.flush()
+        if not self._conn.state:
+            raise ConnectionError
         try:
-            if not self._conn.state:
-                raise ConnectionError
-            compressed_msg: bytearray = self._compressor.payload_compression(msg)
-            self._socket.sendall(compressed_msg)
+            resumed, size = FileSender(self._socket, metrics=self._metrics).send(path)
+            print(f"Sent {path} ({size} bytes)" + (f", resumed at {resumed}" if resumed else ""))
         except ConnectionError:
-            raise ConnectionError
-        except ValueError as e:
-            print(str(e))
+            # The sender thread is idle after the flush, so the connection is replaced here.
+            try:
+                self.__reconnect()
+            except ConnectionAbortedError:
+                raise ConnectionError
+            print(f"Transfer of {path} interrupted, send it again to resume it")
+        except (OSError, ValueError) as e:
+            print(f"Could not send {path}: {e}")
 
     def handler(self):
         """
         Handle user input and send messages to the peer server.
 
         This method continuously reads user input and sends messages to the peer server. 
-        The user can type 'exit' to terminate the communication and close the connection.
-        If the connection is lost, the loop will break, and the client will terminate.
+        The user can type 'exit' to terminate the communication and close the connection,
+        or '/send <path>' to send a file. If the peer cannot be reached again after the 
+        connection was lost, the loop will break, and the client will terminate.
         """
         while True:
             message = input("")
             try:
                 if message.lower() == 'exit':
                     print("Exiting chat...")
-                    self.__send_message('exit')  # Send exit message to peer
+                    self.send('exit')  # Send exit message to peer
+                    # The server closes first, so that the peer leaving in turn is not taken for a lost connection.
                     self._conn.update_state()
                     break
-                self.__send_message(message)
+                if message.startswith('/send '):
+                    self.send_file(message[len('/send '):].strip())
+                    continue
+                self.send(message)
             except ConnectionError:
                 break
 
@@ -126,16 +493,28 @@ class Client(NetworkComponent):
         """
         Close the client socket and terminate the connection.
 
-        This method attempts to gracefully shut down the client socket. If there is no 
-        active connection, it catches the socket error and closes the socket.
+        This method stops the sender thread once it has written the messages already 
+        queued, waiting up to `connect_timeout` for it, and attempts to gracefully shut 
+        down the client socket. If there is no active connection, it catches the socket 
+        error and closes the socket.
         """
+        self._closing = True
+        if self._sender is not None:
+            try:
+                self._queue.put_nowait(None)
+                if self._sender is not current_thread():
+                    self._sender.join(self._connect_timeout)
+            except Full:
+                # The sender is blocked on the socket and stops once it is shut down.
+                pass
+            self._sender = None
         if self._socket is not None:
             try:
                 self._socket.shutdown(SHUT_RDWR)
             except sockerror as e:
                 # This error is due to lack of connection, so 
                 # `shutdown()` cannot be called without one.
-                if e.winerror != 10057:
+                if e.errno != ENOTCONN and getattr(e, "winerror", None) != 10057:
                     print(f"Client Error {e}")
             self._socket.close()
             self._socket = None
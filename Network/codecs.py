@@ -0,0 +1,440 @@
+"""
+The codecs a message can be sent with, and the choice between them.
+
+Every message frame of a session (`FrameType.CODED_MESSAGE`) starts with the id of
+the codec its payload was written with. Which codecs a session may use is agreed
+on in the session handshake (see `session`): the client offers the id and version
+of every registered codec, and the server keeps those it registered at the same
+version. `RAW` is always available.
+
+The Predictor keeps its guess table across the messages of the session, like the
+`StreamCompressor` it wraps, and is cheap on short text. `zlib` and `lzma` compress
+each message on its own and pay off on large, repetitive payloads. The sender picks
+a codec per message by size (`MIN_SIZE` of each codec) and by measured cost: for
+every codec and size class it keeps a running average of the compression ratio and
+of the time per byte, and chooses the codec with the shortest estimated time to
+compress and transmit the message at `link_rate`. A codec without a recent
+measurement is tried first, so the estimates follow the traffic; the Predictor,
+which improves as it learns the conversation, is measured again more often.
+
+Codecs are pluggable: subclass `MessageCodec` and `register_codec` the class on
+both nodes before they connect.
+
+Attributes:
+    CODECS (dict[int, type[MessageCodec]]): The registered codecs by id.
+    MAX_MESSAGE_SIZE (int): The largest message `zlib` and `lzma` decode, the most a raw message
+                            frame can carry, so that a small payload cannot expand without bound.
+"""
+import lzma
+import zlib
+from abc import ABC, abstractmethod
+from enum import IntEnum
+from time import perf_counter_ns
+from typing import Iterable
+
+from Metrics import MetricsRegistry
+from PayloadCompression import StreamCompressor, StreamDecompressor
+from .framing import MAX_FRAME_LENGTH
+
+MAX_MESSAGE_SIZE: int = MAX_FRAME_LENGTH
+
+
+class CodecId(IntEnum):
+    """
+    Ids of the built-in codecs, written as the first byte of a `CODED_MESSAGE` payload.
+
+    Attributes:
+        RAW: The message itself.
+        PREDICTOR: A packet of the session's `StreamCompressor`.
+        PREDICTOR_RAW: A raw packet of the session's `StreamCompressor`, passed to `feed_raw`.
+        ZLIB: A zlib stream of the message alone.
+        LZMA: A raw LZMA2 stream of the message alone.
+    """
+    RAW = 0x00
+    PREDICTOR = 0x01
+    PREDICTOR_RAW = 0x02
+    ZLIB = 0x03
+    LZMA = 0x04
+
+
+class MessageCodec(ABC):
+    """
+    Abstract base class of the codecs messages are sent with.
+
+    One instance serves one direction of one session, so a codec may keep state
+    across messages as long as `decode` sees every payload `encode` wrote, in order.
+
+    Attributes:
+        ID (int): The id the codec is negotiated by.
+        IDS (tuple[int, ...]): Every id the codec writes, `ID` first.
+        NAME (str): The name metrics are recorded under.
+        VERSION (int): The version of the payload format, which both ends must share.
+        MIN_SIZE (int): The shortest message worth compressing with the codec.
+        ADAPTS (bool): Whether the codec learns from the messages it compresses, so that its
+                       estimates go stale sooner.
+
+    Methods:
+        encode(data: bytes) -> tuple[int, bytes | bytearray]: Compresses a message.
+        decode(codec_id: int, payload: memoryview) -> bytes | bytearray: Decompresses a message.
+    """
+    ID: int
+    IDS: tuple[int, ...]
+    NAME: str
+    VERSION: int = 1
+    MIN_SIZE: int = 0
+    ADAPTS: bool = False
+
+    @abstractmethod
+    def encode(self, data: bytes) -> tuple[int, bytes | bytearray]:
+        """
+        Compress a message.
+
+        Args:
+            data (bytes): The message, not empty.
+
+        Returns:
+            tuple: The id to write in front of the payload, one of `IDS`, and the payload.
+        """
+        pass
+
+    @abstractmethod
+    def decode(self, codec_id: int, payload: memoryview) -> bytes | bytearray:
+        """
+        Decompress a message.
+
+        Args:
+            codec_id (int): The id written in front of the payload, one of `IDS`.
+            payload (memoryview): The payload.
+
+        Returns:
+            bytes | bytearray: The message.
+
+        Raises:
+            ValueError: If the payload is corrupt.
+        """
+        pass
+
+
+class RawCodec(MessageCodec):
+    """
+    Codec sending messages as they are.
+    """
+    ID = CodecId.RAW
+    IDS = (CodecId.RAW,)
+    NAME = "raw"
+
+    def encode(self, data: bytes) -> tuple[int, bytes | bytearray]:
+        return CodecId.RAW, data
+
+    def decode(self, codec_id: int, payload: memoryview) -> bytes | bytearray:
+        return bytes(payload)
+
+
+class PredictorCodec(MessageCodec):
+    """
+    Codec writing every message as one packet of a stream kept for the session.
+
+    Attributes:
+        _compressor (StreamCompressor): The sending side of the stream, created on first use.
+        _decompressor (StreamDecompressor): The receiving side of the stream, created on first use.
+        _metrics (MetricsRegistry | None): The registry the stream codecs record every packet in, if any.
+        _dictionary (int | None): The id of the dictionary priming the stream, if any.
+    """
+    ID = CodecId.PREDICTOR
+    IDS = (CodecId.PREDICTOR, CodecId.PREDICTOR_RAW)
+    NAME = "predictor"
+    ADAPTS = True
+
+    def __init__(self, metrics: MetricsRegistry | None = None, dictionary: int | None = None) -> None:
+        """
+        Initialize the PredictorCodec object.
+
+        Args:
+            metrics (MetricsRegistry | None, optional): Registry to record every packet in. Default is None.
+            dictionary (int | None, optional): The id of a loaded dictionary to prime the stream with.
+        """
+        self._compressor: StreamCompressor | None = None
+        self._decompressor: StreamDecompressor | None = None
+        self._metrics: MetricsRegistry | None = metrics
+        self._dictionary: int | None = dictionary
+
+    def encode(self, data: bytes) -> tuple[int, bytes | bytearray]:
+        if self._compressor is None:
+            self._compressor = StreamCompressor(self._metrics, adaptive=True, dictionary=self._dictionary)
+        self._compressor.feed(data)
+        packet: bytearray = self._compressor.flush()
+        return CodecId.PREDICTOR_RAW if self._compressor.last_packet_raw else CodecId.PREDICTOR, packet
+
+    def decode(self, codec_id: int, payload: memoryview) -> bytes | bytearray:
+        if self._decompressor is None:
+            self._decompressor = StreamDecompressor(self._metrics, dictionary=self._dictionary)
+        if codec_id == CodecId.PREDICTOR_RAW:
+            self._decompressor.feed_raw(payload)
+        else:
+            self._decompressor.feed(payload)
+        return self._decompressor.flush()
+
+
+class ZlibCodec(MessageCodec):
+    """
+    Codec writing every message as a zlib stream of its own.
+    """
+    ID = CodecId.ZLIB
+    IDS = (CodecId.ZLIB,)
+    NAME = "zlib"
+    MIN_SIZE = 256
+    LEVEL = 6
+
+    def encode(self, data: bytes) -> tuple[int, bytes | bytearray]:
+        return CodecId.ZLIB, zlib.compress(data, ZlibCodec.LEVEL)
+
+    def decode(self, codec_id: int, payload: memoryview) -> bytes | bytearray:
+        decompressor = zlib.decompressobj()
+        try:
+            data: bytes = decompressor.decompress(payload, MAX_MESSAGE_SIZE)
+        except zlib.error as e:
+            raise ValueError(f"Corrupt zlib message: {e}")
+        if decompressor.unconsumed_tail:
+            raise ValueError(f"zlib message longer than {MAX_MESSAGE_SIZE} bytes")
+        if not decompressor.eof or decompressor.unused_data:
+            raise ValueError("Corrupt zlib message: truncated stream or trailing data")
+        return data
+
+
+class LzmaCodec(MessageCodec):
+    """
+    Codec writing every message as a raw LZMA2 stream of its own, without the xz container.
+    """
+    ID = CodecId.LZMA
+    IDS = (CodecId.LZMA,)
+    NAME = "lzma"
+    MIN_SIZE = 4096
+    FILTERS = ({"id": lzma.FILTER_LZMA2, "preset": 6},)
+
+    def encode(self, data: bytes) -> tuple[int, bytes | bytearray]:
+        return CodecId.LZMA, lzma.compress(data, lzma.FORMAT_RAW, filters=LzmaCodec.FILTERS)
+
+    def decode(self, codec_id: int, payload: memoryview) -> bytes | bytearray:
+        decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=LzmaCodec.FILTERS)
+        try:
+            data: bytes = decompressor.decompress(payload, max_length=MAX_MESSAGE_SIZE)
+        except lzma.LZMAError as e:
+            raise ValueError(f"Corrupt lzma message: {e}")
+        if not decompressor.eof and not decompressor.needs_input:
+            raise ValueError(f"lzma message longer than {MAX_MESSAGE_SIZE} bytes")
+        if not decompressor.eof or decompressor.unused_data:
+            raise ValueError("Corrupt lzma message: truncated stream or trailing data")
+        return data
+
+
+CODECS: dict[int, type[MessageCodec]] = {}
+
+
+def register_codec(codec: type[MessageCodec]) -> type[MessageCodec]:
+    """
+    Make a codec available to the sessions opened from now on.
+
+    Args:
+        codec (type[MessageCodec]): The codec class, constructible without arguments.
+
+    Returns:
+        type[MessageCodec]: The class, so this can be used as a decorator.
+
+    Raises:
+        ValueError: If one of its ids is taken by another codec.
+    """
+    for codec_id in codec.IDS:
+        owner: type[MessageCodec] | None = next((other for other in CODECS.values() if codec_id in other.IDS), None)
+        if owner is not None and owner is not codec and owner.ID != codec.ID:
+            raise ValueError(f"Codec id {codec_id} is taken by {owner.NAME}")
+    CODECS[codec.ID] = codec
+    return codec
+
+
+for _codec in (RawCodec, PredictorCodec, ZlibCodec, LzmaCodec):
+    register_codec(_codec)
+
+
+def offer() -> list[tuple[int, int]]:
+    """
+    List the registered codecs as offered in the session handshake.
+
+    Returns:
+        list: The id and version of every registered codec.
+    """
+    return [(codec.ID, codec.VERSION) for codec in CODECS.values()]
+
+
+def negotiate(offered: Iterable[tuple[int, int]]) -> list[tuple[int, int]]:
+    """
+    Keep the offered codecs registered here at the same version.
+
+    Args:
+        offered (Iterable[tuple[int, int]]): The ids and versions offered by the peer.
+
+    Returns:
+        list: The ids and versions both ends support, `RAW` always included.
+    """
+    accepted: list[tuple[int, int]] = [(codec_id, version) for codec_id, version in offered
+                                       if codec_id in CODECS and CODECS[codec_id].VERSION == version]
+    if CodecId.RAW not in (codec_id for codec_id, _ in accepted):
+        accepted.insert(0, (CodecId.RAW, RawCodec.VERSION))
+    return accepted
+
+
+class MessageCodecs:
+    """
+    The codecs of one direction of a session, choosing one per message when sending.
+
+    Attributes:
+        LINK_RATE (float): The default transmission rate in bytes per second the cost model assumes.
+        STALE_AFTER (int): The number of messages after which a codec's estimate is measured again,
+                           divided by `ADAPTIVE_SPEEDUP` for codecs that adapt.
+        ADAPTIVE_SPEEDUP (int): How much sooner the estimates of adapting codecs go stale.
+        SMOOTHING (float): The weight of a new measurement in the running averages.
+        _codecs (dict[int, MessageCodec]): The codecs by every id they write.
+        _candidates (list[MessageCodec]): The negotiated codecs other than `RAW`, in offer order.
+        _raw (MessageCodec): The `RAW` codec.
+        _estimates (dict[tuple[int, int], list[float]]): The ratio, nanoseconds per byte and
+                                                         message number of the last measurement,
+                                                         by codec id and size class.
+        _link_rate (float): The transmission rate in bytes per second.
+        _sent (int): The number of messages encoded so far.
+        _metrics (MetricsRegistry | None): The registry the choices are recorded in, if any.
+
+    Methods:
+        negotiated -> list[tuple[int, int]]: The negotiated codec ids and versions.
+        encode(data: bytes) -> tuple[int, bytes | bytearray]: Compresses a message with the cheapest codec.
+        decode(codec_id: int, payload: memoryview) -> bytes | bytearray: Decompresses a message.
+    """
+    LINK_RATE = 1.25e5
+    STALE_AFTER = 64
+    ADAPTIVE_SPEEDUP = 8
+    SMOOTHING = 0.25
+
+    def __init__(self, codecs: Iterable[tuple[int, int]], metrics: MetricsRegistry | None = None,
+                 dictionary: int | None = None, link_rate: float = LINK_RATE) -> None:
+        """
+        Initialize the MessageCodecs object.
+
+        Args:
+            codecs (Iterable[tuple[int, int]]): The negotiated ids and versions, see `negotiate`.
+            metrics (MetricsRegistry | None, optional): Registry to record the chosen codecs and the
+                                                        Predictor packets in. Default is None.
+            dictionary (int | None, optional): The id of the dictionary priming the Predictor.
+            link_rate (float, optional): The transmission rate in bytes per second weighed against
+                                         compression time. Default is 1 Mbit/s.
+
+        Raises:
+            ValueError: If a codec is not registered.
+        """
+        self._codecs: dict[int, MessageCodec] = {}
+        self._candidates: list[MessageCodec] = []
+        for codec_id, _ in negotiate(codecs):
+            codec_class: type[MessageCodec] = CODECS[codec_id]
+            codec: MessageCodec = PredictorCodec(metrics, dictionary) if codec_class is PredictorCodec \
+                else codec_class()
+            self._codecs.update((written, codec) for written in codec.IDS)
+            if codec_id != CodecId.RAW:
+                self._candidates.append(codec)
+        self._raw: MessageCodec = self._codecs[CodecId.RAW]
+        self._estimates: dict[tuple[int, int], list[float]] = {}
+        self._link_rate: float = link_rate
+        self._sent: int = 0
+        self._metrics: MetricsRegistry | None = metrics
+
+    @property
+    def negotiated(self) -> list[tuple[int, int]]:
+        """
+        Get the negotiated codecs.
+
+        Returns:
+            list[tuple[int, int]]: The id and version of every codec of the session, `RAW` first.
+        """
+        return [(codec.ID, codec.VERSION) for codec in [self._raw] + self._candidates]
+
+    def __choose(self, length: int, size_class: int) -> MessageCodec:
+        """
+        Pick the codec with the lowest estimated cost for a message.
+
+        Args:
+            length (int): The length of the message.
+            size_class (int): The size class of the message.
+
+        Returns:
+            MessageCodec: The first eligible codec without a recent estimate, or else the one
+                          whose estimated compression and transmission time is the shortest.
+        """
+        best: MessageCodec = self._raw
+        best_cost: float = length / self._link_rate
+        for codec in self._candidates:
+            if length < codec.MIN_SIZE:
+                continue
+            estimate: list[float] | None = self._estimates.get((codec.ID, size_class))
+            stale_after: int = MessageCodecs.STALE_AFTER // MessageCodecs.ADAPTIVE_SPEEDUP if codec.ADAPTS \
+                else MessageCodecs.STALE_AFTER
+            if estimate is None or self._sent - estimate[2] > stale_after:
+                return codec
+            cost: float = length * (estimate[0] / self._link_rate + estimate[1] * 1e-9)
+            if cost < best_cost:
+                best, best_cost = codec, cost
+        return best
+
+    def encode(self, data: bytes) -> tuple[int, bytes | bytearray]:
+        """
+        Compress a message with the codec expected to deliver it soonest.
+
+        Args:
+            data (bytes): The message, not empty.
+
+        Returns:
+            tuple: The codec id to write in front of the payload, and the payload. A payload
+                   a stateless codec could not make smaller than the message is sent raw.
+
+        The ratio and time of the chosen codec are folded into its estimate for the size class.
+        """
+        length: int = len(data)
+        size_class: int = length.bit_length() // 2
+        codec: MessageCodec = self.__choose(length, size_class)
+        self._sent += 1
+        if codec is self._raw:
+            codec_id, payload = self._raw.encode(data)
+        else:
+            start: int = perf_counter_ns()
+            codec_id, payload = codec.encode(data)
+            elapsed: int = perf_counter_ns() - start
+            ratio: float = len(payload) / length
+            estimate: list[float] | None = self._estimates.get((codec.ID, size_class))
+            if estimate is None:
+                self._estimates[(codec.ID, size_class)] = [ratio, elapsed / length, self._sent]
+            else:
+                estimate[0] += MessageCodecs.SMOOTHING * (ratio - estimate[0])
+                estimate[1] += MessageCodecs.SMOOTHING * (elapsed / length - estimate[1])
+                estimate[2] = self._sent
+            if len(payload) >= length and len(codec.IDS) == 1:
+                codec_id, payload = self._raw.encode(data)
+        if self._metrics is not None:
+            name: str = CODECS[codec.ID].NAME if codec_id != CodecId.RAW else RawCodec.NAME
+            self._metrics.counter(f"codec.{name}.messages").inc()
+            self._metrics.counter(f"codec.{name}.raw_bytes").inc(length)
+            self._metrics.counter(f"codec.{name}.coded_bytes").inc(len(payload))
+        return codec_id, payload
+
+    def decode(self, codec_id: int, payload: memoryview) -> bytes | bytearray:
+        """
+        Decompress a message.
+
+        Args:
+            codec_id (int): The id written in front of the payload.
+            payload (memoryview): The payload.
+
+        Returns:
+            bytes | bytearray: The message.
+
+        Raises:
+            ValueError: If the codec was not negotiated or the payload is corrupt.
+        """
+        codec: MessageCodec | None = self._codecs.get(codec_id)
+        if codec is None:
+            raise ValueError(f"Message written with codec {codec_id}, which was not negotiated")
+        return codec.decode(codec_id, payload)
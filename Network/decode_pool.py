@@ -0,0 +1,442 @@
+"""
+Decompression of received messages on a pool of worker processes.
+
+A server reading many connections spends most of its time decompressing, and a
+large payload decompressed on the receive thread holds up every message read
+after it. A `DecodePool` moves the decompression to worker processes, so the
+reader only parses frames and delivers messages, and the connections of a server
+are decompressed on as many cores as there are workers.
+
+The messages of one connection form a stream, whose decompression context (the
+codecs of its session, or the stream decompressor of a client without one) lives
+in the worker the stream is assigned to. A stream never moves between workers,
+and a worker handles its jobs in the order they were submitted, so the messages of
+a stream come back in the order they arrived.
+
+Every worker accepts at most `queue_size` batches that were not collected yet. The
+reader checks `has_room` before reading a connection and leaves it unread while
+its worker is full, so the socket buffers fill and TCP slows the sender down
+instead of the queues growing.
+
+A worker that exits unexpectedly is replaced. The decompression contexts it held
+are lost, so the batches it had not returned, and every later batch of its
+streams, come back with an error.
+
+Workers are started by `start`. Dictionaries (see `PayloadCompression.Dictionary`)
+are sent to a worker with the first stream that needs them; codecs added with
+`register_codec` must be registered before the pool is started, and on platforms
+that spawn rather than fork processes, at import time. The codecs in the workers
+do not record into a metrics registry.
+"""
+import multiprocessing
+import threading
+from collections import deque
+from multiprocessing.connection import Connection, wait
+from os import cpu_count
+from socket import socketpair, socket
+
+from PayloadCompression import StreamDecompressor
+from PayloadCompression.CodecConfig import CodecConfig
+from PayloadCompression.Dictionary import Dictionary, get_dictionary, register
+from .codecs import MessageCodecs
+from .framing import FrameType
+
+_OPEN, _DECODE, _CLOSE, _DICTIONARY = range(4)
+
+
+def _decode_worker(jobs: multiprocessing.Queue, results: Connection) -> None:
+    """
+    Decompress the batches of the streams assigned to a worker until it is told to stop.
+
+    Runs in a worker process. Every stream holds its session's codecs, if it has a
+    session, and a stream decompressor created on its first `MESSAGE` frame, or the
+    reason it could not be opened. A batch that fails stops at the failing frame and
+    reports the error; no error ends the worker.
+    """
+    streams: dict[int, list | str] = {}
+    while (job := jobs.get()) is not None:
+        command, *args = job
+        if command == _DICTIONARY:
+            dictionary_id, config, table = args
+            try:
+                register(Dictionary(dictionary_id, CodecConfig.decode(config)[0], table))
+            except Exception:
+                # The streams primed with it fail to open and report why.
+                pass
+        elif command == _OPEN:
+            stream, codecs, dictionary = args
+            try:
+                streams[stream] = [None if codecs is None else MessageCodecs(codecs, None, dictionary), None]
+            except Exception as e:
+                streams[stream] = str(e) or type(e).__name__
+        elif command == _CLOSE:
+            streams.pop(args[0], None)
+        else:
+            stream, frames = args
+            messages: list[str] = []
+            error: str | None = None
+            try:
+                context: list | str = streams.get(stream, "The stream's decompression context was lost")
+                if isinstance(context, str):
+                    raise ValueError(context)
+                for frame_type, payload in frames:
+                    if frame_type == FrameType.CODED_MESSAGE:
+                        data: bytes | bytearray = context[0].decode(payload[0], memoryview(payload)[1:])
+                    else:
+                        if context[1] is None:
+                            context[1] = StreamDecompressor()
+                        if frame_type == FrameType.RAW_MESSAGE:
+                            context[1].feed_raw(payload)
+                        else:
+                            context[1].feed(payload)
+                        data = context[1].flush()
+                    messages.append(str(data, "utf-8"))
+            except Exception as e:
+                error = str(e) or type(e).__name__
+            results.send((stream, messages, error))
+
+
+class DecodePool:
+    """
+    Worker processes decompressing the message frames of many streams, each stream in order.
+
+    Attributes:
+        _workers (int): The number of worker processes.
+        _queue_size (int): The number of uncollected batches a worker accepts.
+        _processes (list[multiprocessing.Process]): The workers, once started.
+        _jobs (list[multiprocessing.Queue]): The job queue of every worker.
+        _results (list[Connection]): The pipe every worker sends its results on, read by the collector.
+        _control (tuple[Connection, Connection] | None): The pipe telling the collector to wait
+                                                         on a new worker, or to stop.
+        _ready (deque[tuple[int | None, list[str], str | None]]): The results received from the workers,
+                                                               and a marker without a stream for a
+                                                               worker that exited.
+        _collector (threading.Thread | None): The thread moving results into `_ready`.
+        _exited (deque[int]): The workers found exited, in the order of their markers in `_ready`.
+        _stopping (bool): Whether `close` is stopping the workers, which then exit as expected.
+        _wake_reader (socket | None): Readable while results are ready; what `fileno` refers to.
+        _wake_writer (socket | None): Written by the collector when a result arrives.
+        _assigned (dict[int, int]): The worker of every open stream.
+        _pending (dict[int, int]): The uncollected batches of every stream with any.
+        _closed (set[int]): The closed streams whose last batches were not collected yet.
+        _in_flight (list[int]): The uncollected batches of every worker.
+        _streams (list[int]): The number of open streams of every worker.
+        _dictionaries (list[set[int]]): The dictionaries sent to every worker.
+        _next_stream (int): The id of the next stream opened.
+
+    Methods:
+        start() -> None: Starts the worker processes.
+        fileno() -> int: The descriptor that is readable while results are ready.
+        open(codecs: list[tuple[int, int]] | None, dictionary: int | None) -> int: Opens a stream.
+        has_room(stream: int) -> bool: Whether the worker of a stream accepts another batch.
+        pending(stream: int) -> int: The uncollected batches of a stream.
+        submit(stream: int, frames: list[tuple[int, bytes]]) -> None: Queues frames for decompression.
+        collect() -> list[tuple[int, list[str], str | None]]: Takes the results received so far.
+        close_stream(stream: int) -> None: Drops the decompression context of a stream.
+        close() -> None: Stops the workers.
+    """
+    def __init__(self, workers: int | None = None, queue_size: int = 64) -> None:
+        """
+        Initialize the DecodePool object. Workers are started by `start`.
+
+        Args:
+            workers (int | None, optional): The number of worker processes. Default is the CPU count.
+            queue_size (int, optional): The number of batches a worker accepts before its
+                                        streams are held back. Default is 64.
+
+        Raises:
+            ValueError: If `queue_size` is less than 1.
+        """
+        if queue_size < 1:
+            raise ValueError("The queue size must be at least 1")
+        self._workers: int = workers or cpu_count() or 1
+        self._queue_size: int = queue_size
+        self._processes: list[multiprocessing.Process] = []
+        self._jobs: list[multiprocessing.Queue] = []
+        self._results: list[Connection] = []
+        self._control: tuple[Connection, Connection] | None = None
+        self._ready: deque[tuple[int | None, list[str], str | None]] = deque()
+        self._collector: threading.Thread | None = None
+        self._exited: deque[int] = deque()
+        self._stopping: bool = False
+        self._wake_reader: socket | None = None
+        self._wake_writer: socket | None = None
+        self._assigned: dict[int, int] = {}
+        self._pending: dict[int, int] = {}
+        self._closed: set[int] = set()
+        self._in_flight: list[int] = [0] * self._workers
+        self._streams: list[int] = [0] * self._workers
+        self._dictionaries: list[set[int]] = [set() for _ in range(self._workers)]
+        self._next_stream: int = 0
+
+    @property
+    def workers(self) -> int:
+        """
+        Get the number of worker processes.
+
+        Returns:
+            int: The number of workers.
+        """
+        return self._workers
+
+    def start(self) -> None:
+        """
+        Start the worker processes and the thread collecting their results.
+        """
+        if self._processes:
+            return
+        self._wake_reader, self._wake_writer = socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._control = multiprocessing.Pipe(duplex=False)
+        self._stopping = False
+        for _ in range(self._workers):
+            jobs, results, process = self.__spawn()
+            self._jobs.append(jobs)
+            self._results.append(results)
+            self._processes.append(process)
+        self._collector = threading.Thread(target=self.__collect_results, daemon=True)
+        self._collector.start()
+
+    def __spawn(self) -> tuple[multiprocessing.Queue, Connection, multiprocessing.Process]:
+        """
+        Start a worker process.
+
+        Returns:
+            tuple: The queue of its jobs, the pipe its results arrive on, and the process.
+
+        Every worker sends its results on a pipe of its own, which no other process
+        writes to, so a worker that dies in the middle of a write cannot hold up the others.
+        """
+        jobs: multiprocessing.Queue = multiprocessing.Queue()
+        results, writer = multiprocessing.Pipe(duplex=False)
+        process: multiprocessing.Process = multiprocessing.Process(target=_decode_worker,
+                                                                   args=(jobs, writer), daemon=True)
+        process.start()
+        # Only the worker keeps the writing end, so the pipe reports the end of the worker.
+        writer.close()
+        return jobs, results, process
+
+    def __collect_results(self) -> None:
+        """
+        Move the results of the workers into `_ready` and signal them on the wake socket.
+
+        Runs on the collector thread, waiting on the result pipes and on the workers 
+        themselves. When a worker exits while the pool is not being closed, the results 
+        it sent before are moved first, then a marker without a stream, which `collect` 
+        answers by failing its streams and replacing the worker.
+        """
+        reported: set[int] = set()
+        while True:
+            waiting: dict = {self._control[0]: None}
+            for worker, (process, results) in enumerate(zip(self._processes, self._results)):
+                if process.pid not in reported:
+                    waiting[results] = waiting[process.sentinel] = (worker, process, results)
+            for ready in wait(list(waiting)):
+                if ready is self._control[0]:
+                    if not self._control[0].recv():
+                        return
+                    continue
+                worker, process, results = waiting[ready]
+                if ready is results:
+                    try:
+                        self._ready.append(results.recv())
+                    except (EOFError, OSError):
+                        # The worker exited; its sentinel reports it.
+                        continue
+                elif process.pid in reported:
+                    continue
+                else:
+                    reported.add(process.pid)
+                    if self._stopping:
+                        continue
+                    try:
+                        while results.poll():
+                            self._ready.append(results.recv())
+                    except (EOFError, OSError):
+                        pass
+                    self._exited.append(worker)
+                    self._ready.append((None, [], f"Decode worker exited with code {process.exitcode}"))
+                self.__wake()
+
+    def __wake(self) -> None:
+        """
+        Make the wake socket readable.
+        """
+        try:
+            self._wake_writer.send(b"\0")
+        except (BlockingIOError, OSError):
+            # A full socket buffer already signals pending results.
+            pass
+
+    def fileno(self) -> int:
+        """
+        Get the descriptor to wait on for results, e.g. with `select` or a selector.
+
+        Returns:
+            int: A socket that is readable while results are ready to be collected.
+        """
+        return self._wake_reader.fileno()
+
+    def open(self, codecs: list[tuple[int, int]] | None, dictionary: int | None = None) -> int:
+        """
+        Open a stream on the worker with the fewest streams.
+
+        Args:
+            codecs (list[tuple[int, int]] | None): The negotiated codecs of the session, or
+                                                  None for a client without a session.
+            dictionary (int | None, optional): The id of the registered dictionary the
+                                               Predictor of the session is primed with.
+
+        Returns:
+            int: The id of the stream.
+
+        Raises:
+            ValueError: If the dictionary is not registered.
+        """
+        worker: int = min(range(self._workers), key=self._streams.__getitem__)
+        if dictionary is not None and dictionary not in self._dictionaries[worker]:
+            loaded: Dictionary = get_dictionary(dictionary)
+            self._jobs[worker].put((_DICTIONARY, loaded.id, loaded.config.encode(), bytes(loaded.table)))
+            self._dictionaries[worker].add(dictionary)
+        stream: int = self._next_stream
+        self._next_stream += 1
+        self._assigned[stream] = worker
+        self._streams[worker] += 1
+        self._jobs[worker].put((_OPEN, stream, codecs, dictionary))
+        return stream
+
+    def has_room(self, stream: int) -> bool:
+        """
+        Check whether the worker of a stream accepts another batch.
+
+        Args:
+            stream (int): The id of the stream.
+
+        Returns:
+            bool: False while the worker holds `queue_size` uncollected batches.
+        """
+        return self._in_flight[self._assigned[stream]] < self._queue_size
+
+    def pending(self, stream: int) -> int:
+        """
+        Get the number of batches of a stream that were not collected yet.
+
+        Args:
+            stream (int): The id of the stream.
+
+        Returns:
+            int: The number of batches submitted but not collected.
+        """
+        return self._pending.get(stream, 0)
+
+    def submit(self, stream: int, frames: list[tuple[int, bytes]]) -> None:
+        """
+        Queue message frames of a stream for decompression.
+
+        Args:
+            stream (int): The id of the stream.
+            frames (list[tuple[int, bytes]]): The frame types and payloads, in the order received.
+
+        The frames come back from `collect` as one result: the stream, the messages
+        decompressed, and the error that stopped the batch, if any.
+        """
+        worker: int = self._assigned[stream]
+        self._in_flight[worker] += 1
+        self._pending[stream] = self._pending.get(stream, 0) + 1
+        self._jobs[worker].put((_DECODE, stream, frames))
+
+    def collect(self) -> list[tuple[int, list[str], str | None]]:
+        """
+        Take the results the workers returned so far, without waiting.
+
+        Returns:
+            list[tuple[int, list[str], str | None]]: The stream, messages and error of every
+                                                     batch, in the order of each stream.
+        """
+        try:
+            while self._wake_reader.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+        collected: list[tuple[int, list[str], str | None]] = []
+        while self._ready:
+            result: tuple[int | None, list[str], str | None] = self._ready.popleft()
+            if result[0] is not None:
+                collected.append(self.__take(result))
+                continue
+            # A worker exited: the batches it did not return fail, and it is replaced.
+            worker: int = self._exited.popleft()
+            for stream in [stream for stream, assigned in self._assigned.items() if assigned == worker]:
+                for _ in range(self.pending(stream)):
+                    collected.append(self.__take((stream, [], result[2])))
+            self.__replace(worker)
+        return collected
+
+    def __take(self, result: tuple[int, list[str], str | None]) -> tuple[int, list[str], str | None]:
+        """
+        Count a batch of a stream as collected, and forget a closed stream once it has none left.
+        """
+        stream: int = result[0]
+        self._in_flight[self._assigned[stream]] -= 1
+        remaining: int = self._pending.pop(stream) - 1
+        if remaining:
+            self._pending[stream] = remaining
+        elif stream in self._closed:
+            self._closed.discard(stream)
+            del self._assigned[stream]
+        return result
+
+    def __replace(self, worker: int) -> None:
+        """
+        Start a new worker process in place of one that exited.
+
+        The streams assigned to the worker stay with it; without their decompression 
+        contexts, their further batches fail.
+        """
+        print(f"Decode worker {worker} exited, starting a new one")
+        self._jobs[worker].cancel_join_thread()
+        self._jobs[worker].close()
+        self._jobs[worker], self._results[worker], self._processes[worker] = self.__spawn()
+        self._dictionaries[worker] = set()
+        self._control[1].send(True)
+
+    def close_stream(self, stream: int) -> None:
+        """
+        Drop the decompression context of a stream. Results still in flight are collected as usual.
+
+        Args:
+            stream (int): The id of the stream.
+        """
+        worker: int | None = self._assigned.get(stream)
+        if worker is None or stream in self._closed:
+            return
+        self._streams[worker] -= 1
+        self._jobs[worker].put((_CLOSE, stream))
+        if stream in self._pending:
+            self._closed.add(stream)
+        else:
+            del self._assigned[stream]
+
+    def close(self) -> None:
+        """
+        Stop the workers and the collector, dropping the batches not decompressed yet.
+        """
+        if not self._processes:
+            return
+        self._stopping = True
+        for jobs in self._jobs:
+            jobs.put(None)
+        for process in self._processes:
+            process.join(1.0)
+            if process.is_alive():
+                process.terminate()
+        self._control[1].send(False)
+        self._collector.join()
+        for results in (*self._results, *self._control):
+            results.close()
+        self._wake_reader.close()
+        self._wake_writer.close()
+        self._processes.clear()
+        self._jobs.clear()
+        self._results.clear()
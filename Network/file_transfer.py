@@ -0,0 +1,451 @@
+"""
+Chunked file transfer between nodes, with pipelined compression and flow control.
+
+A transfer is a conversation on the client's connection:
+
+1. The sender offers the file with a `FILE_OFFER` frame:
+   `varint(size) | varint(mtime_ns) | name`. The size and modification time
+   identify the version of the file.
+2. The receiver answers with a `FILE_ACK` frame, `varint(offset)`, carrying the
+   offset to start from: the size of the partial copy an earlier, interrupted
+   transfer of the same version left behind. A partial copy of another version
+   is discarded.
+3. The sender streams the rest of the file as `FILE_CHUNK` frames,
+   `varint(offset) | packet`, every chunk a `StreamCompressor` packet of its own
+   (`FILE_RAW_CHUNK` for chunks that did not compress). Chunks do not depend on
+   each other, so a transfer can resume at any offset.
+4. The receiver writes every chunk to the partial file and acknowledges it with
+   the offset written up to. The sender keeps at most `window` unacknowledged
+   bytes in flight, so a slow disk or peer throttles it instead of filling buffers.
+5. A `FILE_END` frame, `varint(size) | digest`, completes the file. The receiver
+   checks the SHA-256 digest of the whole file, renames it into place and
+   acknowledges once more; a file that does not match is discarded. Errors are
+   reported with a `FILE_ERROR` frame carrying the reason.
+
+Compression is pipelined with the network I/O: chunks are compressed on an
+executor a few chunks ahead of the one being sent, so the link is not idle while
+the codec works, and the codec is not idle while `sendall` blocks. The digest is
+computed on the executor as well, alongside the chunks.
+
+Attributes:
+    CHUNK_SIZE (int): The number of file bytes per chunk.
+    WINDOW (int): The default number of unacknowledged bytes the sender keeps in flight.
+    PIPELINE_DEPTH (int): The default number of chunks compressed ahead of the one on the wire.
+    PARTIAL_SUFFIX (str): Appended to the name of a file while it is being received.
+    IDENTITY_SUFFIX (str): Appended to the name of a partial file for the identity of its version.
+"""
+import hashlib
+import os
+import threading
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from socket import socket
+from typing import BinaryIO
+
+from Metrics import MetricsRegistry
+from PayloadCompression import StreamCompressor, StreamDecompressor
+from PayloadCompression.varint import decode_varint, encode_varint, varint_size
+from .framing import FRAME_HEADER_MAX, FrameReader, FrameType, encode_frame, prepend_frame_header
+
+CHUNK_SIZE: int = 256 * 1024
+WINDOW: int = 8 * CHUNK_SIZE
+PIPELINE_DEPTH: int = 2
+PARTIAL_SUFFIX: str = ".part"
+IDENTITY_SUFFIX: str = ".id"
+
+_worker = threading.local()
+
+
+def _compress_chunk(path: str, offset: int, length: int) -> bytes:
+    """
+    Read one chunk of a file and build its `FILE_CHUNK` or `FILE_RAW_CHUNK` frame.
+
+    Runs on the sender's executor, in a worker process by default. The chunk is read
+    by the worker itself, so only the compressed frame crosses the process boundary.
+    Every worker thread keeps a compressor of its own.
+
+    Returns:
+        bytes: The complete frame.
+    """
+    compressor: StreamCompressor | None = getattr(_worker, "compressor", None)
+    if compressor is None:
+        compressor = _worker.compressor = StreamCompressor(adaptive=True)
+
+    with open(path, "rb") as file:
+        file.seek(offset)
+        chunk: bytes = file.read(length)
+    if len(chunk) != length:
+        raise ValueError(f"{path} was truncated while it was being sent")
+
+    compressor.reset()
+    compressor.feed(chunk)
+    payload_start: int = FRAME_HEADER_MAX + varint_size(offset)
+    frame: bytearray = bytearray(payload_start + compressor.max_packet_size(length))
+    view: memoryview = memoryview(frame)
+    encode_varint(offset, frame, FRAME_HEADER_MAX)
+    end: int = payload_start + compressor.flush_into(view[payload_start:])
+    frame_type: FrameType = FrameType.FILE_RAW_CHUNK if compressor.last_packet_raw else FrameType.FILE_CHUNK
+    start: int = prepend_frame_header(view, FRAME_HEADER_MAX, frame_type, end - FRAME_HEADER_MAX)
+    return bytes(view[start:end])
+
+
+def _digest_file(path: str) -> bytes:
+    """
+    Compute the SHA-256 digest of a file, on the sender's executor.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while chunk := file.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _offset_frame(frame_type: FrameType, offset: int, trailer: bytes = b"") -> bytearray:
+    """
+    Build a frame whose payload is a varint, e.g. a `FILE_ACK`, followed by `trailer`.
+    """
+    payload: bytearray = bytearray(varint_size(offset))
+    encode_varint(offset, payload)
+    return encode_frame(frame_type, payload + trailer)
+
+
+class FileSender:
+    """
+    Send files over a connected socket, compressing chunks ahead on an executor.
+
+    Attributes:
+        _socket (socket): The connected socket, also read for the receiver's acknowledgements.
+        _reader (FrameReader): Parser of the frames sent back by the receiver.
+        _window (int): The largest number of unacknowledged bytes in flight.
+        _depth (int): The number of chunks compressed ahead of the one being sent.
+        _executor (Executor | None): The executor chunks are compressed on, None to start
+                                     a process pool for every transfer.
+        _metrics (MetricsRegistry | None): The registry every sent chunk is recorded in, if any.
+
+    Methods:
+        send(path: str) -> tuple[int, int]: Sends a file, resuming an interrupted transfer.
+    """
+    def __init__(self, sock: socket, window: int = WINDOW, depth: int = PIPELINE_DEPTH,
+                 executor: Executor | None = None, metrics: MetricsRegistry | None = None) -> None:
+        """
+        Initialize the FileSender for one connection.
+
+        Args:
+            sock (socket): A connected socket whose peer runs a `FileReceiver`.
+            window (int, optional): The largest number of unacknowledged bytes in flight,
+                                    at least one chunk. Default is `WINDOW`.
+            depth (int, optional): The number of chunks compressed ahead of the one being sent.
+            executor (Executor | None, optional): Executor to compress chunks on. Default is a
+                                                  process pool of `depth` workers per transfer.
+            metrics (MetricsRegistry | None, optional): Registry to record the sent chunks in.
+        """
+        self._socket: socket = sock
+        self._reader: FrameReader = FrameReader(1024)
+        self._window: int = max(window, CHUNK_SIZE)
+        self._depth: int = max(depth, 1)
+        self._executor: Executor | None = executor
+        self._metrics: MetricsRegistry | None = metrics
+
+    def __receive_ack(self) -> int:
+        """
+        Block until the receiver acknowledges an offset.
+
+        Returns:
+            int: The acknowledged offset.
+
+        Raises:
+            ConnectionError: If the peer closed the connection.
+            ValueError: If the receiver reported an error.
+        """
+        while True:
+            for frame_type, payload in self._reader.frames():
+                if frame_type == FrameType.FILE_ACK:
+                    return decode_varint(payload)[0]
+                if frame_type == FrameType.FILE_ERROR:
+                    raise ValueError(str(payload, encoding="utf-8"))
+            if not self._reader.recv_from(self._socket):
+                raise ConnectionError("Peer closed the connection during the transfer")
+
+    def __record_chunk(self, file_bytes: int, wire_bytes: int) -> None:
+        """
+        Record a sent chunk in the metrics registry.
+
+        Args:
+            file_bytes (int): The number of file bytes in the chunk.
+            wire_bytes (int): The size of its frame, header included.
+        """
+        self._metrics.counter("client.file_bytes").inc(file_bytes)
+        self._metrics.counter("client.wire_bytes").inc(wire_bytes)
+
+    def send(self, path: str) -> tuple[int, int]:
+        """
+        Send a file, starting where an earlier transfer of it was interrupted.
+
+        Args:
+            path (str): The file to send. The receiver stores it under its base name.
+
+        Returns:
+            tuple: The offset the transfer resumed from and the size of the file.
+
+        Raises:
+            OSError: If the file cannot be read.
+            ConnectionError: If the connection is lost during the transfer.
+            ValueError: If the receiver rejected the file or a chunk.
+
+        Chunk N + 1 onwards are compressed while chunk N is sent. Before a chunk goes out,
+        acknowledgements are awaited until it fits into the window; every chunk and the
+        final `FILE_END` are acknowledged exactly once, so none is left unread when the
+        transfer returns.
+        """
+        stat: os.stat_result = os.stat(path)
+        size: int = stat.st_size
+        name: bytes = os.path.basename(path).encode("utf-8")
+        offer: bytearray = bytearray(varint_size(size) + varint_size(stat.st_mtime_ns))
+        encode_varint(stat.st_mtime_ns, offer, encode_varint(size, offer))
+        self._socket.sendall(encode_frame(FrameType.FILE_OFFER, offer + name))
+        resumed: int = self.__receive_ack()
+        if resumed > size:
+            raise ValueError("Peer holds more of the file than there is to send")
+
+        acked: int = resumed
+        owed: int = 0
+        executor: Executor = self._executor or ProcessPoolExecutor(max_workers=self._depth)
+        try:
+            digest: Future = executor.submit(_digest_file, path)
+            pending: deque[tuple[int, int, Future]] = deque()
+            next_offset: int = resumed
+            while True:
+                while next_offset < size and len(pending) <= self._depth:
+                    length: int = min(CHUNK_SIZE, size - next_offset)
+                    pending.append((next_offset + length, length,
+                                    executor.submit(_compress_chunk, path, next_offset, length)))
+                    next_offset += length
+                if not pending:
+                    break
+
+                end, length, future = pending.popleft()
+                try:
+                    frame: bytes = future.result()
+                except (OSError, ValueError):
+                    # Collect the acknowledgements still owed, so that they are not
+                    # mistaken for replies to the next transfer on this connection.
+                    for _ in range(owed):
+                        self.__receive_ack()
+                    raise
+                while end - acked > self._window:
+                    acked = self.__receive_ack()
+                    owed -= 1
+                self._socket.sendall(frame)
+                owed += 1
+                if self._metrics is not None:
+                    self.__record_chunk(length, len(frame))
+            try:
+                end_frame: bytearray = _offset_frame(FrameType.FILE_END, size, digest.result())
+            except OSError:
+                for _ in range(owed):
+                    self.__receive_ack()
+                raise
+        finally:
+            if self._executor is None:
+                executor.shutdown(cancel_futures=True)
+
+        self._socket.sendall(end_frame)
+        for _ in range(owed + 1):
+            acked = self.__receive_ack()
+        if acked != size:
+            raise ValueError("Peer did not complete the file")
+        return resumed, size
+
+
+class FileReceiver:
+    """
+    Write the files offered by a `FileSender` into a directory.
+
+    A file is written to `<name>.part` and renamed to `<name>` when it is complete and
+    its digest matches. `<name>.part.id` holds the size and modification time of the
+    version being received, so a partial file found when the same version is offered
+    again is resumed rather than restarted, and one of another version is restarted.
+
+    Attributes:
+        _directory (str): The directory received files are written to.
+        _decompressor (StreamDecompressor): Decompressor of the chunks, reset for every chunk.
+        _buffer (bytearray): Reusable buffer chunks are decompressed into.
+        _file (BinaryIO | None): The partial file being written, if any.
+        _name (str): The name of the file being received.
+        _size (int): The size of the file being received.
+        _offset (int): The number of bytes of it written so far.
+        _digest (hashlib._Hash): The SHA-256 digest of the bytes written so far.
+        FRAME_TYPES (frozenset): The frame types `handle` accepts.
+
+    Methods:
+        handle(frame_type: int, payload: memoryview) -> bytearray | None: Processes a file frame.
+        close() -> None: Closes the partial file, leaving it to be resumed.
+    """
+    FRAME_TYPES: frozenset[int] = frozenset((FrameType.FILE_OFFER, FrameType.FILE_CHUNK,
+                                             FrameType.FILE_RAW_CHUNK, FrameType.FILE_END))
+
+    def __init__(self, directory: str) -> None:
+        """
+        Initialize the FileReceiver.
+
+        Args:
+            directory (str): The directory to write received files to, created on first use.
+        """
+        self._directory: str = directory
+        self._decompressor: StreamDecompressor = StreamDecompressor()
+        self._buffer: bytearray = bytearray(CHUNK_SIZE)
+        self._file: BinaryIO | None = None
+        self._name: str = ""
+        self._size: int = 0
+        self._offset: int = 0
+        self._digest = hashlib.sha256()
+
+    def __path(self, partial: bool = False) -> str:
+        return os.path.join(self._directory, self._name + (PARTIAL_SUFFIX if partial else ""))
+
+    def __resumable(self, identity: bytes) -> bool:
+        """
+        Check whether the partial file belongs to the offered version, and record it as the one received.
+
+        Args:
+            identity (bytes): The size and modification time from the offer, as sent.
+
+        Returns:
+            bool: Whether a partial file of the same version exists.
+        """
+        partial: str = self.__path(partial=True)
+        try:
+            with open(partial + IDENTITY_SUFFIX, "rb") as file:
+                same: bool = file.read() == identity and os.path.exists(partial)
+        except FileNotFoundError:
+            same = False
+        if not same:
+            with open(partial + IDENTITY_SUFFIX, "wb") as file:
+                file.write(identity)
+        return same
+
+    def __open(self, payload: memoryview) -> int:
+        """
+        Open the partial file of an offered file, keeping what an earlier transfer of the same version wrote.
+
+        Returns:
+            int: The offset the sender is to resume from.
+
+        Raises:
+            ValueError: If the offered name is not a plain file name.
+        """
+        self.close()
+        size, mtime_start = decode_varint(payload)
+        name_start: int = decode_varint(payload, mtime_start)[1]
+        name: str = str(payload[name_start:], encoding="utf-8")
+        if name in ("", ".", "..") or os.path.basename(name) != name or os.sep in name:
+            raise ValueError(f"Invalid file name {name!r}")
+
+        self._name, self._size = name, size
+        os.makedirs(self._directory, exist_ok=True)
+        partial: str = self.__path(partial=True)
+        self._file = open(partial, "r+b" if self.__resumable(bytes(payload[:name_start])) else "w+b")
+        self._digest = hashlib.sha256()
+        while chunk := self._file.read(CHUNK_SIZE):
+            self._digest.update(chunk)
+        self._offset = self._file.tell()
+        if self._offset > size:
+            self._offset = 0
+            self._file.truncate(0)
+            self._digest = hashlib.sha256()
+        self._file.seek(self._offset)
+        print(f"Receiving {name} ({size} bytes)" + (f", resuming at {self._offset}" if self._offset else ""))
+        return self._offset
+
+    def __write(self, frame_type: int, payload: memoryview) -> int:
+        """
+        Decompress a chunk and append it to the partial file.
+
+        Returns:
+            int: The number of bytes of the file written so far.
+
+        Raises:
+            ValueError: If the chunk does not continue the file.
+        """
+        offset, packet_start = decode_varint(payload)
+        if offset != self._offset:
+            raise ValueError(f"Chunk at offset {offset} does not continue the file at {self._offset}")
+
+        self._decompressor.reset()
+        if frame_type == FrameType.FILE_RAW_CHUNK:
+            self._decompressor.feed_raw(payload[packet_start:])
+        else:
+            self._decompressor.feed(payload[packet_start:])
+        if offset + self._decompressor.pending > self._size:
+            raise ValueError("Chunk extends past the end of the file")
+        if len(self._buffer) < self._decompressor.pending:
+            self._buffer = bytearray(self._decompressor.pending)
+
+        length: int = self._decompressor.flush_into(self._buffer)
+        self._file.write(memoryview(self._buffer)[:length])
+        self._digest.update(memoryview(self._buffer)[:length])
+        self._file.flush()
+        self._offset += length
+        return self._offset
+
+    def __finish(self, payload: memoryview) -> int:
+        """
+        Rename a completely received file into place once its digest is checked.
+
+        Returns:
+            int: The size of the file.
+
+        Raises:
+            ValueError: If the file is incomplete, or does not match the sender's digest,
+                        in which case the partial file is removed.
+        """
+        size, digest_start = decode_varint(payload)
+        if size != self._size or self._offset != size:
+            raise ValueError("File ended before all of it was received")
+        self._file.close()
+        self._file = None
+        partial: str = self.__path(partial=True)
+        os.remove(partial + IDENTITY_SUFFIX)
+        if payload[digest_start:] != self._digest.digest():
+            os.remove(partial)
+            raise ValueError(f"{self._name} does not match the sender's digest and was discarded")
+        os.replace(partial, self.__path())
+        print(f"Received {self._name} ({size} bytes) into {self._directory}")
+        return size
+
+    def handle(self, frame_type: int, payload: memoryview) -> bytearray | None:
+        """
+        Process a file frame and build the reply to send back to the sender.
+
+        Args:
+            frame_type (int): One of `FRAME_TYPES`.
+            payload (memoryview): The frame payload.
+
+        Returns:
+            bytearray | None: A `FILE_ACK` frame, or a `FILE_ERROR` frame if the frame was
+                              rejected or the file could not be written, which keeps the
+                              partial file for a later transfer. None for the frames still
+                              arriving after an error, which are dropped.
+        """
+        if self._file is None and frame_type != FrameType.FILE_OFFER:
+            return None
+        try:
+            if frame_type == FrameType.FILE_OFFER:
+                offset: int = self.__open(payload)
+            elif frame_type == FrameType.FILE_END:
+                offset = self.__finish(payload)
+            else:
+                offset = self.__write(frame_type, payload)
+            return _offset_frame(FrameType.FILE_ACK, offset)
+        except (OSError, ValueError, IndexError) as e:
+            print(f"File transfer failed: {e}")
+            self.close()
+            return encode_frame(FrameType.FILE_ERROR, str(e).encode("utf-8"))
+
+    def close(self) -> None:
+        """
+        Close the partial file, if any, leaving it to be resumed by a later transfer.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
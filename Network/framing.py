@@ -0,0 +1,229 @@
+from enum import IntEnum
+from typing import Iterator
+from socket import socket
+
+from PayloadCompression.varint import decode_varint, encode_varint, varint_size
+
+class FrameType(IntEnum):
+    """
+    Types of the frames exchanged between nodes.
+
+    Attributes:
+        MESSAGE: A chat message compressed as one `StreamCompressor` packet.
+        RAW_MESSAGE: A chat message that did not compress, sent as a raw `StreamCompressor` packet.
+        FILE_OFFER: The size and name of a file about to be sent (see `file_transfer`).
+        FILE_CHUNK: The offset of a chunk of the file and the chunk as a `StreamCompressor` packet.
+        FILE_RAW_CHUNK: A chunk that did not compress, sent as a raw `StreamCompressor` packet.
+        FILE_END: The size of the file, once every chunk has been sent.
+        FILE_ACK: The offset up to which the receiver holds the file, sent back to the sender.
+        FILE_ERROR: The reason the receiver rejected a file, sent back to the sender.
+        SESSION_HELLO: The session id a client opens or resumes a connection with (see `session`).
+        SESSION_WELCOME: Whether the server resumed the session and how many of its messages it processed.
+        CODED_MESSAGE: A chat message as the id of the codec it was written with and its payload (see `codecs`).
+    """
+    MESSAGE = 0x01
+    RAW_MESSAGE = 0x02
+    FILE_OFFER = 0x03
+    FILE_CHUNK = 0x04
+    FILE_RAW_CHUNK = 0x05
+    FILE_END = 0x06
+    FILE_ACK = 0x07
+    FILE_ERROR = 0x08
+    SESSION_HELLO = 0x09
+    SESSION_WELCOME = 0x0A
+    CODED_MESSAGE = 0x0B
+
+
+FRAME_HEADER_MAX: int = 1 + 10
+"""int: The largest possible frame header, a type byte and a 64-bit varint length."""
+
+MAX_FRAME_LENGTH: int = 64 * 1024 * 1024
+"""int: Frames announcing a longer payload are treated as corrupt."""
+
+
+def frame_header_size(length: int) -> int:
+    """
+    Return the size of the header of a frame carrying `length` payload bytes.
+
+    Args:
+        length (int): The payload length.
+
+    Returns:
+        int: The header size in bytes.
+    """
+    return 1 + varint_size(length)
+
+
+def prepend_frame_header(dst: bytearray | memoryview, payload_offset: int,
+                         frame_type: FrameType, length: int) -> int:
+    """
+    Write a frame header into `dst` so that it ends right at `payload_offset`.
+
+    Senders reserve `FRAME_HEADER_MAX` bytes in front of the payload, write the payload,
+    and then place the header in front of it, so the frame is sent without copying.
+
+    Args:
+        dst (bytearray | memoryview): The buffer holding the payload.
+        payload_offset (int): The offset of the first payload byte in `dst`.
+        frame_type (FrameType): The type of the frame.
+        length (int): The payload length.
+
+    Returns:
+        int: The offset of the first byte of the frame.
+    """
+    start: int = payload_offset - frame_header_size(length)
+    dst[start] = frame_type
+    encode_varint(length, dst, start + 1)
+    return start
+
+
+def encode_frame(frame_type: FrameType, payload: bytes | memoryview) -> bytearray:
+    """
+    Build a complete frame in a freshly allocated buffer.
+
+    Args:
+        frame_type (FrameType): The type of the frame.
+        payload (bytes | memoryview): The frame payload.
+
+    Returns:
+        bytearray: The header followed by the payload.
+    """
+    frame: bytearray = bytearray(frame_header_size(len(payload)))
+    frame[0] = frame_type
+    encode_varint(len(payload), frame, 1)
+    frame += payload
+    return frame
+
+
+class FrameReader:
+    """
+    Incremental parser for the frames arriving on a stream socket.
+
+    Data is received with `recv_into` straight into a reusable buffer, and every call
+    to `frames` yields all the complete frames it holds, so many frames are parsed per
+    system call. Partial frames stay in the buffer until the rest arrives. Consumed
+    space is reclaimed by moving the unparsed tail back to the front of the buffer, and
+    the buffer only grows when a single frame does not fit into it.
+
+    Frame payloads are yielded as memoryviews into the buffer. They are only valid
+    until the next call to `recv_from` or `feed`.
+
+    Attributes:
+        _buffer (bytearray): The receive buffer.
+        _start (int): The offset of the first unparsed byte.
+        _end (int): The offset just past the last received byte.
+
+    Methods:
+        buffered -> int: The number of received bytes not yet consumed as frames.
+        recv_from(sock: socket) -> int: Receives data from a socket into the buffer.
+        feed(data: bytes | memoryview) -> None: Appends already received data to the buffer.
+        frames() -> Iterator[tuple[int, memoryview]]: Yields the complete frames in the buffer.
+    """
+    def __init__(self, capacity: int = 64 * 1024) -> None:
+        """
+        Initialize the FrameReader with an empty receive buffer.
+
+        Args:
+            capacity (int, optional): The initial size of the receive buffer. Default is 64 KiB.
+        """
+        self._buffer: bytearray = bytearray(capacity)
+        self._start: int = 0
+        self._end: int = 0
+
+    @property
+    def buffered(self) -> int:
+        """
+        Get the number of received bytes not yet consumed as frames.
+
+        Returns:
+            int: The size of the unparsed data, e.g. the start of a partial frame.
+        """
+        return self._end - self._start
+
+    def __reserve(self, size: int) -> None:
+        """
+        Make room for at least `size` more bytes after the received data.
+
+        Args:
+            size (int): The number of bytes that must fit after `_end`.
+
+        The unparsed bytes are moved to the front of the buffer first. A larger buffer is
+        only allocated if that does not free enough space.
+        """
+        if len(self._buffer) - self._end >= size:
+            return
+
+        unparsed: int = self._end - self._start
+        if unparsed + size > len(self._buffer):
+            grown: bytearray = bytearray(max(2 * len(self._buffer), unparsed + size))
+            grown[:unparsed] = memoryview(self._buffer)[self._start:self._end]
+            self._buffer = grown
+        elif self._start >= unparsed:
+            self._buffer[:unparsed] = memoryview(self._buffer)[self._start:self._end]
+        else:
+            # Overlapping regions must not be copied straight from a view of the buffer.
+            self._buffer[:unparsed] = bytes(memoryview(self._buffer)[self._start:self._end])
+        self._start, self._end = 0, unparsed
+
+    def recv_from(self, sock: socket) -> int:
+        """
+        Receive as much data as fits from `sock` into the buffer.
+
+        Args:
+            sock (socket): A connected stream socket.
+
+        Returns:
+            int: The number of bytes received, 0 if the peer closed the connection.
+        """
+        self.__reserve(1)
+        received: int = sock.recv_into(memoryview(self._buffer)[self._end:])
+        self._end += received
+        return received
+
+    def feed(self, data: bytes | memoryview) -> None:
+        """
+        Append data received by other means, e.g. an asyncio stream, to the buffer.
+
+        Args:
+            data (bytes | memoryview): The received data.
+        """
+        self.__reserve(len(data))
+        self._buffer[self._end:self._end + len(data)] = data
+        self._end += len(data)
+
+    def frames(self) -> Iterator[tuple[int, memoryview]]:
+        """
+        Yield every complete frame currently in the buffer.
+
+        Yields:
+            tuple: The frame type and a memoryview over the frame payload.
+
+        Raises:
+            ValueError: If a frame announces a payload longer than `MAX_FRAME_LENGTH`, or its
+                        length does not end within `FRAME_HEADER_MAX` bytes.
+
+        Frame types are yielded as plain integers so that callers can skip types they
+        do not know.
+        """
+        view: memoryview = memoryview(self._buffer)
+        while self._start < self._end:
+            try:
+                length, payload_start = decode_varint(view[:self._end], self._start + 1)
+            except IndexError:
+                if self._end - self._start >= FRAME_HEADER_MAX:
+                    raise ValueError("Frame header exceeds the maximum frame header size")
+                break
+            if length > MAX_FRAME_LENGTH:
+                raise ValueError("Frame length exceeds the maximum frame length")
+
+            payload_end: int = payload_start + length
+            if payload_end > self._end:
+                self.__reserve(payload_end - self._end)
+                break
+
+            frame_type: int = view[self._start]
+            self._start = payload_end
+            yield frame_type, view[payload_start:payload_end]
+
+        if self._start == self._end:
+            self._start = self._end = 0
@@ -0,0 +1,545 @@
+import selectors
+from collections import deque
+from socket import socket, SOL_SOCKET, SO_REUSEADDR, error as sockerror
+from time import monotonic
+from typing import Iterable
+
+from Metrics import MetricsRegistry
+from PayloadCompression import StreamDecompressor
+from PayloadCompression.Dictionary import get_dictionary
+from .network_component import NetworkComponent, Connection
+from .codecs import MessageCodecs, negotiate
+from .decode_pool import DecodePool
+from .file_transfer import FileReceiver
+from .framing import FrameReader, FrameType
+from .session import SESSION_ID_SIZE, decode_hello, encode_welcome
+
+class Session:
+    """
+    Per-connection state of the `SelectorServer`.
+
+    Attributes:
+        sock (socket): The non-blocking socket of the connection.
+        peer (tuple): The address of the peer.
+        decompressor (StreamDecompressor): The decompression context of a connection without a session.
+        reader (FrameReader): The receive buffer of the connection.
+        files (FileReceiver): Writer of the files sent over the connection.
+        session_id (bytes | None): The id of the session the client introduced, if any.
+        codecs (MessageCodecs | None): The codecs of the session, kept across connections.
+        primed (bool): Whether the Predictor of the session is primed with a dictionary.
+        received (int): The number of messages of the session processed.
+        lost_at (float | None): When the connection of a session waiting to be resumed was lost.
+        stream (int | None): The decode pool stream the messages of the session are decompressed in.
+        held (deque[tuple[int, bytes]]): Frames received after a hello that waits for the messages
+                                         before it to be decompressed.
+        paused (bool): Whether the connection is left unread until its decode pool worker has room.
+        outgoing (bytearray): The replies not yet written to the socket.
+        events (int): The selector events the socket is registered for, 0 while it is not registered.
+    """
+    def __init__(self, sock: socket, peer: tuple, files: FileReceiver) -> None:
+        self.sock: socket = sock
+        self.peer: tuple = peer
+        self.decompressor: StreamDecompressor = StreamDecompressor()
+        self.reader: FrameReader = FrameReader(capacity=4096)
+        self.files: FileReceiver = files
+        self.session_id: bytes | None = None
+        self.codecs: MessageCodecs | None = None
+        self.primed: bool = False
+        self.received: int = 0
+        self.lost_at: float | None = None
+        self.stream: int | None = None
+        self.held: deque[tuple[int, bytes]] = deque()
+        self.paused: bool = False
+        self.outgoing: bytearray = bytearray()
+        self.events: int = 0
+
+
+class SelectorServer(NetworkComponent):
+    """
+    Server that accepts any number of clients and multiplexes them on one thread.
+
+    All sockets are non-blocking and registered with a `selectors.DefaultSelector`
+    (epoll on Linux). Every connection has its own `Session` holding its decompression
+    context and receive buffer, so clients never block each other. Replies to a client, 
+    such as session welcomes and file acknowledgements, are queued on its session and 
+    written whenever its socket is writable, so a slow reader never blocks the loop; 
+    its connection is left unread while `MAX_OUTGOING` bytes of replies wait.
+
+    Clients introducing a session (see `session`) get the same handshake as from the 
+    single-client `Server`: the codecs are negotiated per session, and a session whose 
+    connection was lost is kept for `resume_timeout` seconds, so the client can resume 
+    it on a new connection. Files sent with `/send` are written to `download_dir`.
+
+    With `decode_workers`, messages are decompressed by a `DecodePool` instead of on the 
+    event loop, so the sessions are spread over that many cores. The loop then reads the 
+    sockets and delivers the messages the pool returns, in order per session. A connection 
+    whose worker holds `decode_queue` batches is left unread until the worker catches up, 
+    which pushes back on its client through TCP. A hello is answered once the messages 
+    before it are delivered, so the count it is answered with stays exact.
+
+    Attributes:
+        _backlog (int): The listen backlog of the server socket.
+        _close_on_exit (bool): Whether an 'exit' message toggles the shared connection state.
+        _selector (selectors.BaseSelector): The selector the sockets are registered with.
+        _sessions (dict[socket, Session]): The open sessions.
+        _resumable (dict[bytes, Session]): The sessions introduced by clients, by session id,
+                                           including those waiting to be resumed.
+        _resume_timeout (float): The seconds a lost session is kept.
+        _download_dir (str): The directory received files are written to.
+        _metrics (MetricsRegistry | None): The registry the codecs of the sessions record into, if any.
+        _pool (DecodePool | None): The workers decompressing the messages, None to decompress on the loop.
+        _streams (dict[int, Session]): The session of every decode pool stream.
+        _running (bool): Whether the event loop should keep running.
+
+    Methods:
+        start() -> None: Binds the server socket and runs the event loop.
+        handler() -> None: Runs the event loop until the server is closed.
+        deliver(session: Session, message: str) -> None: Handles a received message.
+        close() -> None: Closes every session and the server socket.
+    """
+    UTF8 = "utf-8"
+    POLL_INTERVAL = 0.5
+    MAX_OUTGOING = 64 * 1024
+
+    def __init__(self, host: str, port: int, conn: Connection,
+                       backlog: int = 1024, close_on_exit: bool = False,
+                       metrics: MetricsRegistry | None = None, download_dir: str = "received",
+                       resume_timeout: float = 15.0, decode_workers: int = 0,
+                       decode_queue: int = 64) -> None:
+        """
+        Initialize the SelectorServer object.
+
+        Args:
+            host (str): The host address on which the server listens for connections.
+            port (int): The port number on which the server listens for connections.
+            conn (Connection): The shared connection object for maintaining the connection state.
+            backlog (int, optional): The listen backlog. Default is 1024.
+            close_on_exit (bool, optional): Toggle the shared connection state when a peer sends
+                                            'exit', as the single-client Server does. Default is
+                                            False, which only ends that peer's session.
+            metrics (MetricsRegistry | None, optional): Registry to record the decompression of
+                                                        every message in. Default is None.
+            download_dir (str, optional): The directory files sent with `/send` are written to.
+                                          Default is "received".
+            resume_timeout (float, optional): Seconds to keep the session of a client whose
+                                              connection was lost. Default is 15.0.
+            decode_workers (int, optional): The number of processes decompressing the messages.
+                                            Default is 0, which decompresses on the event loop.
+            decode_queue (int, optional): The number of received batches a decode worker holds
+                                          before the connections it serves are left unread.
+                                          Default is 64.
+
+        The codecs of sessions decompressed by workers do not record into `metrics`.
+        """
+        super().__init__(host, port, conn)
+        self._socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
+        self._backlog: int = backlog
+        self._close_on_exit: bool = close_on_exit
+        self._selector: selectors.BaseSelector = selectors.DefaultSelector()
+        self._sessions: dict[socket, Session] = {}
+        self._resumable: dict[bytes, Session] = {}
+        self._resume_timeout: float = resume_timeout
+        self._download_dir: str = download_dir
+        self._metrics: MetricsRegistry | None = metrics
+        self._pool: DecodePool | None = DecodePool(decode_workers, decode_queue) if decode_workers else None
+        self._streams: dict[int, Session] = {}
+        self._running: bool = False
+
+    @property
+    def sessions(self) -> int:
+        """
+        Get the number of open sessions.
+
+        Returns:
+            int: The number of connected clients.
+        """
+        return len(self._sessions)
+
+    def start(self) -> None:
+        """
+        Bind the server socket, start listening, and run the event loop.
+
+        Raises:
+            sockerror: If the socket cannot be bound.
+        """
+        self._socket.bind(('0.0.0.0', self._port))
+        self._socket.listen(self._backlog)
+        self._socket.setblocking(False)
+        self._selector.register(self._socket, selectors.EVENT_READ)
+        if self._pool is not None:
+            self._pool.start()
+            self._selector.register(self._pool, selectors.EVENT_READ, self._pool)
+        print(f"Server listening on {self._host}:{self._port}")
+
+        self._running = True
+        self.handler()
+
+    def __accept(self) -> None:
+        """
+        Accept every pending connection and register it with its own session.
+        """
+        while True:
+            try:
+                client, addr = self._socket.accept()
+            except BlockingIOError:
+                return
+            client.setblocking(False)
+            session: Session = Session(client, addr, FileReceiver(self._download_dir))
+            self._sessions[client] = session
+            self.__update_events(session)
+            print(f"{str(addr)} connected")
+
+    def __end_session(self, session: Session, resumable: bool = False) -> None:
+        """
+        Unregister and close the socket of a session.
+
+        Args:
+            session (Session): The session.
+            resumable (bool, optional): Whether to keep the session for its client to resume.
+                                        Default is False, which forgets it.
+        """
+        if session.sock in self._sessions:
+            if session.events:
+                self._selector.unregister(session.sock)
+                session.events = 0
+            del self._sessions[session.sock]
+            session.sock.close()
+            session.files.close()
+        if session.session_id is not None and self._resumable.get(session.session_id) is session:
+            if resumable:
+                session.lost_at = monotonic()
+                return
+            del self._resumable[session.session_id]
+        self.__close_stream(session, drain=resumable)
+
+    def __close_stream(self, session: Session, drain: bool = False) -> None:
+        """
+        Drop the decode pool stream of a session, if it has one.
+
+        Args:
+            session (Session): The session.
+            drain (bool, optional): Still deliver the messages of the stream in the pool, e.g. those
+                                    received before a client without a session disconnected.
+                                    Default is False, which drops them.
+        """
+        if session.stream is not None:
+            self._pool.close_stream(session.stream)
+            if not (drain and self._pool.pending(session.stream)):
+                del self._streams[session.stream]
+            session.stream = None
+
+    def __open_session(self, session: Session, session_id: bytes, offered: list[tuple[int, int]],
+                       dictionary: int | None) -> bytearray:
+        """
+        Resume the session a client identified itself with, or start a new one on its connection.
+
+        Args:
+            session (Session): The connection the hello arrived on.
+            session_id (bytes): The id sent by the client.
+            offered (list[tuple[int, int]]): The ids and versions of the codecs the client offers.
+            dictionary (int | None): The id of the dictionary the client would prime a new session with.
+
+        Returns:
+            bytearray: The `SESSION_WELCOME` frame to answer with.
+
+        A session still open on another connection, which the client gave up on, is 
+        taken over from that connection.
+        """
+        if session.session_id not in (None, session_id) and self._resumable.get(session.session_id) is session:
+            del self._resumable[session.session_id]
+        previous: Session | None = self._resumable.get(session_id)
+        resumed: bool = previous is not None
+        if previous is None:
+            if dictionary is not None:
+                try:
+                    get_dictionary(dictionary)
+                except ValueError as e:
+                    print(f"{e}, the session is not primed")
+                    dictionary = None
+            session.codecs = MessageCodecs(negotiate(offered), self._metrics, dictionary)
+            session.primed = dictionary is not None
+            session.received = 0
+            if self._pool is not None:
+                self.__close_stream(session)
+                session.stream = self._pool.open(session.codecs.negotiated, dictionary)
+                self._streams[session.stream] = session
+        elif previous is not session:
+            if previous.sock in self._sessions:
+                self.__end_session(previous, resumable=True)
+            session.codecs, session.primed, session.received = previous.codecs, previous.primed, previous.received
+            if previous.stream is not None:
+                self.__close_stream(session)
+                session.stream, previous.stream = previous.stream, None
+                self._streams[session.stream] = session
+            if session.received:
+                print("Session resumed")
+        session.session_id = session_id
+        session.lost_at = None
+        self._resumable[session_id] = session
+        return encode_welcome(resumed, session.received, session.codecs.negotiated, session.primed)
+
+    def __update_events(self, session: Session) -> None:
+        """
+        Register the socket of a session for reading unless it is paused or too many replies wait, and for
+        writing while replies are queued.
+        """
+        reading: bool = not session.paused and len(session.outgoing) < SelectorServer.MAX_OUTGOING
+        events: int = (selectors.EVENT_READ if reading else 0) | \
+                      (selectors.EVENT_WRITE if session.outgoing else 0)
+        if events == session.events:
+            return
+        if not events:
+            self._selector.unregister(session.sock)
+        elif not session.events:
+            self._selector.register(session.sock, events, session)
+        else:
+            self._selector.modify(session.sock, events, session)
+        session.events = events
+
+    def __send(self, session: Session, frame: bytes | bytearray) -> None:
+        """
+        Queue a reply to the client of a session and write as much of the queue as the socket takes.
+
+        Raises:
+            sockerror: If the connection is lost.
+        """
+        session.outgoing += frame
+        self.__flush(session)
+
+    def __flush(self, session: Session) -> None:
+        """
+        Write the queued replies of a session until they are sent or the socket's buffer is full.
+
+        Raises:
+            sockerror: If the connection is lost.
+        """
+        while session.outgoing:
+            try:
+                sent: int = session.sock.send(session.outgoing)
+            except BlockingIOError:
+                break
+            del session.outgoing[:sent]
+        self.__update_events(session)
+
+    def __expire_sessions(self) -> None:
+        """
+        Forget the lost sessions that were not resumed within `resume_timeout`.
+        """
+        deadline: float = monotonic() - self._resume_timeout
+        for session_id, session in list(self._resumable.items()):
+            if session.lost_at is not None and session.lost_at < deadline:
+                del self._resumable[session_id]
+                self.__close_stream(session)
+
+    def __receive(self, session: Session) -> None:
+        """
+        Read whatever a readable connection has and handle every complete frame.
+        """
+        try:
+            received: int = session.reader.recv_from(session.sock)
+        except BlockingIOError:
+            return
+        except ConnectionError:
+            received = 0
+        if not received:
+            print("Peer has disconnected.")
+            self.__end_session(session, resumable=True)
+            return
+        self.__handle_frames(session, session.reader.frames())
+
+    def __write(self, session: Session) -> None:
+        """
+        Write the queued replies of a writable connection.
+        """
+        try:
+            self.__flush(session)
+        except sockerror as e:
+            print(f"Error handling client: {e}")
+            self.__end_session(session, resumable=True)
+
+    def __handle_frames(self, session: Session, frames: Iterable[tuple[int, memoryview | bytes]]) -> None:
+        """
+        Handle the frames received on a connection, in order.
+
+        Args:
+            session (Session): The session the frames arrived on.
+            frames (Iterable[tuple[int, memoryview | bytes]]): The frame types and payloads.
+
+        With a decode pool, the message frames are submitted to it as one batch, and the
+        connection is paused if a hello has to wait for messages still being decompressed,
+        or if its worker is full.
+        """
+        batch: list[tuple[int, bytes]] = []
+        try:
+            for frame_type, payload in frames:
+                if session.held or (frame_type == FrameType.SESSION_HELLO
+                                    and self.__hello_waits(session, payload, batch)):
+                    session.held.append((frame_type, bytes(payload)))
+                    continue
+                if frame_type == FrameType.SESSION_HELLO:
+                    self.__send(session, self.__open_session(session, *decode_hello(payload)))
+                    continue
+                if frame_type in FileReceiver.FRAME_TYPES:
+                    reply: bytearray | None = session.files.handle(frame_type, payload)
+                    if reply is not None:
+                        self.__send(session, reply)
+                    continue
+                if frame_type not in (FrameType.CODED_MESSAGE, FrameType.MESSAGE, FrameType.RAW_MESSAGE):
+                    continue
+                if frame_type == FrameType.CODED_MESSAGE and (session.codecs is None or not payload):
+                    raise ValueError("Coded message outside of a session")
+                if self._pool is not None:
+                    batch.append((frame_type, bytes(payload)))
+                    continue
+
+                if frame_type == FrameType.CODED_MESSAGE:
+                    data: bytes | bytearray = session.codecs.decode(payload[0], payload[1:])
+                elif frame_type == FrameType.MESSAGE:
+                    session.decompressor.feed(payload)
+                    data = session.decompressor.flush()
+                else:
+                    session.decompressor.feed_raw(payload)
+                    data = session.decompressor.flush()
+                if self.__deliver_message(session, str(data, SelectorServer.UTF8)):
+                    return
+        except ValueError as e:
+            print(f"Error handling client: {e}")
+            self.__end_session(session)
+            return
+        except sockerror as e:
+            print(f"Error handling client: {e}")
+            self.__end_session(session, resumable=True)
+            return
+        if self._pool is None:
+            return
+
+        if batch:
+            if session.stream is None:
+                session.stream = self._pool.open(None)
+                self._streams[session.stream] = session
+            self._pool.submit(session.stream, batch)
+        if not session.paused and (session.held or (session.stream is not None
+                                                    and not self._pool.has_room(session.stream))):
+            session.paused = True
+            self.__update_events(session)
+
+    def __hello_waits(self, session: Session, payload: memoryview | bytes, batch: list) -> bool:
+        """
+        Check whether a hello has to wait for messages of its connection or session still being decompressed.
+        """
+        if self._pool is None:
+            return False
+        if batch or (session.stream is not None and self._pool.pending(session.stream)):
+            return True
+        previous: Session | None = self._resumable.get(bytes(payload[:SESSION_ID_SIZE]))
+        return previous is not None and previous.stream is not None and self._pool.pending(previous.stream) > 0
+
+    def __deliver_message(self, session: Session, message: str) -> bool:
+        """
+        Count and deliver a decompressed message, ending the session on 'exit'.
+
+        Returns:
+            bool: Whether the session was ended.
+        """
+        session.received += 1
+        self.deliver(session, message)
+        if message != 'exit':
+            return False
+        print("Peer requested disconnection.")
+        self.__end_session(session)
+        if self._close_on_exit and self._conn.state:
+            self._conn.update_state()
+        return True
+
+    def __deliver_results(self) -> None:
+        """
+        Deliver the messages the decode pool returned, then serve the connections it held back.
+        """
+        for stream, messages, error in self._pool.collect():
+            session: Session | None = self._streams.get(stream)
+            if session is None:
+                continue
+            if session.stream != stream and not self._pool.pending(stream):
+                # The last messages of a closed stream.
+                del self._streams[stream]
+            if any(self.__deliver_message(session, message) for message in messages):
+                continue
+            if error is not None:
+                print(f"Error handling client: {error}")
+                self.__end_session(session)
+
+        for session in [session for session in self._sessions.values() if session.paused]:
+            if session.held and session.stream is not None and self._pool.pending(session.stream):
+                continue
+            held, session.held = session.held, deque()
+            if held:
+                self.__handle_frames(session, held)
+            if (session.sock in self._sessions and session.paused and not session.held
+                    and (session.stream is None or self._pool.has_room(session.stream))):
+                session.paused = False
+                self.__update_events(session)
+
+    def deliver(self, session: Session, message: str) -> None:
+        """
+        Handle a message received on a session. Displays it by default.
+
+        Args:
+            session (Session): The session the message arrived on.
+            message (str): The decompressed message.
+
+        Subclasses override this method to route messages elsewhere.
+        """
+        print(f"Received message: {message}")
+
+    def handler(self) -> None:
+        """
+        Run the event loop: accept new clients and serve readable ones until closed.
+
+        The selector is polled with a timeout so that `close()` from another thread
+        stops the loop promptly, and lost sessions expire between polls.
+        """
+        try:
+            while self._running:
+                self.__expire_sessions()
+                for key, events in self._selector.select(SelectorServer.POLL_INTERVAL):
+                    if not self._running:
+                        break
+                    if key.data is None:
+                        self.__accept()
+                    elif key.data is self._pool:
+                        self.__deliver_results()
+                    else:
+                        if events & selectors.EVENT_WRITE and key.data.sock in self._sessions:
+                            self.__write(key.data)
+                        if events & selectors.EVENT_READ and key.data.sock in self._sessions:
+                            self.__receive(key.data)
+        except sockerror as e:
+            print(f"Error in server: {e}")
+        finally:
+            self._running = False
+            self.__shutdown()
+
+    def __shutdown(self) -> None:
+        """
+        Close every session, the selector and the server socket.
+        """
+        for session in list(self._sessions.values()):
+            self.__end_session(session)
+        if self._socket:
+            self._selector.close()
+            self._socket.close()
+            self._socket = None
+        if self._pool is not None:
+            self._pool.close()
+
+    def close(self) -> None:
+        """
+        Stop the event loop and close every session and the server socket.
+
+        While the event loop runs, it does the cleanup itself within `POLL_INTERVAL`,
+        so sessions are never closed under its feet from another thread.
+        """
+        if self._running:
+            self._running = False
+        else:
+            self.__shutdown()
@@ -1,6 +1,18 @@
 from socket import socket, SOL_SOCKET, SO_REUSEADDR, error as sockerror, SHUT_RDWR
+from select import select
+from collections import deque
+from typing import Iterable
 from .network_component import NetworkComponent, Connection
-from PayloadCompression import Decompression
+from time import perf_counter_ns
+from .framing import FrameReader, FrameType
+from .file_transfer import FileReceiver
+from .codecs import MessageCodecs, negotiate
+from .decode_pool import DecodePool
+from .session import decode_hello, encode_welcome
+from .socket_options import SocketOptions
+from Metrics import MetricsRegistry
+from PayloadCompression import StreamDecompressor
+from PayloadCompression.Dictionary import get_dictionary
 
 class Server(NetworkComponent):
     """
@@ -8,17 +20,65 @@ class Server(NetworkComponent):
     decompresses them, and manages communication. The server uses a shared connection object
     to maintain the state of the connection.
 
+    A client identifies its session when it connects (see `session`). If its connection 
+    is lost without an 'exit' message, the server keeps the session's decompressor and 
+    waits up to `resume_timeout` seconds for the client to reconnect and resume it, 
+    instead of ending the chat. A new connection accepted while the old one still looks 
+    open replaces it, so a half-open connection does not block a resume. The messages of 
+    a session are written with the codecs agreed on when it was opened (see `codecs`). A 
+    session whose client announced a dictionary the server has loaded is decompressed 
+    with a primed table.
+
+    With `decode_workers`, the messages are decompressed by a `DecodePool` while the 
+    handler goes on reading the socket, so a large payload no longer holds up the reads 
+    behind it. The messages are displayed in order as the pool returns them. The 
+    connection is left unread while the worker holds `decode_queue` batches, which pushes 
+    back on the client through TCP, and a hello is answered once the messages before it 
+    are displayed.
+
     Attributes:
         conn (socket): The socket used for communication with the connected client.
-        _decompressor (Decompression): Instance of the Decompression class for decompressing messages.
+        _decompressor (StreamDecompressor): Decompressor of the messages of clients without a session.
+        _codecs (MessageCodecs | None): The codecs of the current session, keeping their state 
+                                        across messages and connections.
+        _primed (bool): Whether the Predictor of the current session is primed with a dictionary.
+        _session_id (bytes | None): The id of the current session, None for clients that do not send one.
+        _received (int): The number of messages of the session processed so far.
+        _greeted (bool): Whether the current connection identified its session.
+        _resume_timeout (float): The seconds to wait for a lost session to be resumed.
+        _reader (FrameReader): Parser of the frames received from the client.
+        _message_buffer (bytearray): Reusable buffer messages are decompressed into.
+        _files (FileReceiver): Writer of the files sent by the client.
+        _socket_options (SocketOptions | None): The options set on the listening and connected sockets.
+        _metrics (MetricsRegistry | None): The registry the codec and every received frame are recorded in, if any.
+        _pool (DecodePool | None): The workers decompressing the messages, None to decompress on the handler thread.
+        _stream (int | None): The decode pool stream of the current session or client.
+        _held (deque[tuple[int, bytes]]): Frames received after a hello that waits for the messages
+                                         before it to be decompressed.
+        _batches (dict[int, deque[tuple[int, list[int]]]]): The read time and payload sizes of every
+                                                            batch each stream has in the pool.
+        UTF8 (str): The encoding used to turn received bytes into messages.
 
     Methods:
         start() -> None: Starts the server, listens for incoming connections, and handles communication.
-        __decompress_data(data: bytearray) -> str: Decompresses incoming byte data into a string.
+        __accept(timeout: float | None) -> bool: Accepts a connection, replacing the current one.
+        __open_session(session_id: bytes, offered: list[tuple[int, int]], dictionary: int | None) -> bytearray:
+            Starts or resumes a session.
+        __decompress_data(frame_type: int, payload: memoryview) -> str: Decompresses a received frame into a string.
+        __handle_frames(frames: Iterable, received: int, received_at: int) -> bool: Handles received frames.
+        __deliver_results() -> bool: Displays the messages the decode pool returned.
         handler() -> None: Manages message reception and decompression in a loop.
         close() -> None: Closes the server connection and terminates the socket.
     """
-    def __init__(self, host: str, port: int, conn: Connection) -> None:
+    UTF8 = "utf-8"
+
+    def __init__(self, host: str, port: int, conn: Connection,
+                       metrics: MetricsRegistry | None = None,
+                       download_dir: str = "received",
+                       socket_options: SocketOptions | None = None,
+                       resume_timeout: float = 15.0,
+                       decode_workers: int = 0,
+                       decode_queue: int = 64) -> None:
         """
         Initialize the Server object with a host address, port number, and connection object.
 
@@ -26,11 +86,38 @@ class Server(NetworkComponent):
             host (str): The host address on which the server listens for connections.
             port (int): The port number on which the server listens for connections.
             conn (Connection): The shared connection object for maintaining the connection state.
+            metrics (MetricsRegistry | None, optional): Registry to record the reception and the
+                                                        decompression of every message in. Default is None.
+            download_dir (str, optional): The directory files sent with `/send` are written to.
+                                          Default is "received".
+            socket_options (SocketOptions | None, optional): Options to set on the sockets. Default
+                                                             is the operating system defaults.
+            resume_timeout (float, optional): Seconds to wait for a client whose connection was
+                                              lost to resume its session. Default is 15.0.
+            decode_workers (int, optional): The number of processes decompressing the messages.
+                                            Default is 0, which decompresses on the handler thread.
+            decode_queue (int, optional): The number of received batches the decode workers hold
+                                          before the connection is left unread. Default is 64.
 
         The server socket is set up to reuse the same address to avoid binding issues during restart.
         """
         self.conn: socket = None
-        self._decompressor: Decompression = Decompression()
+        self._metrics: MetricsRegistry | None = metrics
+        self._decompressor: StreamDecompressor = StreamDecompressor(metrics)
+        self._codecs: MessageCodecs | None = None
+        self._primed: bool = False
+        self._session_id: bytes | None = None
+        self._received: int = 0
+        self._greeted: bool = False
+        self._resume_timeout: float = resume_timeout
+        self._reader: FrameReader = FrameReader()
+        self._message_buffer: bytearray = bytearray(1024)
+        self._files: FileReceiver = FileReceiver(download_dir)
+        self._socket_options: SocketOptions | None = socket_options
+        self._pool: DecodePool | None = DecodePool(decode_workers, decode_queue) if decode_workers else None
+        self._stream: int | None = None
+        self._held: deque[tuple[int, bytes]] = deque()
+        self._batches: dict[int, deque[tuple[int, list[int]]]] = {}
         super().__init__(host, port, conn)
         self._socket.setsockopt(SOL_SOCKET, SO_REUSEADDR, 1)
 
@@ -38,72 +125,346 @@ class Server(NetworkComponent):
         """
         Start the server, bind to the specified address, and listen for incoming connections.
 
-        This method binds the server socket to a port, listens for incoming client connections, 
-        and accepts the connection. Once a client connects, it calls the `handler()` method 
-        to process incoming messages.
+        This method applies the socket options, binds the server socket to a port, listens for 
+        incoming client connections, and accepts the connection. Once a client connects, it 
+        calls the `handler()` method to process incoming messages.
 
         Raises:
             sockerror: If there is an error during binding or connection.
         """
         try:
+            if self._socket_options is not None:
+                self._socket_options.apply(self._socket)
             self._socket.bind(('0.0.0.0', self._port))
             self._socket.listen(1)
             print(f"Server listening on {self._host}:{self._port}")
 
-            self.conn, addr = self._socket.accept()
-            print(f"{str(addr)} connected")
+            self.__accept(None)
             self.handler()
         except sockerror as e:
             if e.winerror != 10038:
                 print(f"Error in server: {e}")
             self._conn.update_state()
 
-    def __decompress_data(self, data: bytearray) -> str:
+    def __accept(self, timeout: float | None) -> bool:
         """
-        Decompress the incoming byte data into a readable string.
+        Accept a connection, replacing the current one if there is any.
 
         Args:
-            data (bytearray): The compressed data received from the client.
+            timeout (float | None): Seconds to wait for the connection, None to wait indefinitely.
 
         Returns:
-            str: The decompressed message or None if the peer has disconnected.
+            bool: Whether a connection was accepted.
 
-        This method decompresses the byte data using the Decompression class. If the data 
-        is empty (indicating the client has disconnected), it updates the connection state 
-        and returns None.
+        The frame reader starts over, dropping a partial frame of the replaced connection, 
+        and the file being received, if any, is closed so the sender can resume it.
         """
-        if not data:
-            self._conn.update_state()
-            print("Peer has disconnected.")
-            return None
+        listener: socket | None = self._socket
+        if listener is None or (timeout is not None and not select([listener], [], [], timeout)[0]):
+            return False
+        conn, addr = listener.accept()
+        if self.conn is not None:
+            self.conn.close()
+        self.conn = conn
+        if self._socket_options is not None:
+            self._socket_options.apply(self.conn)
+        self._reader = FrameReader()
+        self._greeted = False
+        self._held.clear()
+        self._files.close()
+        print(f"{str(addr)} connected")
+        return True
+
+    def __open_session(self, session_id: bytes, offered: list[tuple[int, int]],
+                       dictionary: int | None) -> bytearray:
+        """
+        Resume the session a client identified itself with, or start a new one.
+
+        Args:
+            session_id (bytes): The id sent by the client.
+            offered (list[tuple[int, int]]): The ids and versions of the codecs the client offers.
+            dictionary (int | None): The id of the dictionary the client would prime a new session with.
 
-        decompressed_message: str = self._decompressor.payload_decompression(data)
+        Returns:
+            bytearray: The `SESSION_WELCOME` frame to answer with.
+
+        A new session uses the offered codecs registered here at the same version. It is 
+        primed with the client's dictionary only if that is loaded here; otherwise both 
+        ends fall back to a blank guess table.
+        """
+        resumed: bool = session_id == self._session_id
+        if not resumed:
+            if dictionary is not None:
+                try:
+                    get_dictionary(dictionary)
+                except ValueError as e:
+                    print(f"{e}, the session is not primed")
+                    dictionary = None
+            self._session_id = session_id
+            self._codecs = MessageCodecs(negotiate(offered), self._metrics, dictionary)
+            self._primed = dictionary is not None
+            self._received = 0
+            if self._pool is not None:
+                self.__close_stream()
+                self._stream = self._pool.open(self._codecs.negotiated, dictionary)
+        elif self._received and not self._greeted:
+            print("Session resumed")
+        self._greeted = True
+        return encode_welcome(resumed, self._received, self._codecs.negotiated, self._primed)
+
+    def __decompress_data(self, frame_type: int, payload: memoryview) -> str:
+        """
+        Decompress the payload of a message frame into a readable string.
+
+        Args:
+            frame_type (int): `FrameType.CODED_MESSAGE`, or for clients without a session
+                              `FrameType.MESSAGE`, or `FrameType.RAW_MESSAGE` for a raw packet.
+            payload (memoryview): The compressed packet, viewed in place in the receive buffer.
+
+        Returns:
+            str: The decompressed message.
+
+        Raises:
+            ValueError: If the codec was not negotiated or the payload is corrupt.
+
+        Coded messages are decompressed by the session's codecs. Other packets are fed to 
+        the stream decompressor, whose result is moved into the reusable message buffer.
+        """
+        if frame_type == FrameType.CODED_MESSAGE:
+            if self._codecs is None or not payload:
+                raise ValueError("Coded message outside of a session")
+            return str(self._codecs.decode(payload[0], payload[1:]), encoding=Server.UTF8)
+        if frame_type == FrameType.RAW_MESSAGE:
+            self._decompressor.feed_raw(payload)
+        else:
+            self._decompressor.feed(payload)
+        if len(self._message_buffer) < self._decompressor.pending:
+            self._message_buffer = bytearray(self._decompressor.pending)
+
+        size: int = self._decompressor.flush_into(self._message_buffer)
+        decompressed_message: str = str(memoryview(self._message_buffer)[:size], 
+                                        encoding=Server.UTF8)
         return decompressed_message
 
+    def __record_message(self, payload_bytes: int, latency_ns: int) -> None:
+        """
+        Record a received message in the metrics registry.
+
+        Args:
+            payload_bytes (int): The size of the compressed packet.
+            latency_ns (int): The time from the read that completed the frame to the
+                              display of the message, in nanoseconds.
+        """
+        self._metrics.counter("server.messages").inc()
+        self._metrics.histogram("server.recv_ns").observe(latency_ns)
+        self._metrics.publish("server", payload_bytes=payload_bytes, recv_ns=latency_ns)
+
+    def __record_read(self, received: int, frames: int) -> None:
+        """
+        Record a read from the socket in the metrics registry.
+
+        Args:
+            received (int): The number of bytes read.
+            frames (int): The number of message frames the read completed.
+        """
+        self._metrics.counter("server.wire_bytes").inc(received)
+        self._metrics.histogram("server.frames_per_read").observe(frames)
+        self._metrics.gauge("server.buffered_bytes").set(self._reader.buffered)
+
+    def __close_stream(self) -> None:
+        """
+        Drop the decode pool stream of the current session or client, if there is one.
+        """
+        if self._stream is not None:
+            self._pool.close_stream(self._stream)
+            self._stream = None
+
+    def __deliver_message(self, message: str, payload_bytes: int, received_at: int) -> bool:
+        """
+        Count and display a decompressed message.
+
+        Args:
+            message (str): The message.
+            payload_bytes (int): The size of its compressed packet.
+            received_at (int): When the read that completed its frame returned, in `perf_counter_ns` time.
+
+        Returns:
+            bool: Whether the message was 'exit', which ends the chat.
+        """
+        self._received += 1
+        print(f"Received message: {message}")
+        if self._metrics is not None:
+            self.__record_message(payload_bytes, perf_counter_ns() - received_at)
+        if message != 'exit':
+            return False
+        print("Peer requested disconnection.")
+        self._conn.update_state()
+        print("Press Enter to exit")
+        return True
+
+    def __handle_frames(self, frames: Iterable[tuple[int, memoryview | bytes]], received: int,
+                        received_at: int) -> bool:
+        """
+        Handle the frames of a read, or the frames held back behind a hello, in order.
+
+        Args:
+            frames (Iterable[tuple[int, memoryview | bytes]]): The frame types and payloads.
+            received (int): The number of bytes read, 0 for held frames.
+            received_at (int): When the read returned, in `perf_counter_ns` time.
+
+        Returns:
+            bool: Whether a message was 'exit', which ends the chat.
+
+        Raises:
+            ValueError: If a message is corrupt or a coded message arrives outside of a session.
+
+        With a decode pool, the message frames are submitted to it as one batch, and a 
+        hello waiting for earlier messages holds back every frame after it.
+        """
+        frames_handled: int = 0
+        batch: list[tuple[int, bytes]] = []
+        for frame_type, payload in frames:
+            if self._pool is not None and (self._held or (frame_type == FrameType.SESSION_HELLO and (
+                    batch or (self._stream is not None and self._pool.pending(self._stream))))):
+                self._held.append((frame_type, bytes(payload)))
+                continue
+            if frame_type == FrameType.SESSION_HELLO:
+                self.conn.sendall(self.__open_session(*decode_hello(payload)))
+                continue
+            if frame_type in FileReceiver.FRAME_TYPES:
+                reply: bytearray | None = self._files.handle(frame_type, payload)
+                if reply is not None:
+                    self.conn.sendall(reply)
+                continue
+            if frame_type not in (FrameType.CODED_MESSAGE, FrameType.MESSAGE, FrameType.RAW_MESSAGE):
+                continue
+            if not self._greeted and self._session_id is not None:
+                # A client without a session followed one with a session.
+                self._session_id = None
+                self._codecs = None
+                self._decompressor = StreamDecompressor(self._metrics)
+                if self._pool is not None:
+                    self.__close_stream()
+
+            frames_handled += 1
+            if self._pool is None:
+                message: str = self.__decompress_data(frame_type, payload)
+                if self.__deliver_message(message, len(payload), received_at):
+                    if self._metrics is not None:
+                        self.__record_read(received, frames_handled)
+                    return True
+                continue
+            if frame_type == FrameType.CODED_MESSAGE and (self._codecs is None or not payload):
+                raise ValueError("Coded message outside of a session")
+            batch.append((frame_type, bytes(payload)))
+
+        if batch:
+            if self._stream is None:
+                self._stream = self._pool.open(None)
+            self._pool.submit(self._stream, batch)
+            self._batches.setdefault(self._stream, deque()).append(
+                (received_at, [len(payload) for _, payload in batch]))
+        if self._metrics is not None and received:
+            self.__record_read(received, frames_handled)
+        return False
+
+    def __deliver_results(self) -> bool:
+        """
+        Display the messages the decode pool returned, then handle the frames held back, if they may go on.
+
+        Returns:
+            bool: Whether a message was 'exit', which ends the chat.
+
+        Raises:
+            ValueError: If a batch could not be decompressed.
+        """
+        for stream, messages, error in self._pool.collect():
+            batches: deque[tuple[int, list[int]]] = self._batches[stream]
+            received_at, sizes = batches.popleft()
+            if not batches:
+                del self._batches[stream]
+            for message, size in zip(messages, sizes):
+                if self.__deliver_message(message, size, received_at):
+                    return True
+            if error is not None:
+                raise ValueError(error)
+        if self._held and not (self._stream is not None and self._pool.pending(self._stream)):
+            held, self._held = self._held, deque()
+            return self.__handle_frames(held, 0, perf_counter_ns())
+        return False
+
     def handler(self) -> None:
         """
         Handle incoming messages from the client, decompress them, and display the messages.
 
-        This method continuously receives compressed data from the client, decompresses the 
-        data, and displays the messages. If the client sends an 'exit' message, the connection 
-        is terminated, and the handler exits.
+        This method continuously receives data from the client into the frame reader and 
+        decompresses and displays every complete message frame, however the frames were 
+        split or coalesced by TCP. If the client sends an 'exit' message, or disconnects and 
+        does not resume its session in time, the connection is terminated, and the handler 
+        exits. Session frames are answered with the state of the session, and file frames are 
+        passed to the file receiver; both replies are sent back over the same connection.
+
+        With a decode pool, the handler waits for the pool as well as the sockets, and stops 
+        reading the connection while the frames of a read are held back or the worker is 
+        full. When the connection is lost, the messages still in the pool are displayed 
+        before the session waits to be resumed; held frames are dropped, and a resuming 
+        client sends them again.
+
+        When a metrics registry was given, every read and every message is recorded: the
+        bytes received, how many frames a read delivered, the bytes left waiting for the 
+        rest of a frame, and the latency from the read to the display of each message.
         """
         try:
+            if self._pool is not None:
+                self._pool.start()
             while True:
-                compressed_data: bytearray = self.conn.recv(1024)
-
-                message:str = self.__decompress_data(compressed_data)
-                print(f"Received message: {message}")
-
-                if message == 'exit':
-                    print("Peer requested disconnection.")
+                listener, conn = self._socket, self.conn
+                if listener is None or conn is None:
+                    break
+                watched: list = [conn, listener]
+                if self._pool is not None:
+                    if self._held or (self._stream is not None and not self._pool.has_room(self._stream)):
+                        watched.remove(conn)
+                    watched.append(self._pool)
+                ready: list = select(watched, [], [])[0]
+                if self._pool is not None and self._pool in ready:
+                    if self.__deliver_results():
+                        return
+                    continue
+                if listener in ready:
+                    self.__accept(0)
+                    continue
+                try:
+                    received: int = self._reader.recv_from(conn)
+                except ConnectionError:
+                    received = 0
+                if not received:
+                    if self._pool is not None:
+                        self._held.clear()
+                        while self._batches:
+                            select([self._pool], [], [])
+                            if self.__deliver_results():
+                                return
+                    if not self._conn.state:
+                        # The node is closing, and the peer answered its 'exit' by leaving too.
+                        break
+                    if self._session_id is not None:
+                        print("Connection to peer lost, waiting for it to reconnect...")
+                        if self.__accept(self._resume_timeout):
+                            continue
                     self._conn.update_state()
-                    print("Press Enter to exit")
+                    print("Peer has disconnected.")
                     break
-        except sockerror as e:
-            # This error occurs when `close()` is called while blocked in `recv()`
-            if e.winerror != 10038:
+                if self.__handle_frames(self._reader.frames(), received, perf_counter_ns()):
+                    return
+        except (sockerror, ValueError) as e:
+            # These errors occur when `close()` is called while blocked in `select()` or `recv()`
+            if self._conn.state:
                 print(f"Error handling client: {e}")
+        finally:
+            self._files.close()
+            if self._pool is not None:
+                self._pool.close()
 
     def close(self) -> None:
         """
@@ -0,0 +1,415 @@
+"""
+Connection setup and session resumption between a `Client` and a `Server`.
+
+Every connection of a client starts with a `SESSION_HELLO` frame carrying the
+session id, random bytes chosen by the client for the lifetime of its stream. The
+server answers with a `SESSION_WELCOME` frame, `flags | varint(received)`: whether
+it still holds the decompression context of that session, and how many messages
+of it it has processed. A client reconnecting after a dropped connection only
+resends the compressed frames the server did not process, and both ends carry on
+with the guess tables they had, so nothing before them is sent again. A hello on
+a connection whose session is already open is answered the same way, which makes it
+an acknowledgement of every message processed up to then.
+
+The hello also offers the id and version of every codec the client registered,
+`session_id | count | (id, version) * count`, and the welcome ends with those the
+server accepted in the same form; messages of the session only use those (see `codecs`).
+
+A client with a dictionary (see `PayloadCompression.Dictionary`) appends its id to
+the hello. The server primes the decompressor of a new session with it if it
+has loaded the same dictionary, and tells the client in the `primed` bit of the
+welcome, so the first message of the session is already predicted from it; the
+client compresses with a blank table otherwise.
+
+The frames of a session are built by a `SessionStream`. Several clients may share
+one stream, e.g. the connections of a mesh node to all of its peers: every message
+is then compressed once and the same frame is written to every peer, each of whose
+servers keeps its own copy of the session. A peer joining after the first messages
+is sent the kept frames from the start of the session, so its decompressor catches up.
+
+Attributes:
+    SESSION_ID_SIZE (int): The length of a session id in bytes.
+    RESUMED (int): The welcome flag telling that the session was resumed.
+    PRIMED (int): The welcome flag telling that the session is primed with the client's dictionary.
+"""
+import errno
+import os
+import random
+import threading
+from collections import deque
+from select import select
+from socket import socket, AF_INET, SOCK_STREAM, SOL_SOCKET, SO_ERROR
+from typing import Iterator
+
+from Metrics import MetricsRegistry
+from PayloadCompression.Dictionary import ID_SIZE
+from PayloadCompression.varint import decode_varint, encode_varint, varint_size
+from .codecs import MessageCodecs, offer
+from .framing import FRAME_HEADER_MAX, FrameType, encode_frame, prepend_frame_header
+from .socket_options import SocketOptions
+
+SESSION_ID_SIZE: int = 16
+RESUMED: int = 0x01
+PRIMED: int = 0x02
+
+_IN_PROGRESS: frozenset[int] = frozenset(code for code in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY,
+                                                           getattr(errno, "WSAEWOULDBLOCK", 0)))
+
+
+class Backoff:
+    """
+    Delays between connection attempts: none before the first, then growing exponentially.
+
+    Each delay is drawn from the upper half of its exponential step, so attempts of
+    many clients spread out without any of them retrying much sooner than planned.
+
+    Attributes:
+        _base (float): The step of the second attempt in seconds.
+        _cap (float): The largest step in seconds.
+
+    Methods:
+        __iter__() -> Iterator[float]: Yields the delay before every attempt, forever.
+    """
+    def __init__(self, base: float, cap: float) -> None:
+        """
+        Initialize the Backoff object.
+
+        Args:
+            base (float): The step of the second attempt in seconds, doubled for every further attempt.
+            cap (float): The largest step in seconds.
+        """
+        self._base: float = base
+        self._cap: float = cap
+
+    def __iter__(self) -> Iterator[float]:
+        yield 0.0
+        step: float = self._base
+        while True:
+            step = min(step, self._cap)
+            yield random.uniform(step / 2, step)
+            step *= 2
+
+
+class SessionStream:
+    """
+    The compressed frames of a session, built once for every connection carrying them.
+
+    A stream starts out with every registered codec, primed with its dictionary. A
+    connection whose server agreed on the same codecs and priming can carry it; a
+    private stream is instead `restart`ed with whatever its single server agreed on.
+
+    Attributes:
+        UTF8 (str): The encoding used to turn messages into bytes.
+        shared (bool): Whether several connections carry the stream.
+        _session_id (bytes): The id the servers know the decompression context of the stream by.
+        _dictionary (int | None): The id of the dictionary new sessions are primed with, if the server has it.
+        _primed (bool): Whether the codecs of the stream are primed with the dictionary.
+        _codecs (MessageCodecs): The codecs of the stream, keeping their state across messages.
+        _metrics (MetricsRegistry | None): The registry the codecs record their choices in, if any.
+        _link_rate (float): The transmission rate in bytes per second the codec choice assumes.
+        _send_buffer (bytearray): Reusable buffer the compressed messages are written into.
+        _history (deque[bytes]): The most recent frames of the stream, to resend after a reconnect.
+        _history_bytes (int): The size of the frames in `_history`.
+        _resume_buffer (int): The largest size of `_history` in bytes.
+        _framed (int): The number of message frames of the stream built so far.
+        _lock (threading.Lock): Serializes framing with the readers of the history.
+
+    Methods:
+        session_id -> bytes: The id of the session.
+        dictionary -> int | None: The id of the dictionary the session would be primed with.
+        framed -> int: The number of frames built so far.
+        hello() -> bytearray: The `SESSION_HELLO` frame introducing the stream.
+        frame(msg: str) -> tuple[int, bytes]: Compresses a message into its frame.
+        unsent(received: int) -> tuple[int, list[bytes]] | None: The kept frames a server did not process.
+        accepts(codecs: list[tuple[int, int]], primed: bool) -> bool: Whether a server can follow the stream.
+        restart() -> None: Starts a new session, dropping the history.
+        use(codecs: list[tuple[int, int]], primed: bool) -> None: Sets the codecs of a stream with no frames yet.
+    """
+    UTF8 = "utf-8"
+
+    def __init__(self, metrics: MetricsRegistry | None = None, dictionary: int | None = None,
+                 resume_buffer: int = 4 * 1024 * 1024, link_rate: float = MessageCodecs.LINK_RATE,
+                 shared: bool = False) -> None:
+        """
+        Initialize the SessionStream object.
+
+        Args:
+            metrics (MetricsRegistry | None, optional): Registry to record the codec choices in.
+                                                        Default is None.
+            dictionary (int | None, optional): The id of a loaded dictionary to prime the session
+                                               with. Default is None, a blank guess table.
+            resume_buffer (int, optional): The bytes of recent frames kept to resume the session
+                                           or catch up a late peer. Default is 4 MiB.
+            link_rate (float, optional): The transmission rate in bytes per second weighed against
+                                         compression time when choosing a codec. Default is 1 Mbit/s.
+            shared (bool, optional): Whether several connections carry the stream. Default is False.
+        """
+        self.shared: bool = shared
+        self._session_id: bytes = os.urandom(SESSION_ID_SIZE)
+        self._dictionary: int | None = dictionary
+        self._primed: bool = dictionary is not None
+        self._metrics: MetricsRegistry | None = metrics
+        self._link_rate: float = link_rate
+        self._codecs: MessageCodecs = MessageCodecs(offer(), metrics, dictionary, link_rate)
+        self._send_buffer: bytearray = bytearray(1024)
+        self._history: deque[bytes] = deque()
+        self._history_bytes: int = 0
+        self._resume_buffer: int = resume_buffer
+        self._framed: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+    @property
+    def session_id(self) -> bytes:
+        """
+        Get the id of the session.
+
+        Returns:
+            bytes: The `SESSION_ID_SIZE` random bytes identifying the session.
+        """
+        return self._session_id
+
+    @property
+    def dictionary(self) -> int | None:
+        """
+        Get the dictionary the session would be primed with.
+
+        Returns:
+            int | None: The id of the dictionary, None for a blank guess table.
+        """
+        return self._dictionary
+
+    @property
+    def framed(self) -> int:
+        """
+        Get the number of frames built so far.
+
+        Returns:
+            int: The number of messages of the session.
+        """
+        return self._framed
+
+    def hello(self) -> bytearray:
+        """
+        Build the `SESSION_HELLO` frame introducing the stream on a new connection.
+
+        Returns:
+            bytearray: The frame offering every registered codec and the dictionary.
+        """
+        return encode_hello(self._session_id, offer(), self._dictionary)
+
+    def frame(self, msg: str) -> tuple[int, bytes]:
+        """
+        Compress a message into a coded message frame and keep it in the history.
+
+        Args:
+            msg (str): The message.
+
+        Returns:
+            tuple: The number of frames of the session including this one, and the frame.
+
+        Raises:
+            ValueError: If the message is empty.
+
+        The codec id and the payload are written into the reusable send buffer behind 
+        room for the frame header, so the frame is copied out of it once. The history 
+        drops its oldest frames once it exceeds `resume_buffer` bytes.
+        """
+        data: bytes = msg.encode(SessionStream.UTF8)
+        if not data:
+            raise ValueError("Empty payload passed to compressor")
+        with self._lock:
+            codec_id, payload = self._codecs.encode(data)
+            length: int = 1 + len(payload)
+            if len(self._send_buffer) < FRAME_HEADER_MAX + length:
+                self._send_buffer = bytearray(FRAME_HEADER_MAX + length)
+            send_view: memoryview = memoryview(self._send_buffer)
+            send_view[FRAME_HEADER_MAX] = codec_id
+            send_view[FRAME_HEADER_MAX + 1:FRAME_HEADER_MAX + length] = payload
+            start: int = prepend_frame_header(send_view, FRAME_HEADER_MAX, FrameType.CODED_MESSAGE, length)
+            frame: bytes = bytes(send_view[start:FRAME_HEADER_MAX + length])
+            self._history.append(frame)
+            self._history_bytes += len(frame)
+            self._framed += 1
+            while self._history_bytes > self._resume_buffer:
+                self._history_bytes -= len(self._history.popleft())
+            return self._framed, frame
+
+    def unsent(self, received: int) -> tuple[int, list[bytes]] | None:
+        """
+        Get the kept frames after the first `received` ones.
+
+        Args:
+            received (int): The number of frames a server processed.
+
+        Returns:
+            tuple | None: The number of frames of the session so far and the frames after
+                          `received`, or None if some of those are no longer kept.
+        """
+        with self._lock:
+            oldest: int = self._framed - len(self._history)
+            if not oldest <= received <= self._framed:
+                return None
+            return self._framed, list(self._history)[received - oldest:]
+
+    def accepts(self, codecs: list[tuple[int, int]], primed: bool) -> bool:
+        """
+        Check whether a server that agreed on the given codecs can decode the stream.
+
+        Args:
+            codecs (list[tuple[int, int]]): The codecs the server accepted.
+            primed (bool): Whether the server primed the session with the dictionary.
+        """
+        return primed == self._primed and set(self._codecs.negotiated) <= set(codecs)
+
+    def restart(self) -> None:
+        """
+        Start a new session with a new id, dropping the frames of the old one.
+        """
+        with self._lock:
+            self._session_id = os.urandom(SESSION_ID_SIZE)
+            self._history.clear()
+            self._history_bytes = 0
+            self._framed = 0
+
+    def use(self, codecs: list[tuple[int, int]], primed: bool) -> None:
+        """
+        Set the codecs of a session no frame was built for yet.
+
+        Args:
+            codecs (list[tuple[int, int]]): The codecs the server accepted.
+            primed (bool): Whether the server primed the session with the dictionary.
+        """
+        with self._lock:
+            self._primed = primed
+            self._codecs = MessageCodecs(codecs, self._metrics, self._dictionary if primed else None,
+                                         self._link_rate)
+
+
+def connect(address: tuple[str, int], timeout: float, options: SocketOptions | None = None) -> socket:
+    """
+    Open a TCP connection with a non-blocking connect bounded by `timeout`.
+
+    Args:
+        address (tuple): The host and port to connect to.
+        timeout (float): The seconds to wait for the connection to be established.
+        options (SocketOptions | None, optional): Options set on the socket before connecting.
+
+    Returns:
+        socket: The connected socket, in blocking mode.
+
+    Raises:
+        TimeoutError: If the connection is not established within `timeout`.
+        OSError: If the connection fails, e.g. `ConnectionRefusedError`.
+    """
+    sock: socket = socket(AF_INET, SOCK_STREAM)
+    try:
+        if options is not None:
+            options.apply(sock)
+        sock.setblocking(False)
+        error: int = sock.connect_ex(address)
+        if error not in _IN_PROGRESS:
+            raise OSError(error, os.strerror(error))
+        if error:
+            _, writable, failed = select([], [sock], [sock], timeout)
+            if not writable and not failed:
+                raise TimeoutError("Connection timed out")
+            error = sock.getsockopt(SOL_SOCKET, SO_ERROR)
+            if error:
+                raise OSError(error, os.strerror(error))
+        sock.setblocking(True)
+        return sock
+    except BaseException:
+        sock.close()
+        raise
+
+
+def _encode_codecs(codecs: list[tuple[int, int]]) -> bytes:
+    """
+    Encode a list of codec ids and versions as `count | (id, version) * count`.
+    """
+    return bytes([len(codecs)] + [byte for codec in codecs for byte in codec])
+
+
+def _decode_codecs(payload: memoryview, offset: int) -> tuple[list[tuple[int, int]], int]:
+    """
+    Read a list of codec ids and versions.
+
+    Returns:
+        tuple: The ids and versions, and the offset just past them.
+
+    Raises:
+        ValueError: If the list is truncated.
+    """
+    if len(payload) <= offset:
+        return [], offset
+    end: int = offset + 1 + 2 * payload[offset]
+    if len(payload) < end:
+        raise ValueError("Truncated codec list")
+    return [(payload[i], payload[i + 1]) for i in range(offset + 1, end, 2)], end
+
+
+def encode_hello(session_id: bytes, codecs: list[tuple[int, int]], dictionary: int | None = None) -> bytearray:
+    """
+    Build the `SESSION_HELLO` frame opening a connection of a session.
+
+    Args:
+        session_id (bytes): The id of the session.
+        codecs (list[tuple[int, int]]): The id and version of every codec the client offers.
+        dictionary (int | None, optional): The id of the dictionary the client would prime the session with.
+    """
+    payload: bytes = session_id + _encode_codecs(codecs)
+    if dictionary is not None:
+        payload += dictionary.to_bytes(ID_SIZE, "big")
+    return encode_frame(FrameType.SESSION_HELLO, payload)
+
+
+def decode_hello(payload: memoryview) -> tuple[bytes, list[tuple[int, int]], int | None]:
+    """
+    Read a `SESSION_HELLO` payload.
+
+    Returns:
+        tuple: The session id, the offered codecs, and the id of the client's dictionary,
+               None if it has none.
+
+    Raises:
+        ValueError: If the payload is truncated.
+    """
+    if len(payload) < SESSION_ID_SIZE:
+        raise ValueError("Truncated session id")
+    codecs, offset = _decode_codecs(payload, SESSION_ID_SIZE)
+    if len(payload) < offset + ID_SIZE:
+        return bytes(payload[:SESSION_ID_SIZE]), codecs, None
+    return bytes(payload[:SESSION_ID_SIZE]), codecs, int.from_bytes(payload[offset:offset + ID_SIZE], "big")
+
+
+def encode_welcome(resumed: bool, received: int, codecs: list[tuple[int, int]], primed: bool = False) -> bytearray:
+    """
+    Build the `SESSION_WELCOME` frame answering a `SESSION_HELLO`.
+
+    Args:
+        resumed (bool): Whether the server still held the session.
+        received (int): The number of messages of the session it has processed.
+        codecs (list[tuple[int, int]]): The id and version of every codec the session may use.
+        primed (bool, optional): Whether the session is primed with the client's dictionary.
+    """
+    payload: bytearray = bytearray(1 + varint_size(received))
+    payload[0] = (RESUMED if resumed else 0) | (PRIMED if primed else 0)
+    encode_varint(received, payload, 1)
+    payload += _encode_codecs(codecs)
+    return encode_frame(FrameType.SESSION_WELCOME, payload)
+
+
+def decode_welcome(payload: memoryview) -> tuple[bool, int, bool, list[tuple[int, int]]]:
+    """
+    Read a `SESSION_WELCOME` payload.
+
+    Returns:
+        tuple: Whether the session was resumed, the number of its messages the server
+               processed, whether it is primed with the client's dictionary, and the
+               codecs the session may use.
+
+    Raises:
+        ValueError: If the payload is truncated.
+    """
+    received, offset = decode_varint(payload, 1)
+    return bool(payload[0] & RESUMED), received, bool(payload[0] & PRIMED), _decode_codecs(payload, offset)[0]
@@ -0,0 +1,106 @@
+import socket as sockets
+from socket import socket
+
+
+class SocketOptions:
+    """
+    TCP socket options of a node, read from the "socket" object of its JSON file.
+
+    Options left out keep the operating system defaults. Keepalive timings the
+    platform does not support are skipped.
+
+    Attributes:
+        KEYS (tuple[str, ...]): The keys accepted in the JSON object.
+        nodelay (bool | None): Whether to disable Nagle's algorithm (`TCP_NODELAY`).
+        sndbuf (int | None): The size of the kernel send buffer (`SO_SNDBUF`).
+        rcvbuf (int | None): The size of the kernel receive buffer (`SO_RCVBUF`).
+        keepalive (bool | None): Whether to probe idle connections (`SO_KEEPALIVE`).
+        keepalive_idle (int | None): Idle seconds before the first probe (`TCP_KEEPIDLE`).
+        keepalive_interval (int | None): Seconds between probes (`TCP_KEEPINTVL`).
+        keepalive_count (int | None): Unanswered probes before the connection is dropped (`TCP_KEEPCNT`).
+
+    Methods:
+        from_dict(options: dict) -> SocketOptions: Reads the options from a parsed JSON object.
+        apply(sock: socket) -> None: Sets the options on a socket.
+    """
+    KEYS: tuple[str, ...] = ("tcp_nodelay", "sndbuf", "rcvbuf", "keepalive",
+                             "keepalive_idle", "keepalive_interval", "keepalive_count")
+
+    def __init__(self, nodelay: bool | None = None, sndbuf: int | None = None, rcvbuf: int | None = None,
+                 keepalive: bool | None = None, keepalive_idle: int | None = None,
+                 keepalive_interval: int | None = None, keepalive_count: int | None = None) -> None:
+        """
+        Initialize the SocketOptions object.
+
+        Args:
+            nodelay (bool | None, optional): Whether to set `TCP_NODELAY`.
+            sndbuf (int | None, optional): The send buffer size in bytes.
+            rcvbuf (int | None, optional): The receive buffer size in bytes.
+            keepalive (bool | None, optional): Whether to set `SO_KEEPALIVE`.
+            keepalive_idle (int | None, optional): Idle seconds before the first keepalive probe.
+            keepalive_interval (int | None, optional): Seconds between keepalive probes.
+            keepalive_count (int | None, optional): Unanswered probes before the connection is dropped.
+
+        Raises:
+            ValueError: If a switch is not a boolean, or a size or timing is not a positive integer.
+        """
+        for name, value in (("tcp_nodelay", nodelay), ("keepalive", keepalive)):
+            if value is not None and not isinstance(value, bool):
+                raise ValueError(f"Socket option {name} must be true or false")
+        for name, value in (("sndbuf", sndbuf), ("rcvbuf", rcvbuf), ("keepalive_idle", keepalive_idle),
+                            ("keepalive_interval", keepalive_interval), ("keepalive_count", keepalive_count)):
+            if value is not None and (isinstance(value, bool) or not isinstance(value, int) or value <= 0):
+                raise ValueError(f"Socket option {name} must be a positive integer")
+        self.nodelay: bool | None = nodelay
+        self.sndbuf: int | None = sndbuf
+        self.rcvbuf: int | None = rcvbuf
+        self.keepalive: bool | None = keepalive
+        self.keepalive_idle: int | None = keepalive_idle
+        self.keepalive_interval: int | None = keepalive_interval
+        self.keepalive_count: int | None = keepalive_count
+
+    @classmethod
+    def from_dict(cls, options: dict) -> "SocketOptions":
+        """
+        Read the options from the "socket" object of a node's JSON file.
+
+        Args:
+            options (dict): The parsed object, e.g. `{"tcp_nodelay": true, "sndbuf": 262144}`.
+
+        Returns:
+            SocketOptions: The options.
+
+        Raises:
+            ValueError: If a key is unknown or a value is invalid.
+        """
+        unknown: set[str] = set(options) - set(cls.KEYS)
+        if unknown:
+            raise ValueError(f"Unknown socket options: {', '.join(sorted(unknown))}")
+        return cls(options.get("tcp_nodelay"), options.get("sndbuf"), options.get("rcvbuf"),
+                   options.get("keepalive"), options.get("keepalive_idle"),
+                   options.get("keepalive_interval"), options.get("keepalive_count"))
+
+    def apply(self, sock: socket) -> None:
+        """
+        Set the options on a socket.
+
+        Args:
+            sock (socket): A TCP socket. Buffer sizes should be set before connecting or
+                           listening, so the TCP window is scaled to them.
+        """
+        if self.nodelay is not None:
+            sock.setsockopt(sockets.IPPROTO_TCP, sockets.TCP_NODELAY, int(self.nodelay))
+        if self.sndbuf is not None:
+            sock.setsockopt(sockets.SOL_SOCKET, sockets.SO_SNDBUF, self.sndbuf)
+        if self.rcvbuf is not None:
+            sock.setsockopt(sockets.SOL_SOCKET, sockets.SO_RCVBUF, self.rcvbuf)
+        if self.keepalive is not None:
+            sock.setsockopt(sockets.SOL_SOCKET, sockets.SO_KEEPALIVE, int(self.keepalive))
+        for name, value in (("TCP_KEEPIDLE", self.keepalive_idle), ("TCP_KEEPINTVL", self.keepalive_interval),
+                            ("TCP_KEEPCNT", self.keepalive_count)):
+            if value is not None and hasattr(sockets, name):
+                sock.setsockopt(sockets.IPPROTO_TCP, getattr(sockets, name), value)
+
+    def __repr__(self) -> str:
+        return "SocketOptions(" + ", ".join(f"{name}={value!r}" for name, value in vars(self).items()
+                                            if value is not None) + ")"
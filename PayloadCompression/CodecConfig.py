@@ -0,0 +1,288 @@
+"""
+Shared parameters of the Predictor codec.
+
+A configuration fixes the context order, the size of the guess table and the
+hash function mapping a context to a table entry. Every codec class takes one,
+and both ends of a stream or container must use the same. The default, order 2
+with a 65536-entry table and the DJB hash, is the original codec and keeps its
+header-less formats; any other configuration is written into the header of the
+payloads that carry it, in the two bytes produced by `CodecConfig.encode`.
+
+Contexts are handled as rolling integers holding the last `order` bytes, the
+oldest one in the highest byte, so a codec updates its context with one shift
+per byte and hashes it with a single call.
+
+Attributes:
+    HASH_FUNCTIONS (tuple[str, ...]): The names of the hash functions, in the order of their ids.
+    DEFAULT (CodecConfig): The configuration of the original codec.
+"""
+from typing import Callable
+
+HASH_FUNCTIONS: tuple[str, ...] = ("djb", "fnv1a", "fibonacci")
+
+_BLANK: int = ord(' ')
+_blank_tables: dict[int, bytes] = {}
+
+
+def _djb(order: int, mask: int) -> Callable[[int], int]:
+    """
+    Build the DJB hash (times 33, xor) over `order` context bytes.
+    """
+    if order == 1:
+        return lambda context: ((5381 * 33) ^ context) & mask
+    if order == 2:
+        return lambda context: ((((5381 * 33) ^ (context >> 8)) * 33) ^ (context & 0xFF)) & mask
+
+    shifts: tuple[int, ...] = tuple(range(8 * (order - 1), -1, -8))
+
+    def djb(context: int) -> int:
+        hash_val: int = 5381
+        for shift in shifts:
+            hash_val = (hash_val * 33) ^ ((context >> shift) & 0xFF)
+        return hash_val & mask
+    return djb
+
+
+def _fnv1a(order: int, mask: int) -> Callable[[int], int]:
+    """
+    Build the 32-bit FNV-1a hash over `order` context bytes, xor-folded to the table size.
+    """
+    shifts: tuple[int, ...] = tuple(range(8 * (order - 1), -1, -8))
+    bits: int = mask.bit_length()
+
+    def fnv1a(context: int) -> int:
+        hash_val: int = 2166136261
+        for shift in shifts:
+            hash_val = ((hash_val ^ ((context >> shift) & 0xFF)) * 16777619) & 0xFFFFFFFF
+        return ((hash_val >> bits) ^ hash_val) & mask
+    return fnv1a
+
+
+def _fibonacci(order: int, mask: int) -> Callable[[int], int]:
+    """
+    Build the Fibonacci (multiplicative) hash of the whole context, one multiplication per byte.
+    """
+    shift: int = 32 - mask.bit_length()
+    return lambda context: ((context * 2654435769) & 0xFFFFFFFF) >> shift
+
+
+_HASH_BUILDERS: tuple[Callable[[int, int], Callable[[int], int]], ...] = (_djb, _fnv1a, _fibonacci)
+
+
+class CodecConfig:
+    """
+    Immutable set of Predictor codec parameters.
+
+    Attributes:
+        MIN_ORDER (int): The shortest supported context.
+        MAX_ORDER (int): The longest supported context.
+        MIN_TABLE_BITS (int): The base-2 logarithm of the smallest supported guess table.
+        MAX_TABLE_BITS (int): The base-2 logarithm of the largest supported guess table.
+        ENCODED_SIZE (int): The size of an encoded configuration.
+        _order (int): The number of context bytes.
+        _table_bits (int): The base-2 logarithm of the number of guess table entries.
+        _hash_name (str): The name of the hash function.
+        _hash_function (Callable[[int], int]): Maps a rolling context to a guess table index.
+        _hash_rows (list[list[int]] | None): The precomputed hashes of every context of up to
+                                            two bytes, built on first use.
+
+    Methods:
+        order -> int: The number of context bytes.
+        table_bits -> int: The base-2 logarithm of the table size.
+        table_size -> int: The number of guess table entries.
+        hash_name -> str: The name of the hash function.
+        hash_function -> Callable[[int], int]: The hash of a rolling context.
+        context_mask -> int: The mask keeping the last `order` bytes of a rolling context.
+        blank_table -> bytes: A guess table in its initial state.
+        hash_rows -> list[list[int]] | None: Precomputed hashes by the two context bytes, for orders 1 and 2.
+        is_default -> bool: Whether this is the configuration of the original codec.
+        encode() -> bytes: The configuration as written into headers.
+        decode(data: bytes | memoryview, offset: int = 0) -> tuple[CodecConfig, int]: Reads an encoded configuration.
+    """
+    MIN_ORDER = 1
+    MAX_ORDER = 4
+    MIN_TABLE_BITS = 12
+    MAX_TABLE_BITS = 20
+    ENCODED_SIZE = 2
+
+    def __init__(self, order: int = 2, table_bits: int = 16, hash_name: str = "djb") -> None:
+        """
+        Initialize the CodecConfig object.
+
+        Args:
+            order (int, optional): The number of context bytes, from 1 to 4. Default is 2.
+            table_bits (int, optional): The base-2 logarithm of the number of guess table
+                                        entries, from 12 to 20. Default is 16.
+            hash_name (str, optional): One of `HASH_FUNCTIONS`. Default is "djb".
+
+        Raises:
+            ValueError: If a parameter is out of range or the hash function is unknown.
+        """
+        if not CodecConfig.MIN_ORDER <= order <= CodecConfig.MAX_ORDER:
+            raise ValueError(f"Context order must be between {CodecConfig.MIN_ORDER} and {CodecConfig.MAX_ORDER}")
+        if not CodecConfig.MIN_TABLE_BITS <= table_bits <= CodecConfig.MAX_TABLE_BITS:
+            raise ValueError(f"Table bits must be between {CodecConfig.MIN_TABLE_BITS} and {CodecConfig.MAX_TABLE_BITS}")
+        if hash_name not in HASH_FUNCTIONS:
+            raise ValueError(f"Unknown hash function {hash_name!r}")
+
+        self._order: int = order
+        self._table_bits: int = table_bits
+        self._hash_name: str = hash_name
+        self._hash_function: Callable[[int], int] = \
+            _HASH_BUILDERS[HASH_FUNCTIONS.index(hash_name)](order, (1 << table_bits) - 1)
+        self._hash_rows: list[list[int]] | None = None
+
+    @property
+    def order(self) -> int:
+        """
+        Get the number of context bytes.
+
+        Returns:
+            int: The context order.
+        """
+        return self._order
+
+    @property
+    def table_bits(self) -> int:
+        """
+        Get the base-2 logarithm of the number of guess table entries.
+
+        Returns:
+            int: The table bits.
+        """
+        return self._table_bits
+
+    @property
+    def table_size(self) -> int:
+        """
+        Get the number of guess table entries.
+
+        Returns:
+            int: The table size.
+        """
+        return 1 << self._table_bits
+
+    @property
+    def hash_name(self) -> str:
+        """
+        Get the name of the hash function.
+
+        Returns:
+            str: One of `HASH_FUNCTIONS`.
+        """
+        return self._hash_name
+
+    @property
+    def hash_function(self) -> Callable[[int], int]:
+        """
+        Get the hash function of a rolling context.
+
+        Returns:
+            Callable[[int], int]: Maps the last `order` bytes, packed into an integer with
+                                  the oldest byte highest, to a guess table index.
+        """
+        return self._hash_function
+
+    @property
+    def context_mask(self) -> int:
+        """
+        Get the mask keeping the last `order` bytes of a rolling context.
+
+        Returns:
+            int: `order` bytes of ones.
+        """
+        return (1 << (8 * self._order)) - 1
+
+    @property
+    def blank_table(self) -> bytes:
+        """
+        Get a guess table in its initial state, shared between all configurations of its size.
+
+        Returns:
+            bytes: `table_size` blanks.
+        """
+        table: bytes | None = _blank_tables.get(self._table_bits)
+        if table is None:
+            table = _blank_tables[self._table_bits] = bytes([_BLANK]) * self.table_size
+        return table
+
+    @property
+    def hash_rows(self) -> list[list[int]] | None:
+        """
+        Get the hash of every context of an order 1 or 2 configuration, as a lookup table.
+
+        Returns:
+            list[list[int]] | None: 256 rows of 256 hashes, `hash_rows[first][second]` being
+                                    the hash of the context `first, second`. Order 1 ignores
+                                    `first`, so all its rows are the same list. None for
+                                    longer contexts, whose tables would not fit in memory.
+
+        Two list lookups are cheaper than a call of `hash_function`, which is what makes
+        the decoders' per-byte loop fast.
+        """
+        if self._order > 2:
+            return None
+        if self._hash_rows is None:
+            if self._order == 1:
+                self._hash_rows = [list(map(self._hash_function, range(256)))] * 256
+            else:
+                self._hash_rows = [list(map(self._hash_function, range(first << 8, (first + 1) << 8)))
+                                   for first in range(256)]
+        return self._hash_rows
+
+    @property
+    def is_default(self) -> bool:
+        """
+        Tell whether this is the configuration of the original codec.
+
+        Returns:
+            bool: True for order 2, a 65536-entry table and the DJB hash.
+        """
+        return self == DEFAULT
+
+    def encode(self) -> bytes:
+        """
+        Encode the configuration as written into headers.
+
+        Returns:
+            bytes: The hash id in the high and the order in the low nibble of the first
+                   byte, and the table bits in the second.
+        """
+        return bytes(((HASH_FUNCTIONS.index(self._hash_name) << 4) | self._order, self._table_bits))
+
+    @staticmethod
+    def decode(data: bytes | memoryview, offset: int = 0) -> tuple["CodecConfig", int]:
+        """
+        Read an encoded configuration.
+
+        Args:
+            data (bytes | memoryview): The buffer holding the configuration.
+            offset (int, optional): The offset of the configuration in `data`. Default is 0.
+
+        Returns:
+            tuple: The configuration and the offset just past it.
+
+        Raises:
+            ValueError: If the configuration is truncated or invalid.
+        """
+        if len(data) < offset + CodecConfig.ENCODED_SIZE:
+            raise ValueError("Truncated codec configuration")
+        hash_id: int = data[offset] >> 4
+        if hash_id >= len(HASH_FUNCTIONS):
+            raise ValueError(f"Unknown hash function id {hash_id}")
+        config: CodecConfig = CodecConfig(data[offset] & 0x0F, data[offset + 1], HASH_FUNCTIONS[hash_id])
+        return config, offset + CodecConfig.ENCODED_SIZE
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, CodecConfig):
+            return NotImplemented
+        return (self._order, self._table_bits, self._hash_name) == (other._order, other._table_bits, other._hash_name)
+
+    def __hash__(self) -> int:
+        return hash((self._order, self._table_bits, self._hash_name))
+
+    def __repr__(self) -> str:
+        return f"CodecConfig(order={self._order}, table_bits={self._table_bits}, hash_name={self._hash_name!r})"
+
+
+DEFAULT: CodecConfig = CodecConfig()
@@ -1,93 +1,405 @@
+from array import array
+from time import perf_counter_ns
+from typing import Iterable
+
 from bitarray import bitarray
+from Metrics import MetricsRegistry
+from .numpy_engine import HAS_NUMPY, predict
+from .CodecConfig import DEFAULT, CodecConfig
+from .Container import ContainerReader, is_container, max_container_size, pack_into
+from .Dictionary import ID_SIZE
+from .StreamCompression import StreamCompressor
+from .varint import decode_varint
 
 class Compression:
     """
-    Class for compressing a string payload using a basic dictionary-based 
-    compression scheme. It uses a fixed-length substring hashing approach to 
-    reduce the size of the input string.
+    Class for compressing a payload using a basic dictionary-based
+    compression scheme. It uses a fixed-length substring hashing approach to
+    reduce the size of the input.
+
+    The codec works on raw bytes, so any UTF-8 or binary payload can be compressed.
+    Payloads with more than 255 leftovers cannot be represented in the single-byte
+    leftover count and are written as a block container (see `Container`) instead.
+    Payloads that do not compress, such as random or already compressed data, are
+    written raw behind a `RAW_MARKER` byte: the miss rate over the first `SAMPLE_SIZE`
+    bytes is used to project the ratio, and the prediction is abandoned as soon as
+    the projection is poor.
+    With a `CodecConfig` other than the default, payloads are written behind
+    `CONFIG_MAGIC` and the encoded configuration as a single `StreamCompressor`
+    packet, so the decompressor needs no out-of-band agreement on the parameters.
+    With a dictionary (see `Dictionary`), every payload is predicted from its primed
+    guess table and written the same way behind `DICTIONARY_MAGIC` and the dictionary
+    id; the decompressing peer must have loaded the same dictionary.
+    `compress_into` writes into a caller-supplied buffer, while `payload_compression`
+    is a convenience wrapper for strings that allocates its own result. `compress_many`
+    compresses a whole batch of messages into one packed buffer.
 
     Attributes:
-        k (int): The length of the substring used for hashing. Default is 2.
-        ASCII (str): The encoding format used for compressing small strings.
-    
+        k (int): The length of the substring used for hashing by the default configuration,
+                 and the longest payload copied verbatim.
+        UTF8 (str): The encoding used to turn strings into bytes.
+        NUMPY_THRESHOLD (int): Minimum payload length for which the NumPy engine is used.
+        MAX_LEFTOVERS (int): The most leftovers the single-byte leftover count can describe.
+        METRICS_SOURCE (str): The name this codec publishes its metrics under.
+        RAW_MARKER (int): The first byte of a payload written raw. A leftover count of 1 is
+                          never written, since every compressed payload starts with `k` leftovers.
+        SAMPLE_SIZE (int): The length of the prefix whose miss rate decides whether to write raw.
+        RAW_THRESHOLD (float): The projected compression ratio above which a payload is written raw.
+        CONFIG_MAGIC (bytes): The first bytes of a payload compressed with a non-default configuration.
+                              Like a container, it starts with a zero leftover count.
+        DICTIONARY_MAGIC (bytes): The first bytes of a payload compressed with a dictionary.
+        _config (CodecConfig): The codec parameters.
+        _stream (StreamCompressor | None): The compressor of non-default configurations and
+                                           dictionaries, reset per message.
+        _header (bytes): The magic and the configuration or dictionary id written before
+                         every packet of `_stream`.
+        _use_numpy (bool): Whether the NumPy engine is enabled for this instance.
+        _adaptive (bool): Whether incompressible payloads are detected and written raw.
+        _guess_table (bytearray): The guess table, allocated once and reset per message.
+        _flag_buffer (bytearray): Scratch space for the flag bits, grown on demand.
+        _scratch (bytearray): Scratch space for the messages `compress_many` hands to `compress_into`.
+        _metrics (MetricsRegistry | None): The registry every message is recorded in, if any.
+
     Methods:
+        max_compressed_size(length: int) -> int: Upper bound of the compressed size of a payload.
+        compress_into(src: bytes | memoryview, dst: bytearray | memoryview) -> int: Compresses into `dst`.
         payload_compression(S: str) -> bytearray: Compresses the input string.
+        compress_many(messages: Iterable[str | bytes | memoryview]) -> tuple[bytearray, array]:
+            Compresses a batch of messages into one packed buffer.
     """
     k = 2
-    ASCII="ASCII"
+    UTF8="utf-8"
+    NUMPY_THRESHOLD = 512
+    MAX_LEFTOVERS = 255
+    METRICS_SOURCE = "compression"
+    RAW_MARKER = 0x01
+    SAMPLE_SIZE = 128
+    RAW_THRESHOLD = 1.0
+    CONFIG_MAGIC = b"\x00PH"
+    DICTIONARY_MAGIC = b"\x00PD"
+
+    def __init__(self, use_numpy: bool = True, metrics: MetricsRegistry | None = None,
+                 adaptive: bool = True, config: CodecConfig = DEFAULT, dictionary: int | None = None) -> None:
+        """
+        Initialize the Compression object.
+
+        Args:
+            use_numpy (bool, optional): Use the vectorized NumPy engine for long payloads
+                                        when NumPy is installed. Default is True.
+            metrics (MetricsRegistry | None, optional): Registry to record the size, hit rate
+                                                        and time of every message in. Default is None.
+            adaptive (bool, optional): Write payloads that do not compress raw. Default is True.
+            config (CodecConfig, optional): The codec parameters. Default is the original codec.
+            dictionary (int | None, optional): The id of a loaded dictionary to prime every
+                                               payload with. Its configuration replaces `config`.
+                                               Default is None, a blank guess table.
+
+        Raises:
+            ValueError: If the dictionary is not loaded, or was trained for another configuration.
+
+        When NumPy is not installed the pure-Python loop is used regardless of `use_numpy`;
+        the NumPy engine only implements the default configuration without a dictionary.
+        The guess table is allocated here once and reused by every call to `compress_into`.
+        """
+        if dictionary is not None:
+            self._stream: StreamCompressor | None = StreamCompressor(adaptive=adaptive, config=config,
+                                                                     dictionary=dictionary)
+            config = self._stream.config
+            self._header: bytes = Compression.DICTIONARY_MAGIC + dictionary.to_bytes(ID_SIZE, "big")
+        else:
+            self._stream = None if config.is_default else StreamCompressor(adaptive=adaptive, config=config)
+            self._header = Compression.CONFIG_MAGIC + config.encode()
+        self._config: CodecConfig = config
+        self._use_numpy: bool = use_numpy and HAS_NUMPY
+        self._adaptive: bool = adaptive
+        self._guess_table: bytearray = bytearray(config.blank_table)
+        self._flag_buffer: bytearray = bytearray(128)
+        self._scratch: bytearray = bytearray()
+        self._metrics: MetricsRegistry | None = metrics
 
     @staticmethod
-    def __hash_function(substring: str) -> int:
+    def max_compressed_size(length: int) -> int:
         """
-        Hash a substring into a 16-bit integer using a simple hash function.
+        Return the largest number of bytes `compress_into` can write for a payload.
 
         Args:
-            substring (str): A string of length 2 to be hashed.
-        
+            length (int): The length of the uncompressed payload in bytes.
+
         Returns:
-            int: A 16-bit hash value of the substring.
-        
-        This function uses bitwise shifts and XOR to generate a hash from the 
-        ASCII values of the first two characters in the substring.
+            int: The size a destination buffer needs to hold the compressed payload.
+
+        The worst case is a payload without a single correct guess: one count byte,
+        every input byte as a leftover, and one flag bit per input byte, or the
+        equivalent block container, configured or primed packet when that has more overhead.
+        All of them exceed the size of a raw payload.
         """
-        hash_val = 5381
-        hash_val = ((hash_val << 5) + hash_val) ^ ord(substring[0])
-        hash_val = ((hash_val << 5) + hash_val) ^ ord(substring[1])
-        return hash_val % 65536
+        if length <= Compression.k:
+            return length
+        configured: int = len(Compression.DICTIONARY_MAGIC) + max(CodecConfig.ENCODED_SIZE, ID_SIZE) \
+            + StreamCompressor.max_packet_size(length)
+        return max(1 + length + (length + 7) // 8, max_container_size(length), configured)
 
 
     @staticmethod
-    def __merge_bit_array_leftovers(leftovers: list[str], bit_array: bitarray) -> bytearray:
+    def __merge_bit_array_leftovers(leftovers_length: int, flags: memoryview,
+                                    dst: bytearray | memoryview) -> int:
         """
-        Merge the leftover characters and the bit array into a bytearray.
+        Complete the compressed payload in `dst` with the leftover count and the flag bits.
 
         Args:
-            leftovers (list[str]): A list of characters not found in the guess table.
-            bit_array (bitarray): A bit array representing matches between substrings 
-                                  and the guess table.
-        
+            leftovers_length (int): The number of leftovers already written to `dst[1:]`.
+            flags (memoryview): The packed bit array representing matches between
+                                substrings and the guess table.
+            dst (bytearray | memoryview): The destination buffer.
+
         Returns:
-            bytearray: A bytearray containing the number of leftovers, their ASCII values,
-                       and the bit array's binary data.
-        
-        The result starts with the number of leftover characters, followed by their 
-        ASCII values, and then the binary data of the bit array.
-        """
-        byte_array :bytearray = bytearray(bit_array.tobytes())
-        result:bytearray = bytearray()
-        
-        result.append(len(leftovers))
-        result.extend(ord(c) for c in leftovers)
-        result.extend(byte_array)
+            int: The total number of bytes written to `dst`.
 
-        return result
+        The result starts with the number of leftover characters, followed by their
+        values, and then the binary data of the bit array.
+        """
+        dst[0] = leftovers_length
+        end: int = 1 + leftovers_length + len(flags)
+        dst[1 + leftovers_length:end] = flags
 
+        return end
 
-    def __init_arrays(self, S: str)->tuple[bitarray, list[str], list[str]]:
+
+    def __init_arrays(self, length: int)->tuple[bitarray, bytearray]:
         """
-        Initialize the bit array, leftovers list, and guess table for compression.
+        Initialize the bit array and reset the guess table for compression.
 
         Args:
-            S (str): The string to be compressed.
-        
+            length (int): The length of the payload to be compressed.
+
         Returns:
             tuple: A tuple containing:
-                   - bit_array: A bitarray initialized with all bits set to 0.
-                   - leftovers: A list of initial leftover characters.
-                   - guess_table: A preallocated list for storing guessed characters.
-        
-        The `leftovers` list starts with the first few characters of `S`, and 
-        the `guess_table` is a lookup table for guessed characters based on hashes.
-        """
-        bit_array: bitarray = bitarray(len(S))
+                   - bit_array: A bitarray of `length` bits, all set to 0, backed by `_flag_buffer`.
+                   - guess_table: The instance's guess table, reset to blanks.
+
+        The bit array is a view over the reusable flag buffer, and resetting the table
+        is a single copy from the blank table of the configuration, so nothing is allocated per message
+        beyond the view itself.
+        """
+        flags_length: int = (length + 7) // 8
+        if len(self._flag_buffer) < flags_length:
+            self._flag_buffer = bytearray(flags_length)
+
+        bit_array: bitarray = bitarray(buffer=memoryview(self._flag_buffer)[:flags_length])
         bit_array.setall(0)  # Set all bits to 0 initially
 
-        get_length: int = lambda length: Compression.k if length > Compression.k else length
-        leftovers: list[str] = [S[i] for i in range(get_length(len(S)))]
+        guess_table: bytearray = self._guess_table
+        guess_table[:] = self._config.blank_table
+
+        return bit_array, guess_table
+
+
+    def compress_into(self, src: bytes | memoryview, dst: bytearray | memoryview) -> int:
+        """
+        Compress a byte payload into a caller-supplied buffer.
+
+        Args:
+            src (bytes | memoryview): The payload to be compressed.
+            dst (bytearray | memoryview): The buffer receiving the compressed payload.
+                                          It must hold at least `max_compressed_size(len(src))` bytes.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        Raises:
+            ValueError: If `src` is empty or `dst` is too small.
+
+        Payloads no longer than `k` are copied verbatim. Otherwise the leftovers are
+        written straight into `dst`, followed by the flag bits. As soon as a payload
+        turns out to have more than 255 leftovers, it is written as a block container. Payloads of at least
+        `NUMPY_THRESHOLD` bytes go through the vectorized NumPy engine when it is
+        available; both paths produce identical output. In adaptive mode, payloads whose
+        prefix projects a poor ratio, or whose result is larger than the payload itself,
+        are written raw instead. When a metrics registry was given, the size, hit rate
+        and time of the payload are recorded in it.
+        """
+        if self._metrics is None:
+            return self.__compress_into(src, dst)
+
+        start: int = perf_counter_ns()
+        end: int = self.__compress_into(src, dst)
+        elapsed: int = perf_counter_ns() - start
+        raw: bool = len(src) <= Compression.k or dst[0] == Compression.RAW_MARKER
+        if raw:
+            hits: int = 0
+        elif is_container(dst):
+            hits = ContainerReader(memoryview(dst)[:end]).count_hits()
+        elif self._stream is not None:
+            flags_start: int = decode_varint(dst, len(self._header))[1]
+            hits = len(src) - (end - flags_start - (len(src) + 7) // 8)
+        else:
+            hits = len(src) - dst[0]
+        self._metrics.record_codec(Compression.METRICS_SOURCE, len(src), end, hits, elapsed, raw)
+
+        return end
+
+
+    def __compress_into(self, src: bytes | memoryview, dst: bytearray | memoryview) -> int:
+        """
+        Compress a byte payload into a caller-supplied buffer.
+
+        Args:
+            src (bytes | memoryview): The payload to be compressed.
+            dst (bytearray | memoryview): The buffer receiving the compressed payload.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+        """
+        length: int = len(src)
+        if not length:
+            raise ValueError("Empty payload passed to compressor")
+        if len(dst) < Compression.max_compressed_size(length):
+            raise ValueError("Destination buffer too small for compressed payload")
+
+        if length <= Compression.k:
+            dst[:length] = src
+            return length
+        if self._stream is not None:
+            return self.__compress_configured(src, dst)
+
+        sampled: bool = self._adaptive and length > Compression.SAMPLE_SIZE
+        if self._use_numpy and length >= Compression.NUMPY_THRESHOLD:
+            if sampled:
+                prefix_leftovers, _ = predict(src[:Compression.SAMPLE_SIZE], Compression.k)
+                if self.__poor_prefix(len(prefix_leftovers), length):
+                    return self.__write_raw(src, dst)
+            leftovers, flags = predict(src, Compression.k)
+            if len(leftovers) > Compression.MAX_LEFTOVERS:
+                end: int = pack_into(src, dst)
+            else:
+                dst[1:1 + len(leftovers)] = leftovers
+                end = self.__merge_bit_array_leftovers(len(leftovers), memoryview(flags), dst)
+        else:
+            bit_array, guess_table = self.__init_arrays(length)
+
+            dst[1:1 + Compression.k] = src[:Compression.k]
+            checkpoint: int = Compression.SAMPLE_SIZE if sampled else length
+            leftovers_end: int = self.__predict_range(src, dst, bit_array, guess_table,
+                                                      Compression.k, checkpoint, 1 + Compression.k)
+            if sampled:
+                if self.__poor_prefix(leftovers_end - 1, length):
+                    return self.__write_raw(src, dst)
+                leftovers_end = self.__predict_range(src, dst, bit_array, guess_table,
+                                                     checkpoint, length, leftovers_end)
+            del bit_array
+
+            if leftovers_end < 0:
+                end = pack_into(src, dst)
+            else:
+                end = self.__merge_bit_array_leftovers(leftovers_end - 1,
+                                                       memoryview(self._flag_buffer)[:(length + 7) // 8],
+                                                       dst)
+
+        if self._adaptive and end > 1 + length:
+            return self.__write_raw(src, dst)
+        return end
+
+
+    def __predict_range(self, src: bytes | memoryview, dst: bytearray | memoryview,
+                        bit_array: bitarray, guess_table: bytearray,
+                        start: int, stop: int, leftovers_end: int) -> int:
+        """
+        Run the prediction loop over `src[start:stop]`.
+
+        Args:
+            src (bytes | memoryview): The payload being compressed.
+            dst (bytearray | memoryview): The buffer the leftovers are written into.
+            bit_array (bitarray): The flag bits of the payload.
+            guess_table (bytearray): The guess table.
+            start (int): The first position to predict, at least `k`.
+            stop (int): The position just past the last one to predict.
+            leftovers_end (int): The offset in `dst` the next leftover goes to.
+
+        Returns:
+            int: The offset just past the last leftover, or -1 as soon as the payload
+                 has more than `MAX_LEFTOVERS` leftovers.
+        """
+        hash_function = self._config.hash_function
+        context: int = (src[start - 2] << 8) | src[start - 1]
+        for i in range(start, stop):
+            hash_val = hash_function(context)
+            char: int = src[i]
+
+            if guess_table[hash_val] == char:
+                bit_array[i] = 1
+            else:
+                if leftovers_end > Compression.MAX_LEFTOVERS:
+                    return -1
+                dst[leftovers_end] = char
+                leftovers_end += 1
+                guess_table[hash_val] = char
+            context = ((context << 8) | char) & 0xFFFF
+
+        return leftovers_end
+
+
+    def __compress_configured(self, src: bytes | memoryview, dst: bytearray | memoryview) -> int:
+        """
+        Compress a payload with a non-default configuration or a dictionary.
+
+        Args:
+            src (bytes | memoryview): The payload, longer than `k` bytes.
+            dst (bytearray | memoryview): The destination buffer.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        The payload is written as `CONFIG_MAGIC` and the encoded configuration, or as
+        `DICTIONARY_MAGIC` and the dictionary id, followed by one packet of a freshly
+        reset stream compressor, which has no leftover limit. In adaptive mode
+        a packet the compressor wrote raw is replaced by a raw payload.
+        """
+        view: memoryview = memoryview(dst)
+        packet_start: int = len(self._header)
+        self._stream.reset()
+        self._stream.feed(src)
+        end: int = packet_start + self._stream.flush_into(view[packet_start:])
+        if self._stream.last_packet_raw:
+            return self.__write_raw(src, dst)
+
+        view[:packet_start] = self._header
+        return end
+
+
+    @staticmethod
+    def __poor_prefix(prefix_leftovers: int, length: int) -> bool:
+        """
+        Tell whether the first `SAMPLE_SIZE` bytes predict a poor compression ratio.
+
+        Args:
+            prefix_leftovers (int): The number of leftovers among the first `SAMPLE_SIZE`
+                                    bytes, the first `k` included.
+            length (int): The length of the whole payload.
+
+        Returns:
+            bool: True if the payload, compressed at the miss rate of its prefix, would
+                  take more than `RAW_THRESHOLD` of its raw size.
+        """
+        miss_rate: float = (prefix_leftovers - Compression.k) / (Compression.SAMPLE_SIZE - Compression.k)
+        projected: float = 1 + Compression.k + miss_rate * (length - Compression.k) + (length + 7) // 8
+        return projected > Compression.RAW_THRESHOLD * length
+
+
+    @staticmethod
+    def __write_raw(src: bytes | memoryview, dst: bytearray | memoryview) -> int:
+        """
+        Write a payload uncompressed, behind the `RAW_MARKER` byte.
 
-        guess_table: list[str] = [' '] * 65536
+        Args:
+            src (bytes | memoryview): The payload.
+            dst (bytearray | memoryview): The destination buffer.
 
-        return bit_array, leftovers, guess_table
+        Returns:
+            int: The number of bytes written to `dst`.
+        """
+        dst[0] = Compression.RAW_MARKER
+        dst[1:1 + len(src)] = src
+        return 1 + len(src)
 
 
     def payload_compression(self, S: str) -> bytearray:
@@ -96,34 +408,134 @@ class Compression:
 
         Args:
             S (str): The input string to be compressed.
-        
+
         Returns:
             bytearray: The compressed representation of the string.
-        
+
         Raises:
             ValueError: If an empty string is provided as input.
-        
-        If the input string is shorter than or equal to the defined substring 
-        length `k`, it is returned as a bytearray encoded in ASCII. Otherwise, 
-        the string is compressed by creating a bit array and merging it with 
-        leftover characters.
+
+        The string is encoded as UTF-8 and compressed with `compress_into` into a
+        freshly allocated buffer. If the encoded string is shorter than or equal to
+        the defined substring length `k`, it is returned as is.
         """
         if not S:
             raise ValueError("Empty string passed to compressor")
 
-        if(len(S) <= Compression.k):
-            return bytearray(S, encoding=Compression.ASCII)
+        data: bytes = S.encode(Compression.UTF8)
+        result: bytearray = bytearray(Compression.max_compressed_size(len(data)))
+        del result[self.compress_into(data, result):]
 
-        bit_array, leftovers, guess_table = self.__init_arrays(S)
+        return result
 
-        for i in range(Compression.k, len(S)):
-            substring = S[i - Compression.k:i]
-            hash_val = self.__hash_function(substring)
 
-            if guess_table[hash_val] == S[i]:
-                bit_array[i] = 1
+    def compress_many(self, messages: Iterable[str | bytes | memoryview]) -> tuple[bytearray, array]:
+        """
+        Compress a batch of messages, each on its own, into one packed buffer.
+
+        Args:
+            messages (Iterable[str | bytes | memoryview]): The messages; strings are encoded as UTF-8.
+
+        Returns:
+            tuple: A tuple containing:
+                   - packed: The compressed messages, one after the other.
+                   - offsets: An unsigned 64-bit array of `len(messages) + 1` offsets, message
+                              `i` being `packed[offsets[i]:offsets[i + 1]]`.
+
+        Raises:
+            ValueError: If a message is empty.
+
+        Every message is compressed exactly as `payload_compression` would, so each slice 
+        can be decompressed on its own. The setup is paid once per batch: the results are 
+        appended to a single buffer, and messages shorter than `NUMPY_THRESHOLD` with the 
+        default configuration go through a loop that looks hashes up in the configuration's 
+        precomputed rows and afterwards blanks only the table entries it wrote, instead of 
+        resetting the whole guess table for every message. Other messages go through 
+        `compress_into`.
+        """
+        packed: bytearray = bytearray()
+        offsets: array = array("Q", [0])
+        rows: list[list[int]] | None = self._config.hash_rows if self._stream is None else None
+        self._guess_table[:] = self._config.blank_table
+        for message in messages:
+            data: bytes | memoryview = message.encode(Compression.UTF8) if isinstance(message, str) else message
+            length: int = len(data)
+            if rows is not None and Compression.k < length < Compression.NUMPY_THRESHOLD:
+                start: int = perf_counter_ns()
+                hits: int = self.__compress_short(data, packed, rows)
+                if hits >= 0:
+                    if self._metrics is not None:
+                        end: int = len(packed)
+                        self._metrics.record_codec(Compression.METRICS_SOURCE, length, end - offsets[-1], hits,
+                                                   perf_counter_ns() - start,
+                                                   packed[offsets[-1]] == Compression.RAW_MARKER)
+                    offsets.append(len(packed))
+                    continue
+            if len(self._scratch) < Compression.max_compressed_size(length):
+                self._scratch = bytearray(Compression.max_compressed_size(length))
+            packed += memoryview(self._scratch)[:self.compress_into(data, self._scratch)]
+            offsets.append(len(packed))
+            self._guess_table[:] = self._config.blank_table
+        return packed, offsets
+
+
+    def __compress_short(self, src: bytes | memoryview, packed: bytearray, rows: list[list[int]]) -> int:
+        """
+        Compress a payload with the default configuration and append it to `packed`.
+
+        Args:
+            src (bytes | memoryview): The payload, longer than `k` bytes.
+            packed (bytearray): The buffer the compressed payload is appended to.
+            rows (list[list[int]]): The precomputed hashes of the configuration.
+
+        Returns:
+            int: The number of correctly guessed bytes, or -1 if the payload has more than
+                 `MAX_LEFTOVERS` leftovers, in which case nothing was appended.
+
+        The flag bits are collected in an integer, most significant bit first, which 
+        matches the bit order of the flag bytes. Raw payloads are detected as in 
+        `compress_into`, from the prefix and from the result.
+        """
+        length: int = len(src)
+        base: int = len(packed)
+        guess_table: bytearray = self._guess_table
+        blank: int = self._config.blank_table[0]
+        written: list[int] = []
+        packed.append(0)
+        packed += src[:Compression.k]
+        row: list[int] = rows[src[0]]
+        second: int = src[1]
+        bits: int = 0
+        checkpoint: int = Compression.SAMPLE_SIZE if self._adaptive and length > Compression.SAMPLE_SIZE else length
+        position: int = Compression.k
+        for char in src[Compression.k:]:
+            if position == checkpoint:
+                if self.__poor_prefix(len(packed) - base - 1, length):
+                    break
+            hash_val: int = row[second]
+            if guess_table[hash_val] == char:
+                bits = (bits << 1) | 1
             else:
-                leftovers.append(S[i])
-                guess_table[hash_val] = S[i]
+                bits <<= 1
+                packed.append(char)
+                guess_table[hash_val] = char
+                written.append(hash_val)
+            row = rows[second]
+            second = char
+            position += 1
+        for hash_val in written:
+            guess_table[hash_val] = blank
 
-        return self.__merge_bit_array_leftovers(leftovers, bit_array)
+        leftovers: int = len(packed) - base - 1
+        if leftovers > Compression.MAX_LEFTOVERS:
+            del packed[base:]
+            return -1
+        flags_length: int = (length + 7) // 8
+        if position < length or (self._adaptive and leftovers + flags_length > length):
+            del packed[base:]
+            packed.append(Compression.RAW_MARKER)
+            packed += src
+            return 0
+        packed[base] = leftovers
+        packed += (bits << (-length % 8)).to_bytes(flags_length, "big")
+        return length - leftovers
@@ -0,0 +1,467 @@
+"""
+Versioned block container for payloads of any size.
+
+Layout:
+    header   MAGIC, VERSION (1 byte), block size (varint), or for containers written
+             with a non-default `CodecConfig`: MAGIC, CONFIG_VERSION (1 byte), the
+             encoded configuration (`CodecConfig.ENCODED_SIZE` bytes), block size (varint)
+    blocks   one `StreamCompressor` packet per block, each compressed with a blank
+             guess table so that every block can be decompressed on its own
+    index    total payload length (varint), block count (varint), and the
+             compressed size of every block (varint each)
+    trailer  offset of the index, 8 bytes little-endian
+
+Every block but the last holds exactly `block size` payload bytes, so the block
+holding any payload offset is known without reading the blocks before it.
+
+Attributes:
+    MAGIC (bytes): The first bytes of every container. The leading zero byte can never
+                   start a legacy `Compression` payload longer than `k` bytes.
+    VERSION (int): The container format version written for the default configuration.
+    CONFIG_VERSION (int): The container format version carrying a codec configuration.
+    DEFAULT_BLOCK_SIZE (int): The default number of payload bytes per block.
+    TRAILER_SIZE (int): The size of the fixed trailer locating the index.
+"""
+from typing import BinaryIO, Iterator
+
+from .CodecConfig import DEFAULT, CodecConfig
+from .StreamCompression import StreamCompressor
+from .StreamDecompression import StreamDecompressor
+from .varint import decode_varint, encode_varint, varint_size
+
+MAGIC: bytes = b"\x00PC"
+VERSION: int = 1
+CONFIG_VERSION: int = 2
+DEFAULT_BLOCK_SIZE: int = 64 * 1024
+TRAILER_SIZE: int = 8
+
+
+def is_container(data: bytes | memoryview) -> bool:
+    """
+    Tell whether `data` starts like a container.
+
+    Args:
+        data (bytes | memoryview): A compressed payload.
+
+    Returns:
+        bool: True if `data` starts with `MAGIC`.
+    """
+    return len(data) > len(MAGIC) and bytes(data[:len(MAGIC)]) == MAGIC
+
+
+def max_container_size(length: int, block_size: int = DEFAULT_BLOCK_SIZE,
+                       config: CodecConfig = DEFAULT) -> int:
+    """
+    Return the largest container `pack_into` can write for a payload.
+
+    Args:
+        length (int): The length of the payload in bytes.
+        block_size (int, optional): The number of payload bytes per block.
+        config (CodecConfig, optional): The codec parameters. Default is the original codec.
+
+    Returns:
+        int: The size a destination buffer needs to hold the container.
+    """
+    blocks: int = -(-length // block_size)
+    packets: int = length + (length + 7) // 8 + blocks * (varint_size(block_size) + 1)
+    index: int = varint_size(length) + varint_size(blocks) + blocks * varint_size(StreamCompressor.max_packet_size(block_size))
+    return _header_size(block_size, config) + packets + index + TRAILER_SIZE
+
+
+def _header_size(block_size: int, config: CodecConfig = DEFAULT) -> int:
+    """
+    Return the size of the container header for a block size and a configuration.
+    """
+    config_size: int = 0 if config.is_default else CodecConfig.ENCODED_SIZE
+    return len(MAGIC) + 1 + config_size + varint_size(block_size)
+
+
+def _encode_header(block_size: int, dst: bytearray | memoryview, config: CodecConfig = DEFAULT) -> int:
+    """
+    Write the container header at the start of `dst` and return its size.
+    """
+    dst[:len(MAGIC)] = MAGIC
+    offset: int = len(MAGIC) + 1
+    if config.is_default:
+        dst[len(MAGIC)] = VERSION
+    else:
+        dst[len(MAGIC)] = CONFIG_VERSION
+        dst[offset:offset + CodecConfig.ENCODED_SIZE] = config.encode()
+        offset += CodecConfig.ENCODED_SIZE
+    return encode_varint(block_size, dst, offset)
+
+
+def _encode_index(total_length: int, block_sizes: list[int], index_offset: int) -> bytearray:
+    """
+    Build the block index followed by the trailer.
+    """
+    index: bytearray = bytearray(varint_size(total_length) + varint_size(len(block_sizes))
+                                 + sum(varint_size(size) for size in block_sizes) + TRAILER_SIZE)
+    offset: int = encode_varint(total_length, index)
+    offset = encode_varint(len(block_sizes), index, offset)
+    for size in block_sizes:
+        offset = encode_varint(size, index, offset)
+    index[offset:] = index_offset.to_bytes(TRAILER_SIZE, "little")
+    return index
+
+
+def pack_into(src: bytes | memoryview, dst: bytearray | memoryview,
+              block_size: int = DEFAULT_BLOCK_SIZE, config: CodecConfig = DEFAULT) -> int:
+    """
+    Compress a whole payload into a container held in a caller-supplied buffer.
+
+    Args:
+        src (bytes | memoryview): The payload to be compressed.
+        dst (bytearray | memoryview): The buffer receiving the container. It must hold
+                                      at least `max_container_size(len(src), block_size, config)` bytes.
+        block_size (int, optional): The number of payload bytes per block.
+        config (CodecConfig, optional): The codec parameters. Default is the original codec.
+
+    Returns:
+        int: The number of bytes written to `dst`.
+
+    Raises:
+        ValueError: If `block_size` is not positive or `dst` is too small.
+    """
+    if block_size <= 0:
+        raise ValueError("Block size must be positive")
+    if len(dst) < max_container_size(len(src), block_size, config):
+        raise ValueError("Destination buffer too small for container")
+
+    view: memoryview = memoryview(dst)
+    source: memoryview = memoryview(src)
+    offset: int = _encode_header(block_size, view, config)
+    compressor: StreamCompressor = StreamCompressor(config=config)
+    block_sizes: list[int] = []
+    for start in range(0, len(source), block_size):
+        compressor.reset()
+        compressor.feed(source[start:start + block_size])
+        size: int = compressor.flush_into(view[offset:])
+        block_sizes.append(size)
+        offset += size
+
+    index: bytearray = _encode_index(len(source), block_sizes, offset)
+    view[offset:offset + len(index)] = index
+    return offset + len(index)
+
+
+class ContainerWriter:
+    """
+    Streaming container writer with memory bounded by the block size.
+
+    Data passed to `write` is cut into blocks, and every full block is compressed and
+    written to the sink right away. `close` writes the last partial block, the index
+    and the trailer.
+
+    Attributes:
+        _sink (BinaryIO): The binary file-like object receiving the container.
+        _block_size (int): The number of payload bytes per block.
+        _compressor (StreamCompressor): The compressor, reset before every block.
+        _packet (bytearray): Reusable buffer each block is compressed into.
+        _block_sizes (list[int]): The compressed size of every block written so far.
+        _total_length (int): The number of payload bytes written so far.
+        _offset (int): The number of container bytes written so far.
+
+    Methods:
+        write(data: bytes | memoryview) -> None: Appends payload data to the container.
+        close() -> None: Completes the container.
+    """
+    def __init__(self, sink: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE,
+                 config: CodecConfig = DEFAULT) -> None:
+        """
+        Initialize the ContainerWriter and write the container header to `sink`.
+
+        Args:
+            sink (BinaryIO): The binary file-like object receiving the container.
+            block_size (int, optional): The number of payload bytes per block.
+            config (CodecConfig, optional): The codec parameters. Default is the original codec.
+
+        Raises:
+            ValueError: If `block_size` is not positive.
+        """
+        if block_size <= 0:
+            raise ValueError("Block size must be positive")
+
+        self._sink: BinaryIO = sink
+        self._block_size: int = block_size
+        self._compressor: StreamCompressor = StreamCompressor(config=config)
+        self._packet: bytearray = bytearray(StreamCompressor.max_packet_size(block_size))
+        self._block_sizes: list[int] = []
+        self._total_length: int = 0
+
+        header: bytearray = bytearray(_header_size(block_size, config))
+        self._offset: int = _encode_header(block_size, header, config)
+        self._sink.write(header)
+
+    def __write_block(self) -> None:
+        """
+        Compress the pending block and write it to the sink.
+        """
+        size: int = self._compressor.flush_into(self._packet)
+        self._sink.write(memoryview(self._packet)[:size])
+        self._block_sizes.append(size)
+        self._offset += size
+        self._compressor.reset()
+
+    def write(self, data: bytes | memoryview) -> None:
+        """
+        Append payload data to the container.
+
+        Args:
+            data (bytes | memoryview): The payload data.
+        """
+        view: memoryview = memoryview(data)
+        self._total_length += len(view)
+        while view:
+            room: int = self._block_size - self._compressor.pending
+            self._compressor.feed(view[:room])
+            view = view[room:]
+            if self._compressor.pending == self._block_size:
+                self.__write_block()
+
+    def close(self) -> None:
+        """
+        Write the last partial block, the block index and the trailer.
+
+        The sink itself is left open.
+        """
+        if self._compressor.pending:
+            self.__write_block()
+        self._sink.write(_encode_index(self._total_length, self._block_sizes, self._offset))
+
+
+class ContainerReader:
+    """
+    Random-access reader for containers.
+
+    The header, the index and the trailer are parsed up front; blocks are only
+    decompressed when asked for. The container can be any buffer, including an
+    `mmap`, and is never copied as a whole.
+
+    Attributes:
+        _data (memoryview): The container.
+        _config (CodecConfig): The codec parameters read from the header.
+        _block_size (int): The number of payload bytes per block.
+        _total_length (int): The length of the decompressed payload.
+        _offsets (list[int]): The offset of every block, followed by the index offset.
+        _decompressor (StreamDecompressor): The decompressor, reset before every block.
+
+    Methods:
+        config -> CodecConfig: The codec parameters of the blocks.
+        block_count -> int: The number of blocks.
+        block_size -> int: The number of payload bytes per block.
+        total_length -> int: The length of the decompressed payload.
+        block_span(block: int) -> tuple[int, int]: The position of a compressed block in the container.
+        decompress_block_into(block: int, dst: bytearray | memoryview) -> int: Decompresses one block.
+        count_hits() -> int: The number of payload bytes the guess tables predicted correctly.
+        iter_blocks(first: int = 0, last: int | None = None) -> Iterator[bytes]: Yields decompressed blocks.
+        decompress_blocks(first: int = 0, last: int | None = None) -> bytes: Decompresses a block range.
+        decompress_range(offset: int, length: int) -> bytes: Decompresses a payload byte range.
+        decompress_into(dst: bytearray | memoryview) -> int: Decompresses the whole payload.
+    """
+    def __init__(self, data: bytes | memoryview) -> None:
+        """
+        Initialize the ContainerReader by parsing the header, the trailer and the index.
+
+        Args:
+            data (bytes | memoryview): The container, e.g. a bytes object or an mmap.
+
+        Raises:
+            ValueError: If `data` is not a container or uses an unsupported version.
+        """
+        self._data: memoryview = memoryview(data)
+        if not is_container(self._data) or len(self._data) < len(MAGIC) + 2 + TRAILER_SIZE:
+            raise ValueError("Data is not a compressed container")
+        version: int = self._data[len(MAGIC)]
+        if version not in (VERSION, CONFIG_VERSION):
+            raise ValueError(f"Unsupported container version {version}")
+
+        offset: int = len(MAGIC) + 1
+        self._config: CodecConfig = DEFAULT
+        if version == CONFIG_VERSION:
+            self._config, offset = CodecConfig.decode(self._data, offset)
+
+        try:
+            self._block_size, offset = decode_varint(self._data, offset)
+            index_offset: int = int.from_bytes(self._data[-TRAILER_SIZE:], "little")
+            self._total_length, position = decode_varint(self._data, index_offset)
+            block_count, position = decode_varint(self._data, position)
+            self._offsets: list[int] = [offset]
+            for _ in range(block_count):
+                size, position = decode_varint(self._data, position)
+                offset += size
+                self._offsets.append(offset)
+        except IndexError:
+            raise ValueError("Truncated container index")
+        if offset != index_offset:
+            raise ValueError("Container index does not match its blocks")
+
+        self._decompressor: StreamDecompressor = StreamDecompressor(config=self._config)
+
+    @property
+    def config(self) -> CodecConfig:
+        """
+        Get the codec parameters the blocks were compressed with.
+
+        Returns:
+            CodecConfig: The configuration read from the header.
+        """
+        return self._config
+
+    @property
+    def block_count(self) -> int:
+        """
+        Get the number of blocks in the container.
+
+        Returns:
+            int: The number of blocks.
+        """
+        return len(self._offsets) - 1
+
+    @property
+    def block_size(self) -> int:
+        """
+        Get the number of payload bytes per block.
+
+        Returns:
+            int: The block size.
+        """
+        return self._block_size
+
+    @property
+    def total_length(self) -> int:
+        """
+        Get the length of the decompressed payload.
+
+        Returns:
+            int: The payload length in bytes.
+        """
+        return self._total_length
+
+    def block_span(self, block: int) -> tuple[int, int]:
+        """
+        Get the position of a compressed block in the container.
+
+        Args:
+            block (int): The index of the block.
+
+        Returns:
+            tuple: The offset of the first byte of the block and the offset just past it.
+
+        Raises:
+            IndexError: If the block does not exist.
+        """
+        if not 0 <= block < self.block_count:
+            raise IndexError("Block index out of range")
+
+        return self._offsets[block], self._offsets[block + 1]
+
+    def count_hits(self) -> int:
+        """
+        Count the payload bytes predicted correctly, without decompressing any block.
+
+        Returns:
+            int: The total length minus the number of leftovers of every block.
+
+        Every block packet holds its length, one flag bit per byte and its leftovers,
+        so the leftovers of a block follow from its compressed size.
+        """
+        hits: int = 0
+        for block in range(self.block_count):
+            start, end = self.block_span(block)
+            length, flags_start = decode_varint(self._data, start)
+            hits += length - (end - flags_start - (length + 7) // 8)
+        return hits
+
+    def decompress_block_into(self, block: int, dst: bytearray | memoryview) -> int:
+        """
+        Decompress a single block into a caller-supplied buffer.
+
+        Args:
+            block (int): The index of the block.
+            dst (bytearray | memoryview): The buffer receiving the block. It must hold at
+                                          least `block_size` bytes.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        Raises:
+            IndexError: If the block does not exist.
+        """
+        start, end = self.block_span(block)
+        self._decompressor.reset()
+        self._decompressor.feed(self._data[start:end])
+        return self._decompressor.flush_into(dst)
+
+    def iter_blocks(self, first: int = 0, last: int | None = None) -> Iterator[bytes]:
+        """
+        Yield the decompressed blocks `first` to `last` (exclusive) one by one.
+
+        Args:
+            first (int, optional): The index of the first block. Default is 0.
+            last (int | None, optional): The index past the last block. Default is all blocks.
+
+        Yields:
+            bytes: The payload of each block.
+        """
+        last = self.block_count if last is None else min(last, self.block_count)
+        for block in range(first, last):
+            self._decompressor.reset()
+            self._decompressor.feed(self._data[self._offsets[block]:self._offsets[block + 1]])
+            yield self._decompressor.flush()
+
+    def decompress_blocks(self, first: int = 0, last: int | None = None) -> bytes:
+        """
+        Decompress the blocks `first` to `last` (exclusive).
+
+        Args:
+            first (int, optional): The index of the first block. Default is 0.
+            last (int | None, optional): The index past the last block. Default is all blocks.
+
+        Returns:
+            bytes: The concatenated payload of the blocks.
+        """
+        return b"".join(self.iter_blocks(first, last))
+
+    def decompress_range(self, offset: int, length: int) -> bytes:
+        """
+        Decompress `length` payload bytes starting at `offset`, touching only the blocks
+        that hold them.
+
+        Args:
+            offset (int): The payload offset of the first byte.
+            length (int): The number of bytes.
+
+        Returns:
+            bytes: The requested bytes, shorter if the range runs past the payload end.
+        """
+        if length <= 0 or offset >= self._total_length:
+            return b""
+
+        first: int = offset // self._block_size
+        last: int = (offset + length - 1) // self._block_size + 1
+        start: int = offset - first * self._block_size
+        return self.decompress_blocks(first, last)[start:start + length]
+
+    def decompress_into(self, dst: bytearray | memoryview) -> int:
+        """
+        Decompress the whole payload into a caller-supplied buffer.
+
+        Args:
+            dst (bytearray | memoryview): The buffer receiving the payload. It must hold at
+                                          least `total_length` bytes.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        Raises:
+            ValueError: If `dst` is too small.
+        """
+        if len(dst) < self._total_length:
+            raise ValueError("Destination buffer too small for decompressed payload")
+
+        view: memoryview = memoryview(dst)
+        offset: int = 0
+        for block in range(self.block_count):
+            offset += self.decompress_block_into(block, view[offset:])
+        return offset
@@ -1,71 +1,302 @@
+from array import array
+from time import perf_counter_ns
+from typing import Iterator, Sequence
+
 from bitarray import bitarray
+from Metrics import MetricsRegistry
+from .CodecConfig import DEFAULT, CodecConfig
+from .decoder import decode_into
+from .Container import ContainerReader, is_container
+from .Dictionary import ID_SIZE, get_dictionary
+from .StreamDecompression import StreamDecompressor
+from .varint import decode_varint
 
 class Decompression:
     """
-    Class for decompressing a byte array payload that was compressed using a 
-    fixed-length substring hashing approach. This class reconstructs the 
-    original string from the compressed data.
+    Class for decompressing a byte array payload that was compressed using a
+    fixed-length substring hashing approach. This class reconstructs the
+    original payload from the compressed data.
+
+    `decompress_into` writes raw bytes into a caller-supplied buffer, while
+    `payload_decompression` is a convenience wrapper that returns a string. Payloads
+    written as a block container are recognized by their magic bytes, and payloads
+    written raw by their `RAW_MARKER` byte; the latter are copied without decoding.
+    Payloads compressed with a non-default `CodecConfig` start with `CONFIG_MAGIC`
+    and carry their configuration, so any of them can be decompressed by any instance.
+    Payloads compressed with a dictionary start with `DICTIONARY_MAGIC` and its id,
+    and can be decompressed by any instance once the dictionary is loaded.
+    `decompress_many` decompresses a batch packed by `Compression.compress_many`.
 
     Attributes:
-        k (int): The length of the substring used for hashing. Default is 2.
-        ASCII (str): The encoding format used for decompressing small strings.
-    
+        k (int): The length of the substring used for hashing by the default configuration,
+                 and the longest payload copied verbatim.
+        UTF8 (str): The encoding used to turn decompressed bytes into strings.
+        METRICS_SOURCE (str): The name this codec publishes its metrics under.
+        RAW_MARKER (int): The first byte of a payload written raw.
+        CONFIG_MAGIC (bytes): The first bytes of a payload compressed with a non-default configuration.
+        DICTIONARY_MAGIC (bytes): The first bytes of a payload compressed with a dictionary.
+        _dictionary (int | None): The id of the only dictionary accepted, if one was given.
+        _stream (StreamDecompressor | None): The decompressor of the last non-default configuration
+                                             or dictionary seen.
+        _output (bytearray): Scratch buffer the shared decode loop appends to, reused across messages.
+        _guess_table (bytearray): The guess table, allocated once and reset per message.
+        _scratch (bytearray): Scratch space for the messages `decompress_many` hands to `decompress_into`.
+        _metrics (MetricsRegistry | None): The registry every message is recorded in, if any.
+
     Methods:
+        decompressed_size(compressed_data: bytes | memoryview) -> int: Size of the decompressed payload.
+        decompress_into(src: bytes | memoryview, dst: bytearray | memoryview) -> int: Decompresses into `dst`.
         payload_decompression(compressed_data: bytearray) -> str: Decompresses the input byte array.
+        decompress_many(packed: bytes | memoryview, offsets: Sequence[int]) -> tuple[bytearray, array]:
+            Decompresses a packed batch of messages.
     """
     k = 2
-    ASCII="ASCII"
+    UTF8="utf-8"
+    METRICS_SOURCE = "decompression"
+    RAW_MARKER = 0x01
+    CONFIG_MAGIC = b"\x00PH"
+    DICTIONARY_MAGIC = b"\x00PD"
+
+    def __init__(self, metrics: MetricsRegistry | None = None, dictionary: int | None = None) -> None:
+        """
+        Initialize the Decompression object.
+
+        Args:
+            metrics (MetricsRegistry | None, optional): Registry to record the size, hit rate
+                                                        and time of every message in. Default is None.
+            dictionary (int | None, optional): The id of the dictionary agreed with the compressing
+                                               peer. Payloads compressed with any other dictionary
+                                               are rejected. Default is None, accepting any loaded one.
+
+        Raises:
+            ValueError: If the dictionary is not loaded.
+
+        The guess table is allocated here once and reused by every call to
+        `decompress_into`.
+        """
+        if dictionary is not None:
+            get_dictionary(dictionary)
+        self._dictionary: int | None = dictionary
+        self._guess_table: bytearray = bytearray(DEFAULT.blank_table)
+        self._stream: StreamDecompressor | None = None
+        self._output: bytearray = bytearray()
+        self._scratch: bytearray = bytearray()
+        self._metrics: MetricsRegistry | None = metrics
+
+    @staticmethod
+    def __split(compressed_data: bytes | memoryview)->tuple[memoryview, bitarray]:
+        """
+        Split a compressed payload into its leftovers and flag bits without copying.
+
+        Args:
+            compressed_data (bytes | memoryview): The compressed payload, longer than `k` bytes.
+
+        Returns:
+            tuple: A tuple containing:
+                   - leftovers: A view over the characters not found in the guess table.
+                   - flag_bits: A bitarray over the flags used during compression.
+        """
+        view: memoryview = memoryview(compressed_data)
+        leftovers_length: int = view[0]+1
+
+        flag_bits: bitarray = bitarray(buffer=view[leftovers_length:])
+
+        return view[1:leftovers_length], flag_bits
+
+
+    @staticmethod
+    def decompressed_size(compressed_data: bytes | memoryview) -> int:
+        """
+        Return the number of bytes `decompress_into` writes for a compressed payload.
+
+        Args:
+            compressed_data (bytes | memoryview): The compressed payload.
+
+        Returns:
+            int: The size a destination buffer needs to hold the decompressed payload.
+
+        Every decompressed character is either a leftover or a correct guess, so the
+        size is the leftover count plus the number of set flag bits.
+        """
+        if len(compressed_data) <= Decompression.k:
+            return len(compressed_data)
+        if compressed_data[0] == Decompression.RAW_MARKER:
+            return len(compressed_data) - 1
+        if is_container(compressed_data):
+            return ContainerReader(compressed_data).total_length
+        packet_start: int = Decompression.__packet_start(compressed_data)
+        if packet_start:
+            return decode_varint(compressed_data, packet_start)[0]
+
+        leftovers, flag_bits = Decompression.__split(compressed_data)
+        return len(leftovers) + flag_bits.count()
+
 
     @staticmethod
-    def __hash_function(substring: str) -> int:
+    def __packet_start(compressed_data: bytes | memoryview) -> int:
         """
-        Hash a substring into a 16-bit integer using a simple hash function.
+        Find the stream packet of a payload compressed with a non-default configuration or a dictionary.
 
         Args:
-            substring (str): A string of length 2 to be hashed.
-        
+            compressed_data (bytes | memoryview): The compressed payload.
+
         Returns:
-            int: A 16-bit hash value of the substring.
-        
-        This function uses bitwise shifts and XOR to generate a hash from the 
-        ASCII values of the first two characters in the substring.
+            int: The offset of the packet after the header, or 0 if the payload starts
+                 with neither `CONFIG_MAGIC` nor `DICTIONARY_MAGIC`.
+        """
+        prefix: bytes = bytes(compressed_data[:len(Decompression.CONFIG_MAGIC)])
+        if len(compressed_data) <= len(prefix):
+            return 0
+        if prefix == Decompression.CONFIG_MAGIC:
+            return len(Decompression.CONFIG_MAGIC) + CodecConfig.ENCODED_SIZE
+        if prefix == Decompression.DICTIONARY_MAGIC:
+            return len(Decompression.DICTIONARY_MAGIC) + ID_SIZE
+        return 0
+
+
+    def __decompress_configured(self, src: bytes | memoryview, dst: bytearray | memoryview) -> int:
         """
-        hash_val: int = 5381
-        hash_val = ((hash_val << 5) + hash_val) ^ ord(substring[0])
-        hash_val = ((hash_val << 5) + hash_val) ^ ord(substring[1])
+        Decompress a payload compressed with a non-default configuration or a dictionary.
+
+        Args:
+            src (bytes | memoryview): The payload, starting with `CONFIG_MAGIC` or `DICTIONARY_MAGIC`.
+            dst (bytearray | memoryview): The destination buffer.
+
+        Returns:
+            int: The number of bytes written to `dst`.
 
-        return hash_val % 65536
+        Raises:
+            ValueError: If the configuration or the packet is invalid, or the dictionary
+                        is not loaded or not the one agreed on.
+
+        The stream decompressor is kept while consecutive payloads share a configuration
+        and dictionary, so its guess table is only reallocated when either changes.
+        """
+        dictionary: int | None = None
+        if bytes(src[:len(Decompression.DICTIONARY_MAGIC)]) == Decompression.DICTIONARY_MAGIC:
+            packet_start: int = len(Decompression.DICTIONARY_MAGIC) + ID_SIZE
+            if len(src) < packet_start:
+                raise ValueError("Truncated dictionary id")
+            dictionary = int.from_bytes(src[len(Decompression.DICTIONARY_MAGIC):packet_start], "big")
+            if self._dictionary is not None and dictionary != self._dictionary:
+                raise ValueError(f"Payload was compressed with dictionary {dictionary:#010x}, "
+                                 f"not {self._dictionary:#010x}")
+            config: CodecConfig = get_dictionary(dictionary).config
+        else:
+            config, packet_start = CodecConfig.decode(src, len(Decompression.CONFIG_MAGIC))
+        if self._stream is None or self._stream.config != config or self._stream.dictionary != dictionary:
+            self._stream = StreamDecompressor(config=config, dictionary=dictionary)
+        else:
+            self._stream.reset()
+        self._stream.feed(memoryview(src)[packet_start:])
+        return self._stream.flush_into(dst)
 
 
-    def __init_arrays(self, compressed_data: bytearray)->tuple[list[str], list[str], bitarray, list[str]]:
+    def __init_arrays(self, compressed_data: bytes | memoryview)->tuple[memoryview, bitarray, bytearray]:
         """
-        Initialize the leftovers, decompressed text, flag bits, and guess table.
+        Initialize the leftovers and flag bits, and reset the guess table.
 
         Args:
-            compressed_data (bytearray): The compressed byte array.
-        
+            compressed_data (bytes | memoryview): The compressed payload.
+
         Returns:
             tuple: A tuple containing:
-                   - leftovers: A list of characters not found in the guess table.
-                   - decompressed_text: The partially decompressed text.
+                   - leftovers: A view over the characters not found in the guess table.
                    - flag_bits: A bitarray representing the flags used during compression.
-                   - guess_table: A preallocated list for storing guessed characters.
-        
-        The leftovers are extracted from the first part of the compressed data, 
+                   - guess_table: The instance's guess table, reset to blanks.
+
+        The leftovers are extracted from the first part of the compressed data,
         and the bit array is derived from the remaining bytes.
         """
-        leftovers_length: int = compressed_data[0]+1
-        leftovers: list[str] = [chr(b) for b in compressed_data[1:leftovers_length]]
+        leftovers, flag_bits = self.__split(compressed_data)
 
-        get_length: int = lambda length: Decompression.k if length > Decompression.k else length
-        decompressed_text: list[str] = [leftovers[i] for i in range(get_length(leftovers_length))]
+        guess_table: bytearray = self._guess_table
+        guess_table[:] = DEFAULT.blank_table
 
-        flag_bits = bitarray()
-        flag_bits.frombytes(compressed_data[leftovers_length:])
-        
-        guess_table: list[str] = [' '] * 65536
+        return leftovers, flag_bits, guess_table
 
-        return leftovers, decompressed_text, flag_bits, guess_table
+
+    def decompress_into(self, src: bytes | memoryview, dst: bytearray | memoryview) -> int:
+        """
+        Decompress a compressed payload into a caller-supplied buffer.
+
+        Args:
+            src (bytes | memoryview): The compressed payload.
+            dst (bytearray | memoryview): The buffer receiving the decompressed payload.
+                                          It must hold at least `decompressed_size(src)` bytes.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        Raises:
+            ValueError: If `src` is empty or `dst` is too small.
+
+        If the input is small enough (equal to or less than the defined substring
+        length `k`), it is copied verbatim, and so is a payload written raw. Otherwise the original payload is
+        reconstructed from the leftover characters, the flag bits, and the guess table
+        by the shared decode loop of `decoder`. When a metrics registry
+        was given, the size, hit rate and time of the payload are recorded in it.
+        """
+        if self._metrics is None:
+            return self.__decompress_into(src, dst)
+
+        start: int = perf_counter_ns()
+        length: int = self.__decompress_into(src, dst)
+        elapsed: int = perf_counter_ns() - start
+        raw: bool = len(src) <= Decompression.k or src[0] == Decompression.RAW_MARKER
+        if raw:
+            hits: int = 0
+        elif is_container(src):
+            hits = ContainerReader(src).count_hits()
+        elif self.__packet_start(src):
+            flags_start: int = decode_varint(src, self.__packet_start(src))[1]
+            hits = length - (len(src) - flags_start - (length + 7) // 8)
+        else:
+            hits = length - src[0]
+        self._metrics.record_codec(Decompression.METRICS_SOURCE, length, len(src), hits, elapsed, raw)
+
+        return length
+
+
+    def __decompress_into(self, src: bytes | memoryview, dst: bytearray | memoryview) -> int:
+        """
+        Decompress a compressed payload into a caller-supplied buffer.
+
+        Args:
+            src (bytes | memoryview): The compressed payload.
+            dst (bytearray | memoryview): The buffer receiving the decompressed payload.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+        """
+        if not src:
+            raise ValueError("Empty byte array passed to decompressor")
+
+        length: int = self.decompressed_size(src)
+        if len(dst) < length:
+            raise ValueError("Destination buffer too small for decompressed payload")
+
+        if(len(src) <= Decompression.k):  # e.g. "Hi" <= (k is 2)
+            dst[:length] = src
+            return length
+        if src[0] == Decompression.RAW_MARKER:
+            dst[:length] = memoryview(src)[1:]
+            return length
+        if is_container(src):
+            return ContainerReader(src).decompress_into(dst)
+        if self.__packet_start(src):
+            return self.__decompress_configured(src, dst)
+
+        leftovers, flag_bits, guess_table = self.__init_arrays(src)
+
+        dst[:self.k] = leftovers[:self.k]
+        output: bytearray = self._output
+        output.clear()
+        decode_into(flag_bits[self.k:length], leftovers[self.k:], guess_table,
+                    (leftovers[0] << 8) | leftovers[1], DEFAULT, output)
+        dst[self.k:length] = output
+
+        return length
 
 
     def payload_decompression(self, compressed_data: bytearray)->str:
@@ -74,39 +305,120 @@ class Decompression:
 
         Args:
             compressed_data (bytearray): The compressed byte array to be decompressed.
-        
+
         Returns:
             str: The decompressed string.
-        
+
         Raises:
             ValueError: If an empty byte array is provided as input.
-        
-        If the input byte array is small enough (equal to or less than the 
-        defined substring length `k`), it is returned as an ASCII string. 
-        Otherwise, the decompression process reconstructs the original string 
-        using the leftover characters, the flag bits, and the guess table.
+
+        The payload is decompressed with `decompress_into` into a freshly allocated
+        buffer and decoded as UTF-8.
         """
-        if not compressed_data:
-            raise ValueError("Empty byte array passed to decompressor")
+        result: bytearray = bytearray(self.decompressed_size(compressed_data))
+        self.decompress_into(compressed_data, result)
+
+        return result.decode(Decompression.UTF8)
 
-        if(len(compressed_data) <= Decompression.k):  # e.g. "Hi" <= (k is 2)
-            return str(compressed_data, encoding=Decompression.ASCII)
 
-        leftovers, decompressed_text, flag_bits, guess_table = self.__init_arrays(compressed_data)
+    def decompress_many(self, packed: bytes | memoryview, offsets: Sequence[int]) -> tuple[bytearray, array]:
+        """
+        Decompress a batch of messages packed by `Compression.compress_many`.
+
+        Args:
+            packed (bytes | memoryview): The compressed messages, one after the other.
+            offsets (Sequence[int]): The `n + 1` offsets delimiting the `n` messages in `packed`.
 
-        leftovers_index:int = self.k
-        for i in range(self.k, len(flag_bits)):
-            substring = ''.join(decompressed_text[i - self.k:i])
-            hash_val = self.__hash_function(substring)
+        Returns:
+            tuple: A tuple containing:
+                   - messages: The decompressed messages, one after the other.
+                   - offsets: An unsigned 64-bit array of `n + 1` offsets, message `i` being
+                              `messages[offsets[i]:offsets[i + 1]]`.
 
-            if flag_bits[i]:
-                decompressed_text.append(guess_table[hash_val])
-            elif leftovers_index < len(leftovers):
-                actual_char = leftovers[leftovers_index]
-                leftovers_index += 1
-                decompressed_text.append(actual_char)
-                guess_table[hash_val] = actual_char
+        Raises:
+            ValueError: If a message is empty or corrupt.
+
+        As in `compress_many`, the setup is paid once per batch: the messages are appended 
+        to a single buffer, and plain payloads are decoded by a loop that looks hashes up 
+        in precomputed rows and afterwards blanks only the table entries it wrote. Raw 
+        payloads are copied, and containers and configured payloads go through 
+        `decompress_into`.
+        """
+        view: memoryview = memoryview(packed)
+        output: bytearray = bytearray()
+        output_offsets: array = array("Q", [0])
+        rows: list[list[int]] = DEFAULT.hash_rows
+        self._guess_table[:] = DEFAULT.blank_table
+        for i in range(len(offsets) - 1):
+            src: memoryview = view[offsets[i]:offsets[i + 1]]
+            if not src:
+                raise ValueError("Empty byte array passed to decompressor")
+            start: int = perf_counter_ns()
+            if len(src) <= Decompression.k:
+                output += src
+                hits: int = 0
+            elif src[0] == Decompression.RAW_MARKER:
+                output += src[1:]
+                hits = 0
+            elif src[0]:
+                hits = self.__decompress_short(src, output, rows)
             else:
-                break
+                length: int = self.decompressed_size(src)
+                if len(self._scratch) < length:
+                    self._scratch = bytearray(length)
+                output += memoryview(self._scratch)[:self.decompress_into(src, self._scratch)]
+                output_offsets.append(len(output))
+                self._guess_table[:] = DEFAULT.blank_table
+                continue
+            output_offsets.append(len(output))
+            if self._metrics is not None:
+                self._metrics.record_codec(Decompression.METRICS_SOURCE, output_offsets[-1] - output_offsets[-2],
+                                           len(src), hits, perf_counter_ns() - start,
+                                           len(src) <= Decompression.k or src[0] == Decompression.RAW_MARKER)
+        return output, output_offsets
+
 
-        return ''.join(decompressed_text)
+    def __decompress_short(self, src: memoryview, output: bytearray, rows: list[list[int]]) -> int:
+        """
+        Decode a plain payload and append it to `output`.
+
+        Args:
+            src (memoryview): The payload, starting with its leftover count.
+            output (bytearray): The buffer the decompressed payload is appended to.
+            rows (list[list[int]]): The precomputed hashes of the default configuration.
+
+        Returns:
+            int: The number of correctly guessed bytes.
+
+        Raises:
+            ValueError: If the payload has fewer leftovers than misses.
+        """
+        leftovers, flag_bits = self.__split(src)
+        guess_table: bytearray = self._guess_table
+        hits: int = flag_bits.count()
+        output += leftovers[:self.k]
+        row: list[int] = rows[leftovers[0]]
+        second: int = leftovers[1]
+        next_leftover: Iterator[int] = iter(leftovers[self.k:])
+        take = next_leftover.__next__
+        append = output.append
+        written: list[int] = []
+        try:
+            for bit in flag_bits[self.k:len(leftovers) + hits]:
+                hash_val: int = row[second]
+                if bit:
+                    char: int = guess_table[hash_val]
+                else:
+                    char = take()
+                    guess_table[hash_val] = char
+                    written.append(hash_val)
+                append(char)
+                row = rows[second]
+                second = char
+        except StopIteration:
+            raise ValueError("Fewer leftovers than misses in the flag bits")
+        finally:
+            blank: int = DEFAULT.blank_table[0]
+            for hash_val in written:
+                guess_table[hash_val] = blank
+        return hits
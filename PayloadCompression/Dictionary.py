@@ -0,0 +1,279 @@
+"""
+Primed guess tables trained from a sample corpus.
+
+A blank guess table predicts nothing, so short payloads such as chat lines are
+mostly leftovers. A dictionary is a guess table trained on typical payloads: for
+every context it holds the byte that most often followed it in the corpus. Codecs
+created with a dictionary start every message or stream from that table instead
+of blanks, so even the first message of a session is predicted.
+
+A dictionary is saved as a compact binary artifact,
+
+    MAGIC | VERSION (1 byte) | encoded configuration | id (4 bytes, big endian) | table
+
+and loaded by mapping the file read-only, so the table is never copied into the
+process: every codec of every connection copies its initial state straight from
+the shared mapping. Loaded dictionaries are registered under their id, which is
+what codecs and peers refer to them by; the id defaults to a CRC-32 of the
+configuration and the table, so peers loading the same artifact agree on it.
+
+Attributes:
+    MAGIC (bytes): The first bytes of every dictionary artifact.
+    VERSION (int): The artifact format version.
+    ID_SIZE (int): The size of a dictionary id in artifacts and payload headers.
+    HEADER_SIZE (int): The size of the artifact header preceding the table.
+"""
+import threading
+import zlib
+from collections import Counter
+from mmap import ACCESS_READ, mmap
+from typing import Iterable
+
+from .CodecConfig import DEFAULT, CodecConfig
+
+MAGIC: bytes = b"PCDT"
+VERSION: int = 1
+ID_SIZE: int = 4
+HEADER_SIZE: int = len(MAGIC) + 1 + CodecConfig.ENCODED_SIZE + ID_SIZE
+
+_registry: dict[int, "Dictionary"] = {}
+_registry_lock: threading.Lock = threading.Lock()
+
+
+class Dictionary:
+    """
+    A read-only primed guess table with the configuration it was trained for.
+
+    Attributes:
+        _id (int): The 32-bit id peers refer to the dictionary by.
+        _config (CodecConfig): The codec parameters the table was trained for.
+        _table (bytes | memoryview): The primed guess table, `config.table_size` bytes.
+        _mapping (mmap | None): The mapped artifact backing `_table`, if it was loaded from a file.
+
+    Methods:
+        train(samples: Iterable[bytes | memoryview], config: CodecConfig = DEFAULT,
+              dictionary_id: int | None = None) -> Dictionary: Builds a dictionary from a corpus.
+        load(path: str) -> Dictionary: Maps a saved artifact.
+        id -> int: The id of the dictionary.
+        config -> CodecConfig: The codec parameters of the table.
+        table -> bytes | memoryview: The primed guess table.
+        save(path: str) -> None: Writes the artifact.
+        encode() -> bytes: The artifact as bytes.
+    """
+    def __init__(self, dictionary_id: int, config: CodecConfig, table: bytes | memoryview,
+                 mapping: mmap | None = None) -> None:
+        """
+        Initialize the Dictionary object.
+
+        Args:
+            dictionary_id (int): The 32-bit id of the dictionary.
+            config (CodecConfig): The codec parameters the table was trained for.
+            table (bytes | memoryview): The primed guess table.
+            mapping (mmap | None, optional): The mapped artifact `table` is a view of.
+
+        Raises:
+            ValueError: If the id does not fit in 32 bits or the table does not match the configuration.
+        """
+        if not 0 <= dictionary_id <= 0xFFFFFFFF:
+            raise ValueError("Dictionary id must fit in 32 bits")
+        if len(table) != config.table_size:
+            raise ValueError(f"Dictionary table has {len(table)} entries, expected {config.table_size}")
+        self._id: int = dictionary_id
+        self._config: CodecConfig = config
+        self._table: bytes | memoryview = table
+        self._mapping: mmap | None = mapping
+
+    @classmethod
+    def train(cls, samples: Iterable[bytes | memoryview], config: CodecConfig = DEFAULT,
+              dictionary_id: int | None = None) -> "Dictionary":
+        """
+        Build a dictionary from a sample corpus.
+
+        Args:
+            samples (Iterable[bytes | memoryview]): Typical payloads, e.g. one chat line each.
+                                                    Each is predicted from an empty context,
+                                                    like a message compressed on its own.
+            config (CodecConfig, optional): The codec parameters. Default is the original codec.
+            dictionary_id (int | None, optional): The id of the dictionary. Default is the
+                                                  CRC-32 of the configuration and the table.
+
+        Returns:
+            Dictionary: The trained dictionary. Table entries of contexts the corpus never
+                        reached keep the blank guess.
+
+        Every entry holds the most frequent byte after the contexts hashing to it, which
+        is the guess that would have been right most often over the corpus; ties go to
+        the byte seen first.
+        """
+        hash_function = config.hash_function
+        mask: int = config.context_mask
+        counts: Counter[tuple[int, int]] = Counter()
+        for sample in samples:
+            context: int = 0
+            hashes: list[int] = []
+            for char in bytes(sample):
+                hashes.append(hash_function(context))
+                context = ((context << 8) | char) & mask
+            counts.update(zip(hashes, bytes(sample)))
+
+        best: dict[int, tuple[int, int]] = {}
+        for (hash_val, char), count in counts.items():
+            if count > best.get(hash_val, (0, 0))[0]:
+                best[hash_val] = (count, char)
+
+        table: bytearray = bytearray(config.blank_table)
+        for hash_val, (_, char) in best.items():
+            table[hash_val] = char
+        if dictionary_id is None:
+            dictionary_id = zlib.crc32(config.encode() + table)
+        return cls(dictionary_id, config, bytes(table))
+
+    @classmethod
+    def load(cls, path: str) -> "Dictionary":
+        """
+        Map a saved dictionary artifact read-only.
+
+        Args:
+            path (str): The artifact written by `save`.
+
+        Returns:
+            Dictionary: The dictionary, whose table is a view of the mapped file.
+
+        Raises:
+            ValueError: If the file is not a valid dictionary artifact.
+            OSError: If the file cannot be opened.
+        """
+        with open(path, "rb") as file:
+            file.seek(0, 2)
+            if file.tell() < HEADER_SIZE:
+                raise ValueError(f"{path} is not a dictionary")
+            mapping: mmap = mmap(file.fileno(), 0, access=ACCESS_READ)
+        view: memoryview = memoryview(mapping)
+        try:
+            if bytes(view[:len(MAGIC)]) != MAGIC:
+                raise ValueError(f"{path} is not a dictionary")
+            if view[len(MAGIC)] != VERSION:
+                raise ValueError(f"Unsupported dictionary version {view[len(MAGIC)]}")
+            config, offset = CodecConfig.decode(view, len(MAGIC) + 1)
+            dictionary_id: int = int.from_bytes(view[offset:HEADER_SIZE], "big")
+            if len(view) != HEADER_SIZE + config.table_size:
+                raise ValueError(f"{path} does not hold a table of {config.table_size} entries")
+            return cls(dictionary_id, config, view[HEADER_SIZE:].toreadonly(), mapping)
+        except ValueError:
+            view.release()
+            mapping.close()
+            raise
+
+    @property
+    def id(self) -> int:
+        """
+        Get the id peers refer to the dictionary by.
+
+        Returns:
+            int: The 32-bit dictionary id.
+        """
+        return self._id
+
+    @property
+    def config(self) -> CodecConfig:
+        """
+        Get the codec parameters the table was trained for.
+
+        Returns:
+            CodecConfig: The configuration codecs using the dictionary must share.
+        """
+        return self._config
+
+    @property
+    def table(self) -> bytes | memoryview:
+        """
+        Get the primed guess table.
+
+        Returns:
+            bytes | memoryview: `config.table_size` read-only bytes, copied into a codec's
+                                own guess table whenever it starts a message or stream.
+        """
+        return self._table
+
+    def encode(self) -> bytes:
+        """
+        Encode the dictionary as an artifact.
+
+        Returns:
+            bytes: The header followed by the table.
+        """
+        return MAGIC + bytes((VERSION,)) + self._config.encode() + self._id.to_bytes(ID_SIZE, "big") \
+            + bytes(self._table)
+
+    def save(self, path: str) -> None:
+        """
+        Write the dictionary artifact to a file.
+
+        Args:
+            path (str): The file to write, replaced if it exists.
+        """
+        with open(path, "wb") as file:
+            file.write(self.encode())
+
+    def __repr__(self) -> str:
+        return f"Dictionary(id={self._id:#010x}, config={self._config!r})"
+
+
+def register(dictionary: Dictionary) -> Dictionary:
+    """
+    Make a dictionary available to codecs under its id.
+
+    Args:
+        dictionary (Dictionary): The dictionary.
+
+    Returns:
+        Dictionary: The registered dictionary, which is the one already registered
+                    under the same id if its table is identical.
+
+    Raises:
+        ValueError: If a different dictionary is already registered under the id.
+    """
+    with _registry_lock:
+        existing: Dictionary | None = _registry.get(dictionary.id)
+        if existing is None:
+            _registry[dictionary.id] = dictionary
+            return dictionary
+        if existing.config != dictionary.config or existing.table != dictionary.table:
+            raise ValueError(f"Another dictionary is already registered as {dictionary.id:#010x}")
+        return existing
+
+
+def load_dictionary(path: str) -> Dictionary:
+    """
+    Map a dictionary artifact and register it, sharing one mapping per id across the process.
+
+    Args:
+        path (str): The artifact written by `Dictionary.save`.
+
+    Returns:
+        Dictionary: The registered dictionary.
+
+    Raises:
+        ValueError: If the file is not a valid dictionary, or a different one is registered under its id.
+        OSError: If the file cannot be opened.
+    """
+    return register(Dictionary.load(path))
+
+
+def get_dictionary(dictionary_id: int) -> Dictionary:
+    """
+    Look up a registered dictionary.
+
+    Args:
+        dictionary_id (int): The id of the dictionary.
+
+    Returns:
+        Dictionary: The dictionary.
+
+    Raises:
+        ValueError: If no dictionary is registered under the id.
+    """
+    dictionary: Dictionary | None = _registry.get(dictionary_id)
+    if dictionary is None:
+        raise ValueError(f"Dictionary {dictionary_id:#010x} is not loaded")
+    return dictionary
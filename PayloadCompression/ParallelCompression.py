@@ -0,0 +1,230 @@
+"""
+Process-parallel front end for the block container.
+
+The payload is split into the independent blocks of the container format and the
+blocks are compressed (or decompressed) concurrently by a `ProcessPoolExecutor`.
+Input and output live in `multiprocessing.shared_memory` segments: workers only
+receive segment names and offsets, and write their result straight into a slot of
+the output segment, so no block is pickled in either direction. The result is
+byte-identical to `Container.pack_into`.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from os import cpu_count
+
+from .CodecConfig import DEFAULT, CodecConfig
+from .Container import (DEFAULT_BLOCK_SIZE, ContainerReader, _encode_header, _encode_index, _header_size,
+                        max_container_size, pack_into)
+from .StreamCompression import StreamCompressor
+from .StreamDecompression import StreamDecompressor
+
+_worker_compressors: dict[bytes, StreamCompressor] = {}
+_worker_decompressors: dict[bytes, StreamDecompressor] = {}
+
+
+def _compress_block(src_name: str, start: int, end: int, dst_name: str, dst_offset: int,
+                    config: bytes) -> int:
+    """
+    Compress one block from the input segment into its slot of the output segment.
+
+    Runs in a worker process. A compressor is created once per worker and configuration,
+    which is passed encoded as by `CodecConfig.encode`.
+
+    Returns:
+        int: The compressed size of the block.
+    """
+    compressor: StreamCompressor | None = _worker_compressors.get(config)
+    if compressor is None:
+        compressor = _worker_compressors[config] = StreamCompressor(config=CodecConfig.decode(config)[0])
+
+    src, dst = SharedMemory(name=src_name), SharedMemory(name=dst_name)
+    try:
+        compressor.reset()
+        compressor.feed(src.buf[start:end])
+        return compressor.flush_into(dst.buf[dst_offset:])
+    finally:
+        src.close()
+        dst.close()
+
+
+def _decompress_block(src_name: str, start: int, end: int, dst_name: str, dst_offset: int,
+                      config: bytes) -> int:
+    """
+    Decompress one block from the container segment into its place in the output segment.
+
+    Runs in a worker process. A decompressor is created once per worker and configuration.
+
+    Returns:
+        int: The decompressed size of the block.
+    """
+    decompressor: StreamDecompressor | None = _worker_decompressors.get(config)
+    if decompressor is None:
+        decompressor = _worker_decompressors[config] = StreamDecompressor(config=CodecConfig.decode(config)[0])
+
+    src, dst = SharedMemory(name=src_name), SharedMemory(name=dst_name)
+    try:
+        decompressor.reset()
+        decompressor.feed(src.buf[start:end])
+        return decompressor.flush_into(dst.buf[dst_offset:])
+    finally:
+        src.close()
+        dst.close()
+
+
+class _ParallelCodec:
+    """
+    Owner of the process pool shared by the parallel compressor and decompressor.
+
+    Attributes:
+        _workers (int): The number of worker processes.
+        _executor (ProcessPoolExecutor | None): The pool, started on first use.
+    """
+    def __init__(self, workers: int | None = None) -> None:
+        self._workers: int = workers or cpu_count() or 1
+        self._executor: ProcessPoolExecutor | None = None
+
+    @property
+    def workers(self) -> int:
+        """
+        Get the number of worker processes.
+
+        Returns:
+            int: The number of workers.
+        """
+        return self._workers
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        return self._executor
+
+    def close(self) -> None:
+        """
+        Shut down the worker processes.
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class ParallelCompression(_ParallelCodec):
+    """
+    Compress large payloads into a block container using several processes.
+
+    Payloads that fit into a single block, and pools of a single worker, are
+    compressed in the calling process.
+
+    Attributes:
+        _block_size (int): The number of payload bytes per block.
+        _config (CodecConfig): The codec parameters of the blocks.
+
+    Methods:
+        compress(data: bytes | memoryview) -> bytes: Compresses a payload into a container.
+        close() -> None: Shuts down the worker processes.
+    """
+    def __init__(self, workers: int | None = None, block_size: int = DEFAULT_BLOCK_SIZE,
+                 config: CodecConfig = DEFAULT) -> None:
+        """
+        Initialize the ParallelCompression object. Workers are started on first use.
+
+        Args:
+            workers (int | None, optional): The number of worker processes. Default is the CPU count.
+            block_size (int, optional): The number of payload bytes per block.
+            config (CodecConfig, optional): The codec parameters. Default is the original codec.
+        """
+        super().__init__(workers)
+        self._block_size: int = block_size
+        self._config: CodecConfig = config
+
+    def compress(self, data: bytes | memoryview) -> bytes:
+        """
+        Compress a payload into a block container.
+
+        Args:
+            data (bytes | memoryview): The payload to be compressed.
+
+        Returns:
+            bytes: The container, identical to the one `Container.pack_into` writes.
+        """
+        length: int = len(data)
+        blocks: list[tuple[int, int]] = [(start, min(start + self._block_size, length))
+                                         for start in range(0, length, self._block_size)]
+        if len(blocks) <= 1 or self._workers == 1:
+            result: bytearray = bytearray(max_container_size(length, self._block_size, self._config))
+            del result[pack_into(data, result, self._block_size, self._config):]
+            return bytes(result)
+
+        slot: int = StreamCompressor.max_packet_size(self._block_size)
+        src: SharedMemory = SharedMemory(create=True, size=length)
+        dst: SharedMemory = SharedMemory(create=True, size=slot * len(blocks))
+        try:
+            src.buf[:length] = data
+            config: bytes = self._config.encode()
+            futures = [self._pool().submit(_compress_block, src.name, start, end, dst.name, i * slot, config)
+                       for i, (start, end) in enumerate(blocks)]
+            sizes: list[int] = [future.result() for future in futures]
+
+            result = bytearray(_header_size(self._block_size, self._config) + sum(sizes))
+            offset: int = _encode_header(self._block_size, result, self._config)
+            for i, size in enumerate(sizes):
+                result[offset:offset + size] = dst.buf[i * slot:i * slot + size]
+                offset += size
+            result += _encode_index(length, sizes, offset)
+            return bytes(result)
+        finally:
+            for segment in (src, dst):
+                segment.close()
+                segment.unlink()
+
+
+class ParallelDecompression(_ParallelCodec):
+    """
+    Decompress block containers using several processes and reassemble the blocks in order.
+
+    Containers with a single block, and pools of a single worker, are decompressed
+    in the calling process.
+
+    Methods:
+        decompress(container: bytes | memoryview) -> bytes: Decompresses a container.
+        close() -> None: Shuts down the worker processes.
+    """
+    def decompress(self, container: bytes | memoryview) -> bytes:
+        """
+        Decompress a block container.
+
+        Args:
+            container (bytes | memoryview): The container.
+
+        Returns:
+            bytes: The decompressed payload.
+
+        Raises:
+            ValueError: If `container` is not a valid container.
+        """
+        reader: ContainerReader = ContainerReader(container)
+        if reader.block_count <= 1 or self._workers == 1:
+            result: bytearray = bytearray(reader.total_length)
+            reader.decompress_into(result)
+            return bytes(result)
+
+        src: SharedMemory = SharedMemory(create=True, size=len(container))
+        dst: SharedMemory = SharedMemory(create=True, size=max(reader.total_length, 1))
+        try:
+            src.buf[:len(container)] = container
+            config: bytes = reader.config.encode()
+            futures = [self._pool().submit(_decompress_block, src.name, *reader.block_span(block),
+                                           dst.name, block * reader.block_size, config)
+                       for block in range(reader.block_count)]
+            for future in futures:
+                future.result()
+            return bytes(dst.buf[:reader.total_length])
+        finally:
+            for segment in (src, dst):
+                segment.close()
+                segment.unlink()
@@ -0,0 +1,302 @@
+from time import perf_counter_ns
+
+from bitarray import bitarray
+from Metrics import MetricsRegistry
+from .CodecConfig import DEFAULT, CodecConfig
+from .Dictionary import Dictionary, get_dictionary
+from .varint import encode_varint, varint_size
+
+class StreamCompressor:
+    """
+    Stateful Predictor compressor that keeps its guess table across packets.
+
+    As in RFC 1978, the guess table and the context survive from one
+    packet to the next, so later packets on a connection are predicted from everything
+    sent before them. Data is buffered with `feed` and emitted as one packet by `flush`.
+    The matching `StreamDecompressor` must receive every packet, in order.
+
+    A packet consists of the number of payload bytes as a varint, one flag bit per
+    payload byte, and the leftover characters. In adaptive mode, data that does not
+    compress is emitted as a raw packet, the data itself, which the transport must
+    mark (see `last_packet_raw`) and pass to `StreamDecompressor.feed_raw`.
+
+    Packets carry no codec configuration: the order, table size and hash function
+    are fixed per stream by the `CodecConfig` both ends are created with.
+
+    Attributes:
+        METRICS_SOURCE (str): The name this codec publishes its metrics under.
+        SAMPLE_SIZE (int): The length of the prefix whose miss rate decides whether to write raw.
+        RAW_THRESHOLD (float): The projected compression ratio above which a packet is written raw.
+        _config (CodecConfig): The codec parameters of the stream.
+        _initial_table (bytes | memoryview): The table a stream starts from, blanks or a shared dictionary.
+        _dictionary (int | None): The id of the dictionary priming the guess table, if any.
+        _guess_table (bytearray): The guess table, kept for the lifetime of the stream.
+        _context (int): The last `order` bytes of the previous packet as a rolling context.
+        _pending (bytearray): Data fed since the last flush.
+        _metrics (MetricsRegistry | None): The registry every packet is recorded in, if any.
+        _adaptive (bool): Whether data that does not compress is emitted as raw packets.
+        _raw (bool): Whether the last packet was written raw.
+
+    Methods:
+        max_packet_size(length: int) -> int: Upper bound of the packet size for a payload.
+        config -> CodecConfig: The codec parameters of the stream.
+        dictionary -> int | None: The id of the dictionary priming the guess table.
+        pending -> int: The number of bytes fed since the last flush.
+        last_packet_raw -> bool: Whether the last flushed packet was written raw.
+        reset() -> None: Starts a new stream with a blank or primed guess table.
+        feed(data: bytes | memoryview) -> None: Buffers data for the next packet.
+        flush_into(dst: bytearray | memoryview) -> int: Writes the pending data as a packet into `dst`.
+        flush() -> bytearray: Returns the pending data as a packet.
+    """
+    METRICS_SOURCE = "stream_compression"
+    SAMPLE_SIZE = 128
+    RAW_THRESHOLD = 1.0
+
+    def __init__(self, metrics: MetricsRegistry | None = None, adaptive: bool = False,
+                 config: CodecConfig = DEFAULT, dictionary: int | None = None) -> None:
+        """
+        Initialize the StreamCompressor with a blank or primed guess table and an empty context.
+
+        Args:
+            metrics (MetricsRegistry | None, optional): Registry to record the size, hit rate
+                                                        and time of every packet in. Default is None.
+            adaptive (bool, optional): Emit data that does not compress as raw packets. Default
+                                       is False, since raw packets need a transport that marks them.
+            config (CodecConfig, optional): The codec parameters. Default is the original codec.
+            dictionary (int | None, optional): The id of a registered dictionary (see `Dictionary`)
+                                               to prime the guess table with. Its configuration is
+                                               used, and the other end must use the same dictionary.
+
+        Raises:
+            ValueError: If the dictionary is not loaded, or was trained for another configuration.
+        """
+        primer: Dictionary | None = None
+        if dictionary is not None:
+            primer = get_dictionary(dictionary)
+            if config is not DEFAULT and config != primer.config:
+                raise ValueError(f"Dictionary {dictionary:#010x} was trained for {primer.config!r}")
+            config = primer.config
+        self._config: CodecConfig = config
+        self._initial_table: bytes | memoryview = config.blank_table if primer is None else primer.table
+        self._dictionary: int | None = dictionary
+        self._guess_table: bytearray = bytearray(self._initial_table)
+        self._context: int = 0
+        self._pending: bytearray = bytearray()
+        self._metrics: MetricsRegistry | None = metrics
+        self._adaptive: bool = adaptive
+        self._raw: bool = False
+
+    @staticmethod
+    def max_packet_size(length: int) -> int:
+        """
+        Return the largest packet `flush_into` can write for `length` pending bytes.
+
+        Args:
+            length (int): The number of pending bytes.
+
+        Returns:
+            int: The size a destination buffer needs to hold the packet.
+        """
+        return varint_size(length) + (length + 7) // 8 + length
+
+
+    @property
+    def config(self) -> CodecConfig:
+        """
+        Get the codec parameters of the stream.
+
+        Returns:
+            CodecConfig: The configuration the compressor was created with.
+        """
+        return self._config
+
+
+    @property
+    def dictionary(self) -> int | None:
+        """
+        Get the id of the dictionary priming the guess table.
+
+        Returns:
+            int | None: The dictionary id, or None for a blank table.
+        """
+        return self._dictionary
+
+
+    @property
+    def pending(self) -> int:
+        """
+        Get the number of bytes fed since the last flush.
+
+        Returns:
+            int: The number of pending bytes.
+        """
+        return len(self._pending)
+
+
+    @property
+    def last_packet_raw(self) -> bool:
+        """
+        Tell whether the last flushed packet was written raw.
+
+        Returns:
+            bool: True if the packet is the data itself, to be passed to `StreamDecompressor.feed_raw`.
+        """
+        return self._raw
+
+
+    def reset(self) -> None:
+        """
+        Start a new stream, discarding the guess table, the context and any pending data.
+
+        The table is reset in place, so compressors can be reused for independent blocks.
+        """
+        self._guess_table[:] = self._initial_table
+        self._context = 0
+        self._pending.clear()
+
+
+    def feed(self, data: bytes | memoryview) -> None:
+        """
+        Buffer data to be compressed by the next flush.
+
+        Args:
+            data (bytes | memoryview): The data to append to the pending payload.
+        """
+        self._pending += data
+
+
+    def flush_into(self, dst: bytearray | memoryview) -> int:
+        """
+        Compress the pending data as one packet into a caller-supplied buffer.
+
+        Args:
+            dst (bytearray | memoryview): The buffer receiving the packet. It must hold at
+                                          least `max_packet_size(pending)` bytes.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        Raises:
+            ValueError: If nothing is pending or `dst` is too small.
+
+        The flag bits are set through a bitarray view over `dst`, and the leftovers are
+        written right after them, so the packet is built in place.
+
+        In adaptive mode the data is written raw instead when it does not compress:
+        packets of up to `SAMPLE_SIZE` bytes once they turn out no smaller than the data,
+        longer ones as soon as their first `SAMPLE_SIZE` bytes project a ratio above
+        `RAW_THRESHOLD`. `last_packet_raw` tells the caller which kind was written.
+        The guess table keeps the updates of the sampled prefix, which
+        `StreamDecompressor.feed_raw` repeats.
+        """
+        start: int = perf_counter_ns() if self._metrics is not None else 0
+        data: bytearray = self._pending
+        length: int = len(data)
+        if not length:
+            raise ValueError("Empty payload passed to compressor")
+        if len(dst) < self.max_packet_size(length):
+            raise ValueError("Destination buffer too small for compressed packet")
+
+        view: memoryview = memoryview(dst)
+        flags_start: int = encode_varint(length, view)
+        leftovers_start: int = flags_start + (length + 7) // 8
+        bit_array: bitarray = bitarray(buffer=view[flags_start:leftovers_start])
+        bit_array.setall(0)
+
+        checkpoint: int = min(length, StreamCompressor.SAMPLE_SIZE) if self._adaptive else length
+        leftovers_end: int = self.__predict_range(data, view, bit_array, 0, checkpoint, leftovers_start)
+        raw: bool = False
+        if self._adaptive:
+            if length <= StreamCompressor.SAMPLE_SIZE:
+                raw = leftovers_end >= length
+            else:
+                raw = self.__poor_prefix(leftovers_end - leftovers_start, length)
+                if not raw:
+                    leftovers_end = self.__predict_range(data, view, bit_array, checkpoint, length,
+                                                         leftovers_end)
+        del bit_array
+
+        if raw:
+            view[:length] = data
+            leftovers_end = length
+            if length > StreamCompressor.SAMPLE_SIZE:
+                self._context = int.from_bytes(data[-self._config.order:], "big")
+        self._raw = raw
+        data.clear()
+
+        if self._metrics is not None:
+            hits: int = 0 if raw else length - (leftovers_end - leftovers_start)
+            self._metrics.record_codec(StreamCompressor.METRICS_SOURCE, length, leftovers_end,
+                                       hits, perf_counter_ns() - start, raw)
+
+        return leftovers_end
+
+
+    def __predict_range(self, data: bytearray, view: memoryview, bit_array: bitarray,
+                        start: int, stop: int, leftovers_end: int) -> int:
+        """
+        Run the prediction loop over `data[start:stop]`, continuing from the stream context.
+
+        Args:
+            data (bytearray): The pending data.
+            view (memoryview): The packet being built.
+            bit_array (bitarray): The flag bits of the packet.
+            start (int): The first position to predict.
+            stop (int): The position just past the last one to predict.
+            leftovers_end (int): The offset in `view` the next leftover goes to.
+
+        Returns:
+            int: The offset just past the last leftover.
+        """
+        guess_table: bytearray = self._guess_table
+        hash_function = self._config.hash_function
+        context_mask: int = self._config.context_mask
+        context: int = self._context
+        for i in range(start, stop):
+            hash_val = hash_function(context)
+            char: int = data[i]
+
+            if guess_table[hash_val] == char:
+                bit_array[i] = 1
+            else:
+                view[leftovers_end] = char
+                leftovers_end += 1
+                guess_table[hash_val] = char
+            context = ((context << 8) | char) & context_mask
+
+        self._context = context
+        return leftovers_end
+
+
+    @staticmethod
+    def __poor_prefix(prefix_leftovers: int, length: int) -> bool:
+        """
+        Tell whether the first `SAMPLE_SIZE` bytes predict a poor compression ratio.
+
+        Args:
+            prefix_leftovers (int): The number of leftovers among the first `SAMPLE_SIZE` bytes.
+            length (int): The number of pending bytes.
+
+        Returns:
+            bool: True if the packet, compressed at the miss rate of its prefix, would
+                  take more than `RAW_THRESHOLD` of the raw size.
+        """
+        miss_rate: float = prefix_leftovers / StreamCompressor.SAMPLE_SIZE
+        projected: float = varint_size(length) + (length + 7) // 8 + miss_rate * length
+        return projected > StreamCompressor.RAW_THRESHOLD * length
+
+
+    def flush(self) -> bytearray:
+        """
+        Compress the pending data as one packet.
+
+        Returns:
+            bytearray: The compressed packet.
+
+        Raises:
+            ValueError: If nothing is pending.
+        """
+        result: bytearray = bytearray(self.max_packet_size(len(self._pending)))
+        del result[self.flush_into(result):]
+
+        return result
@@ -0,0 +1,220 @@
+from time import perf_counter_ns
+
+from bitarray import bitarray
+from Metrics import MetricsRegistry
+from .CodecConfig import DEFAULT, CodecConfig
+from .Dictionary import Dictionary, get_dictionary
+from .decoder import decode_into
+from .varint import decode_varint
+
+class StreamDecompressor:
+    """
+    Stateful Predictor decompressor for packets produced by `StreamCompressor`.
+
+    The guess table and the context are kept across packets, mirroring the compressor,
+    so packets must be fed in the order they were produced, to a decompressor created
+    with the same `CodecConfig` as the compressor. Each packet passed to `feed` is
+    decompressed right away and its output accumulates until `flush`.
+
+    Attributes:
+        METRICS_SOURCE (str): The name this codec publishes its metrics under.
+        SAMPLE_SIZE (int): The length of the prefix of a raw packet the compressor has
+                           entered into its guess table. Must match `StreamCompressor.SAMPLE_SIZE`.
+        _config (CodecConfig): The codec parameters of the stream.
+        _initial_table (bytes | memoryview): The table a stream starts from, blanks or a shared dictionary.
+        _dictionary (int | None): The id of the dictionary priming the guess table, if any.
+        _guess_table (bytearray): The guess table, kept for the lifetime of the stream.
+        _context (int): The last `order` bytes of the previous packet as a rolling context.
+        _output (bytearray): Data decompressed since the last flush.
+        _metrics (MetricsRegistry | None): The registry every packet is recorded in, if any.
+
+    Methods:
+        config -> CodecConfig: The codec parameters of the stream.
+        dictionary -> int | None: The id of the dictionary priming the guess table.
+        pending -> int: The number of bytes decompressed since the last flush.
+        reset() -> None: Starts a new stream with a blank or primed guess table.
+        feed(packet: bytes | memoryview) -> None: Decompresses one packet.
+        feed_raw(packet: bytes | memoryview) -> None: Takes one raw packet.
+        flush_into(dst: bytearray | memoryview) -> int: Moves the decompressed data into `dst`.
+        flush() -> bytes: Returns the data decompressed since the last flush.
+    """
+    METRICS_SOURCE = "stream_decompression"
+    SAMPLE_SIZE = 128
+
+    def __init__(self, metrics: MetricsRegistry | None = None, config: CodecConfig = DEFAULT, dictionary: int | None = None) -> None:
+        """
+        Initialize the StreamDecompressor with a blank or primed guess table and an empty context.
+
+        Args:
+            metrics (MetricsRegistry | None, optional): Registry to record the size, hit rate
+                                                        and time of every packet in. Default is None.
+            config (CodecConfig, optional): The codec parameters. Default is the original codec.
+            dictionary (int | None, optional): The id of a registered dictionary (see `Dictionary`)
+                                               to prime the guess table with. Its configuration is
+                                               used, and the other end must use the same dictionary.
+
+        Raises:
+            ValueError: If the dictionary is not loaded, or was trained for another configuration.
+        """
+        primer: Dictionary | None = None
+        if dictionary is not None:
+            primer = get_dictionary(dictionary)
+            if config is not DEFAULT and config != primer.config:
+                raise ValueError(f"Dictionary {dictionary:#010x} was trained for {primer.config!r}")
+            config = primer.config
+        self._config: CodecConfig = config
+        self._initial_table: bytes | memoryview = config.blank_table if primer is None else primer.table
+        self._dictionary: int | None = dictionary
+        self._guess_table: bytearray = bytearray(self._initial_table)
+        self._context: int = 0
+        self._output: bytearray = bytearray()
+        self._metrics: MetricsRegistry | None = metrics
+
+    @property
+    def config(self) -> CodecConfig:
+        """
+        Get the codec parameters of the stream.
+
+        Returns:
+            CodecConfig: The configuration the decompressor was created with.
+        """
+        return self._config
+
+
+    @property
+    def dictionary(self) -> int | None:
+        """
+        Get the id of the dictionary priming the guess table.
+
+        Returns:
+            int | None: The dictionary id, or None for a blank table.
+        """
+        return self._dictionary
+
+    @property
+    def pending(self) -> int:
+        """
+        Get the number of bytes decompressed since the last flush.
+
+        Returns:
+            int: The number of pending bytes.
+        """
+        return len(self._output)
+
+
+    def reset(self) -> None:
+        """
+        Start a new stream, discarding the guess table, the context and any pending output.
+        """
+        self._guess_table[:] = self._initial_table
+        self._context = 0
+        self._output.clear()
+
+
+    def feed(self, packet: bytes | memoryview) -> None:
+        """
+        Decompress one complete packet and append its payload to the output.
+
+        Args:
+            packet (bytes | memoryview): A packet produced by `StreamCompressor`.
+
+        Raises:
+            ValueError: If the packet is empty or truncated.
+        """
+        if not packet:
+            raise ValueError("Empty packet passed to decompressor")
+        start: int = perf_counter_ns() if self._metrics is not None else 0
+
+        view: memoryview = memoryview(packet)
+        try:
+            length, flags_start = decode_varint(view)
+        except IndexError:
+            raise ValueError("Truncated packet passed to decompressor")
+        leftovers_index: int = flags_start + (length + 7) // 8
+        if len(view) < leftovers_index:
+            raise ValueError("Truncated packet passed to decompressor")
+        flag_bits: bitarray = bitarray(buffer=view[flags_start:leftovers_index])
+        hits: int = flag_bits.count()
+        if leftovers_index + length - hits != len(view):
+            raise ValueError("Packet length does not match its flag bits")
+
+        self._context = decode_into(flag_bits[:length], view[leftovers_index:], self._guess_table,
+                                    self._context, self._config, self._output)
+
+        if self._metrics is not None:
+            self._metrics.record_codec(StreamDecompressor.METRICS_SOURCE, length, len(view),
+                                       hits, perf_counter_ns() - start)
+
+
+    def feed_raw(self, packet: bytes | memoryview) -> None:
+        """
+        Take one raw packet, written by an adaptive `StreamCompressor`, and append it to the output.
+
+        Args:
+            packet (bytes | memoryview): The uncompressed data.
+
+        Raises:
+            ValueError: If the packet is empty.
+
+        The data is copied as is. Only its first `SAMPLE_SIZE` bytes, which the compressor
+        sampled before giving up, are entered into the guess table, and the context moves
+        on to the last `order` bytes of the packet, exactly as on the compressing side.
+        """
+        if not packet:
+            raise ValueError("Empty packet passed to decompressor")
+        start: int = perf_counter_ns() if self._metrics is not None else 0
+
+        view: memoryview = memoryview(packet)
+        guess_table: bytearray = self._guess_table
+        hash_function = self._config.hash_function
+        context_mask: int = self._config.context_mask
+        context: int = self._context
+        for char in view[:StreamDecompressor.SAMPLE_SIZE]:
+            guess_table[hash_function(context)] = char
+            context = ((context << 8) | char) & context_mask
+
+        if len(view) > StreamDecompressor.SAMPLE_SIZE:
+            context = int.from_bytes(view[-self._config.order:], "big")
+        self._context = context
+        self._output += view
+
+        if self._metrics is not None:
+            self._metrics.record_codec(StreamDecompressor.METRICS_SOURCE, len(view), len(view),
+                                       0, perf_counter_ns() - start, True)
+
+
+    def flush_into(self, dst: bytearray | memoryview) -> int:
+        """
+        Move the data decompressed since the last flush into a caller-supplied buffer.
+
+        Args:
+            dst (bytearray | memoryview): The buffer receiving the data. It must hold at
+                                          least `pending` bytes.
+
+        Returns:
+            int: The number of bytes written to `dst`.
+
+        Raises:
+            ValueError: If `dst` is too small.
+        """
+        length: int = len(self._output)
+        if len(dst) < length:
+            raise ValueError("Destination buffer too small for decompressed data")
+
+        dst[:length] = self._output
+        self._output.clear()
+
+        return length
+
+
+    def flush(self) -> bytes:
+        """
+        Return and clear the data decompressed since the last flush.
+
+        Returns:
+            bytes: The decompressed data.
+        """
+        result: bytes = bytes(self._output)
+        self._output.clear()
+
+        return result
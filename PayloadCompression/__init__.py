@@ -4,6 +4,15 @@ This module provides the public interface for compression and decompression func
 It imports and exposes the following classes:
 - Compression: A class responsible for compressing data.
 - Decompression: A class responsible for decompressing data.
+- StreamCompressor: A class compressing a sequence of packets with a guess table kept across them.
+- StreamDecompressor: A class decompressing the packets produced by StreamCompressor.
+- ContainerWriter: A class writing large payloads as a block container with bounded memory.
+- ContainerReader: A class giving random access to the blocks of a container.
+- ParallelCompression: A class compressing large payloads into a container on a process pool.
+- ParallelDecompression: A class decompressing containers on a process pool.
+- CodecConfig: A class holding the context order, table size and hash function shared by the codecs.
+- Dictionary: A class holding a guess table primed from a sample corpus, trained, saved and memory-mapped.
+- load_dictionary: A function mapping a saved dictionary and registering it for the codecs under its id.
 
 This module sets up the public API for data compression and decompression.
 
@@ -12,7 +21,15 @@ Attributes:
                     when `from module import *` is used.
 """
 
+from .CodecConfig import CodecConfig
+from .Dictionary import Dictionary, load_dictionary
 from .Compression import Compression
 from .Decompression import Decompression
+from .StreamCompression import StreamCompressor
+from .StreamDecompression import StreamDecompressor
+from .Container import ContainerWriter, ContainerReader
+from .ParallelCompression import ParallelCompression, ParallelDecompression
 
-__all__ = ['Compression', 'Decompression']
+__all__ = ['Compression', 'Decompression', 'StreamCompressor', 'StreamDecompressor',
+           'ContainerWriter', 'ContainerReader', 'ParallelCompression', 'ParallelDecompression',
+           'CodecConfig', 'Dictionary', 'load_dictionary']
@@ -0,0 +1,381 @@
+"""
+Command line interface for compressing files offline: `python -m PayloadCompression`.
+
+Files are written as block containers (see `Container`). Inputs are memory-mapped
+rather than read, and output is streamed one block at a time, so memory stays
+bounded by the block size whatever the size of the file, including files larger
+than RAM. A `-` input or output, the default, stands for stdin or stdout. Piped
+containers are spooled to a temporary file first, since the block index sits at
+the end of the container.
+
+Subcommands:
+    compress     Compress a file into a container.
+    decompress   Decompress a container.
+    verify       Decompress a container without writing it, optionally comparing it to the original.
+    bench        Compress and decompress a file through a temporary container and report both.
+    train        Train a dictionary (see `Dictionary`) from sample files, one sample per line.
+
+Throughput and ratio are reported on stderr, so they never mix with piped data.
+
+Usage:
+    python -m PayloadCompression compress [INPUT] [-o OUTPUT] [--block-size BYTES]
+                                          [--order K] [--table-bits BITS] [--hash NAME]
+    python -m PayloadCompression decompress [INPUT] [-o OUTPUT]
+    python -m PayloadCompression verify [INPUT] [--original FILE]
+    python -m PayloadCompression bench INPUT [--block-size BYTES] [--order K]
+                                       [--table-bits BITS] [--hash NAME] [--repeat N]
+    python -m PayloadCompression train CORPUS [CORPUS ...] -o OUTPUT [--id ID] [--files]
+                                       [--order K] [--table-bits BITS] [--hash NAME]
+"""
+import argparse
+import shutil
+import sys
+import tempfile
+from contextlib import contextmanager
+from mmap import ACCESS_READ, mmap
+from time import perf_counter
+from typing import BinaryIO, Iterator
+
+from .CodecConfig import DEFAULT, HASH_FUNCTIONS, CodecConfig
+from .Container import DEFAULT_BLOCK_SIZE, ContainerReader, ContainerWriter
+from .Dictionary import Dictionary
+
+STDIO: str = "-"
+
+
+@contextmanager
+def mapped(path: str) -> Iterator[memoryview]:
+    """
+    Map a file, or stdin spooled to a temporary file, read-only into memory.
+
+    Args:
+        path (str): The file, or `STDIO` for stdin.
+
+    Yields:
+        memoryview: A view over the mapped file, released when the context exits.
+    """
+    with (open(path, "rb") if path != STDIO else tempfile.TemporaryFile()) as file:
+        if path == STDIO:
+            shutil.copyfileobj(sys.stdin.buffer, file, DEFAULT_BLOCK_SIZE)
+        with mapped_file(file) as view:
+            yield view
+
+
+@contextmanager
+def mapped_file(file: BinaryIO) -> Iterator[memoryview]:
+    """
+    Map an open file read-only into memory.
+
+    Args:
+        file (BinaryIO): A file opened in binary mode, backed by a file descriptor.
+
+    Yields:
+        memoryview: A view over the whole file, released when the context exits.
+    """
+    file.flush()
+    file.seek(0, 2)
+    if not file.tell():
+        yield memoryview(b"")
+        return
+    mapping: mmap = mmap(file.fileno(), 0, access=ACCESS_READ)
+    view: memoryview = memoryview(mapping)
+    try:
+        yield view
+    finally:
+        view.release()
+        try:
+            mapping.close()
+        except BufferError:
+            # Views held by a propagating traceback still point into the mapping,
+            # which is unmapped once they are collected.
+            pass
+
+
+@contextmanager
+def output(path: str) -> Iterator[BinaryIO]:
+    """
+    Open a file, or stdout, for writing binary data.
+
+    Args:
+        path (str): The file, or `STDIO` for stdout.
+
+    Yields:
+        BinaryIO: The open file. Stdout is flushed but left open.
+    """
+    if path == STDIO:
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+        return
+    with open(path, "wb") as file:
+        yield file
+
+
+def compress(source: memoryview | BinaryIO, sink: BinaryIO, block_size: int = DEFAULT_BLOCK_SIZE,
+             config: CodecConfig = DEFAULT) -> tuple[int, int]:
+    """
+    Compress a mapped file, or a stream read block by block, into a container.
+
+    Args:
+        source (memoryview | BinaryIO): The mapped input, or a binary stream.
+        sink (BinaryIO): The binary file-like object receiving the container.
+        block_size (int, optional): The number of payload bytes per block.
+        config (CodecConfig, optional): The codec parameters. Default is the original codec.
+
+    Returns:
+        tuple: The number of bytes read and the number of bytes written.
+    """
+    counter: _CountingSink = _CountingSink(sink)
+    writer: ContainerWriter = ContainerWriter(counter, block_size, config)
+    read: int = 0
+    if isinstance(source, memoryview):
+        for start in range(0, len(source), block_size):
+            writer.write(source[start:start + block_size])
+        read = len(source)
+    else:
+        block: bytearray = bytearray(block_size)
+        while size := source.readinto(block):
+            writer.write(memoryview(block)[:size])
+            read += size
+    writer.close()
+    return read, counter.written
+
+
+def decompress(container: memoryview, sink: BinaryIO | None) -> int:
+    """
+    Decompress a container block by block.
+
+    Args:
+        container (memoryview): The mapped container.
+        sink (BinaryIO | None): The binary file-like object receiving the payload, or
+                                None to decompress without writing.
+
+    Returns:
+        int: The length of the payload.
+
+    Raises:
+        ValueError: If `container` is not a valid container or a block is corrupt.
+    """
+    reader: ContainerReader = ContainerReader(container)
+    written: int = 0
+    for block in reader.iter_blocks():
+        if sink is not None:
+            sink.write(block)
+        written += len(block)
+    if written != reader.total_length:
+        raise ValueError("Container blocks do not add up to its payload length")
+    return written
+
+
+def compare(container: memoryview, original: memoryview) -> int:
+    """
+    Decompress a container block by block and compare it to the original payload.
+
+    Args:
+        container (memoryview): The mapped container.
+        original (memoryview): The mapped original payload.
+
+    Returns:
+        int: The offset of the first differing byte, or -1 if the payloads are identical.
+    """
+    reader: ContainerReader = ContainerReader(container)
+    offset: int = 0
+    for block in reader.iter_blocks():
+        if original[offset:offset + len(block)] != block:
+            return offset + next(i for i, byte in enumerate(block)
+                                 if offset + i >= len(original) or original[offset + i] != byte)
+        offset += len(block)
+    return -1 if offset == len(original) else offset
+
+
+class _CountingSink:
+    """
+    Binary sink wrapper counting the bytes written through it.
+
+    Attributes:
+        _sink (BinaryIO): The wrapped sink.
+        written (int): The number of bytes written so far.
+    """
+    def __init__(self, sink: BinaryIO) -> None:
+        self._sink: BinaryIO = sink
+        self.written: int = 0
+
+    def write(self, data: bytes | memoryview) -> int:
+        self._sink.write(data)
+        self.written += len(data)
+        return len(data)
+
+
+def report(action: str, payload: int, coded: int, seconds: float) -> None:
+    """
+    Print the sizes, ratio and throughput of one run to stderr.
+    """
+    ratio: float = coded / payload if payload else 1.0
+    rate: float = payload / seconds / 1e6 if seconds else 0.0
+    print(f"{action}: {payload} bytes <-> {coded} bytes, ratio {ratio:.3f}, "
+          f"{seconds:.3f} s, {rate:.2f} MB/s", file=sys.stderr)
+
+
+def _config(args: argparse.Namespace) -> CodecConfig:
+    return CodecConfig(args.order, args.table_bits, args.hash)
+
+
+def _run_compress(args: argparse.Namespace) -> int:
+    start: float = perf_counter()
+    with output(args.output) as sink:
+        if args.input == STDIO:
+            read, written = compress(sys.stdin.buffer, sink, args.block_size, _config(args))
+        else:
+            with mapped(args.input) as source:
+                read, written = compress(source, sink, args.block_size, _config(args))
+    report("compress", read, written, perf_counter() - start)
+    return 0
+
+
+def _run_decompress(args: argparse.Namespace) -> int:
+    start: float = perf_counter()
+    with mapped(args.input) as container, output(args.output) as sink:
+        written: int = decompress(container, sink)
+        size: int = len(container)
+    report("decompress", written, size, perf_counter() - start)
+    return 0
+
+
+def _run_verify(args: argparse.Namespace) -> int:
+    start: float = perf_counter()
+    with mapped(args.input) as container:
+        size: int = len(container)
+        if args.original is None:
+            length: int = decompress(container, None)
+        else:
+            with mapped(args.original) as original:
+                length = len(original)
+                mismatch: int = compare(container, original)
+            if mismatch >= 0:
+                print(f"verify: payload differs from {args.original} at offset {mismatch}", file=sys.stderr)
+                return 1
+    report("verify", length, size, perf_counter() - start)
+    return 0
+
+
+def _run_bench(args: argparse.Namespace) -> int:
+    config: CodecConfig = _config(args)
+    compress_time: float = float("inf")
+    decompress_time: float = float("inf")
+    with mapped(args.input) as source, tempfile.TemporaryFile() as spool:
+        for _ in range(args.repeat):
+            spool.seek(0)
+            spool.truncate()
+            start: float = perf_counter()
+            read, written = compress(source, spool, args.block_size, config)
+            compress_time = min(compress_time, perf_counter() - start)
+
+        with mapped_file(spool) as container:
+            for _ in range(args.repeat):
+                start = perf_counter()
+                mismatch: int = compare(container, source)
+                decompress_time = min(decompress_time, perf_counter() - start)
+
+    report(f"compress   {config!r}", read, written, compress_time)
+    report(f"decompress {config!r}", read, written, decompress_time)
+    if mismatch >= 0:
+        print(f"bench: round trip differs at offset {mismatch}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def lines(view: memoryview) -> Iterator[bytes]:
+    """
+    Iterate over the non-empty lines of a mapped file, without their line endings.
+
+    Args:
+        view (memoryview): A view from `mapped`, over a memory map or an empty file.
+
+    Yields:
+        bytes: A copy of each line, so only one line is held at a time.
+    """
+    start: int = 0
+    while start < len(view):
+        end: int = view.obj.find(b"\n", start)
+        if end < 0:
+            end = len(view)
+        line: bytes = bytes(view[start:end]).rstrip(b"\r")
+        if line:
+            yield line
+        start = end + 1
+
+
+def _run_train(args: argparse.Namespace) -> int:
+    start: float = perf_counter()
+    count: int = 0
+    size: int = 0
+
+    def samples() -> Iterator[bytes]:
+        nonlocal count, size
+        for path in args.corpus:
+            with mapped(path) as corpus:
+                for sample in [bytes(corpus)] if args.files else lines(corpus):
+                    count += 1
+                    size += len(sample)
+                    yield sample
+
+    dictionary: Dictionary = Dictionary.train(samples(), _config(args), args.id)
+    dictionary.save(args.output)
+    primed: int = sum(1 for a, b in zip(dictionary.table, dictionary.config.blank_table) if a != b)
+    print(f"train: {count} samples, {size} bytes, {primed} of "
+          f"{dictionary.config.table_size} entries primed, {dictionary!r} written to {args.output}, "
+          f"{perf_counter() - start:.3f} s", file=sys.stderr)
+    return 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m PayloadCompression",
+                                     description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    params = argparse.ArgumentParser(add_help=False)
+    params.add_argument("--order", type=int, default=DEFAULT.order)
+    params.add_argument("--table-bits", type=int, default=DEFAULT.table_bits)
+    params.add_argument("--hash", choices=HASH_FUNCTIONS, default=DEFAULT.hash_name)
+    codec = argparse.ArgumentParser(add_help=False, parents=[params])
+    codec.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE)
+
+    command = commands.add_parser("compress", parents=[codec], help="compress a file into a container")
+    command.add_argument("input", nargs="?", default=STDIO)
+    command.add_argument("-o", "--output", default=STDIO)
+    command.set_defaults(run=_run_compress)
+
+    command = commands.add_parser("decompress", help="decompress a container")
+    command.add_argument("input", nargs="?", default=STDIO)
+    command.add_argument("-o", "--output", default=STDIO)
+    command.set_defaults(run=_run_decompress)
+
+    command = commands.add_parser("verify", help="check that a container decompresses")
+    command.add_argument("input", nargs="?", default=STDIO)
+    command.add_argument("--original", help="compare the payload with this file")
+    command.set_defaults(run=_run_verify)
+
+    command = commands.add_parser("bench", parents=[codec], help="measure a compression round trip")
+    command.add_argument("input")
+    command.add_argument("--repeat", type=int, default=3)
+    command.set_defaults(run=_run_bench)
+
+    command = commands.add_parser("train", parents=[params], help="train a dictionary from sample files")
+    command.add_argument("corpus", nargs="+")
+    command.add_argument("-o", "--output", required=True)
+    command.add_argument("--id", type=lambda value: int(value, 0),
+                         help="dictionary id, default a CRC-32 of the table")
+    command.add_argument("--files", action="store_true", help="use every file as one sample instead of every line")
+    command.set_defaults(run=_run_train)
+
+    args = parser.parse_args(argv)
+    if args.command == "bench" and args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    try:
+        return args.run(args)
+    except (OSError, ValueError) as e:
+        print(f"{args.command}: {e}", file=sys.stderr)
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,155 @@
+"""
+Shared Predictor decode loop.
+
+Every decompressor reconstructs its output the same way: walk the flag bits, take
+the guess table entry of the current context on a hit, or the next leftover
+(which also replaces the table entry) on a miss. This module runs that loop once
+for all of them, with the per-byte work cut down to the minimum:
+
+- The context is never rebuilt from the output. For orders 1 and 2 the hash of
+  every context is looked up in `CodecConfig.hash_rows`, one row per first byte,
+  so advancing the context is a single row lookup. Longer contexts are kept as a
+  rolling integer and hashed with `CodecConfig.hash_function`.
+- The output is appended to a bytearray, and the leftovers are consumed through an
+  iterator instead of an index.
+- Long runs of misses, found by a regular expression over the flag bytes, are
+  copied to the output in bulk, leaving only the table updates to the loop.
+
+Attributes:
+    MISS_RUN (re.Pattern): Matches the flag bytes of at least `MIN_RUN_BYTES` * 8 consecutive misses.
+    MIN_RUN_BYTES (int): The shortest run of zero flag bytes copied in bulk.
+"""
+import re
+from itertools import islice
+from typing import Iterator
+
+from bitarray import bitarray
+from .CodecConfig import CodecConfig
+
+MIN_RUN_BYTES: int = 8
+MISS_RUN: re.Pattern = re.compile(rb"\x00{%d,}" % MIN_RUN_BYTES)
+
+
+def decode_into(flag_bits: bitarray, leftovers: bytes | memoryview, guess_table: bytearray,
+                context: int, config: CodecConfig, output: bytearray) -> int:
+    """
+    Decode one run of flag bits, appending the reconstructed bytes to `output`.
+
+    Args:
+        flag_bits (bitarray): One bit per output byte, set for a correct guess. Padding
+                              bits must be sliced off by the caller.
+        leftovers (bytes | memoryview): The bytes of the misses, at least as many as
+                                        the cleared flag bits.
+        guess_table (bytearray): The guess table, updated in place.
+        context (int): The last `config.order` bytes before the run, as a rolling context.
+        config (CodecConfig): The codec parameters.
+        output (bytearray): The buffer the decoded bytes are appended to.
+
+    Returns:
+        int: The rolling context after the last decoded byte.
+
+    Raises:
+        ValueError: If the leftovers run out before the flag bits.
+    """
+    length: int = len(flag_bits)
+    if not length:
+        return context
+    start: int = len(output)
+    next_leftover: Iterator[int] = iter(leftovers)
+    flag_bytes: bytes = flag_bits.tobytes()
+    position: int = 0
+    rows: list[list[int]] | None = config.hash_rows
+
+    try:
+        if rows is not None:
+            first: int = (context >> 8) & 0xFF
+            row: list[int] = rows[first]
+            second: int = context & 0xFF
+            for run in MISS_RUN.finditer(flag_bytes):
+                run_start, run_stop = 8 * run.start(), min(8 * run.end(), length)
+                row, second = _rows_loop(flag_bits[position:run_start], next_leftover, guess_table,
+                                         rows, row, second, output)
+                misses: bytes = _take(next_leftover, run_stop - run_start)
+                output += misses
+                for char in misses:
+                    guess_table[row[second]] = char
+                    row = rows[second]
+                    second = char
+                position = run_stop
+            _rows_loop(flag_bits[position:], next_leftover, guess_table, rows, row, second, output)
+        else:
+            hash_function = config.hash_function
+            context_mask: int = config.context_mask
+            for run in MISS_RUN.finditer(flag_bytes):
+                run_start, run_stop = 8 * run.start(), min(8 * run.end(), length)
+                context = _rolling_loop(flag_bits[position:run_start], next_leftover, guess_table,
+                                        hash_function, context_mask, context, output)
+                misses = _take(next_leftover, run_stop - run_start)
+                output += misses
+                for char in misses:
+                    guess_table[hash_function(context)] = char
+                    context = ((context << 8) | char) & context_mask
+                position = run_stop
+            _rolling_loop(flag_bits[position:], next_leftover, guess_table,
+                          hash_function, context_mask, context, output)
+    except StopIteration:
+        raise ValueError("Fewer leftovers than misses in the flag bits")
+
+    if length >= config.order:
+        return int.from_bytes(output[-config.order:], "big")
+    return ((context << (8 * length)) | int.from_bytes(output[start:], "big")) & config.context_mask
+
+
+def _take(next_leftover: Iterator[int], count: int) -> bytes:
+    """
+    Take the leftovers of a run of `count` misses at once.
+    """
+    misses: bytes = bytes(islice(next_leftover, count))
+    if len(misses) < count:
+        raise StopIteration
+    return misses
+
+
+def _rows_loop(flag_bits: bitarray, next_leftover: Iterator[int], guess_table: bytearray,
+               rows: list[list[int]], row: list[int], second: int, output: bytearray) -> tuple[list[int], int]:
+    """
+    Decode flag bits with the precomputed hashes of an order 1 or 2 configuration.
+
+    Returns:
+        tuple: The hash row of the last but one byte and the last byte.
+    """
+    take = next_leftover.__next__
+    append = output.append
+    for bit in flag_bits:
+        hash_val: int = row[second]
+        if bit:
+            char: int = guess_table[hash_val]
+        else:
+            char = take()
+            guess_table[hash_val] = char
+        append(char)
+        row = rows[second]
+        second = char
+    return row, second
+
+
+def _rolling_loop(flag_bits: bitarray, next_leftover: Iterator[int], guess_table: bytearray,
+                  hash_function, context_mask: int, context: int, output: bytearray) -> int:
+    """
+    Decode flag bits with a rolling context hashed per byte, for orders 3 and 4.
+
+    Returns:
+        int: The rolling context after the last decoded byte.
+    """
+    take = next_leftover.__next__
+    append = output.append
+    for bit in flag_bits:
+        hash_val: int = hash_function(context)
+        if bit:
+            char: int = guess_table[hash_val]
+        else:
+            char = take()
+            guess_table[hash_val] = char
+        append(char)
+        context = ((context << 8) | char) & context_mask
+    return context
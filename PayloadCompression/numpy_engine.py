@@ -0,0 +1,66 @@
+"""
+Optional NumPy-backed engine for the Predictor compressor.
+
+The guess table only ever holds the character that followed the most recent
+occurrence of a hash, so the prediction for position `i` is simply the
+character after the previous position sharing the same hash (or the blank
+default when there is none). That turns the sequential table-update loop into
+a stable sort over the hashes, which NumPy runs in a handful of vectorized
+passes.
+
+Attributes:
+    HAS_NUMPY (bool): True when NumPy could be imported.
+"""
+try:
+    import numpy as np
+    HAS_NUMPY: bool = True
+except ImportError:  # pragma: no cover - depends on the environment
+    np = None
+    HAS_NUMPY: bool = False
+
+BLANK: int = ord(' ')
+
+
+def predict(data: bytes | memoryview, k: int = 2) -> tuple[bytes, bytes]:
+    """
+    Run the order-2 Predictor over `data` in vectorized form.
+
+    Args:
+        data (bytes | memoryview): The payload to compress.
+        k (int): The context length. Only 2 is supported.
+
+    Returns:
+        tuple: A tuple containing:
+               - leftovers: The bytes that were not predicted, starting with
+                            the first `k` bytes of the payload.
+               - flags: The packed flag bits, one bit per input byte, where
+                        a set bit marks a correct guess.
+
+    Raises:
+        RuntimeError: If NumPy is not installed.
+    """
+    if not HAS_NUMPY:
+        raise RuntimeError("NumPy engine requested but NumPy is not installed")
+
+    symbols = np.frombuffer(data, dtype=np.uint8)
+    wide = symbols.astype(np.uint32)
+    targets = symbols[k:]
+
+    # Same arithmetic as the DJB hash of `CodecConfig.DEFAULT`, one pass per context byte.
+    hashes = ((((5381 * 33) ^ wide[:-2]) * 33) ^ wide[1:-1]) & 0xFFFF
+
+    order = np.argsort(hashes, kind="stable")
+    sorted_hashes = hashes[order]
+    predicted_sorted = np.full(len(targets), BLANK, dtype=np.uint8)
+    repeated = sorted_hashes[1:] == sorted_hashes[:-1]
+    predicted_sorted[1:] = np.where(repeated, targets[order[:-1]], BLANK)
+
+    predicted = np.empty_like(predicted_sorted)
+    predicted[order] = predicted_sorted
+    hits = predicted == targets
+
+    bits = np.zeros(len(symbols), dtype=bool)
+    bits[k:] = hits
+    leftovers = np.concatenate((symbols[:k], targets[~hits]))
+
+    return leftovers.tobytes(), np.packbits(bits).tobytes()
@@ -0,0 +1,81 @@
+"""
+Unsigned LEB128 variable-length integers.
+
+Seven bits of the value are stored per byte, least significant group first,
+with the high bit set on every byte except the last. Values below 128 take a
+single byte.
+"""
+
+MAX_VARINT_SIZE: int = 10
+"""int: The longest encoding accepted by `decode_varint`, that of a 64-bit value."""
+
+
+def varint_size(value: int) -> int:
+    """
+    Return the number of bytes needed to encode `value`.
+
+    Args:
+        value (int): A non-negative integer.
+
+    Returns:
+        int: The encoded size in bytes.
+    """
+    size: int = 1
+    while value >= 0x80:
+        value >>= 7
+        size += 1
+    return size
+
+
+def encode_varint(value: int, dst: bytearray | memoryview, offset: int = 0) -> int:
+    """
+    Write `value` into `dst` at `offset`.
+
+    Args:
+        value (int): A non-negative integer.
+        dst (bytearray | memoryview): The destination buffer.
+        offset (int, optional): The position of the first encoded byte. Default is 0.
+
+    Returns:
+        int: The offset just past the encoded value.
+
+    Raises:
+        ValueError: If `value` is negative.
+    """
+    if value < 0:
+        raise ValueError("Negative value passed to varint encoder")
+
+    while value >= 0x80:
+        dst[offset] = (value & 0x7F) | 0x80
+        value >>= 7
+        offset += 1
+    dst[offset] = value
+    return offset + 1
+
+
+def decode_varint(src: bytes | memoryview, offset: int = 0) -> tuple[int, int]:
+    """
+    Read a value from `src` at `offset`.
+
+    Args:
+        src (bytes | memoryview): The buffer holding the encoded value.
+        offset (int, optional): The position of the first encoded byte. Default is 0.
+
+    Returns:
+        tuple: A tuple containing the decoded value and the offset just past it.
+
+    Raises:
+        IndexError: If `src` ends in the middle of the value.
+        ValueError: If the value runs longer than `MAX_VARINT_SIZE` bytes.
+    """
+    value: int = 0
+    shift: int = 0
+    while True:
+        byte: int = src[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+        if shift >= 7 * MAX_VARINT_SIZE:
+            raise ValueError("Varint is longer than the maximum varint size")
@@ -0,0 +1,76 @@
+"""
+Throughput of the batch API against a loop over the single-message API.
+
+Splits the chat corpus into `--messages` lines and compresses them once with
+`payload_compression` per message and once with `compress_many`, then decompresses
+them with `payload_decompression` per message and with `decompress_many`. Both
+paths are checked to produce the same payloads. The report shows the best time
+of `--repeat` runs and the speedup of the batch API.
+
+Usage:
+    python benchmarks/batch_api.py [--messages N] [--repeat N]
+"""
+import argparse
+import os
+import sys
+from time import perf_counter
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import chat
+from PayloadCompression import Compression, Decompression
+
+
+def chat_lines(messages: int) -> list[str]:
+    """
+    Return `messages` non-empty chat lines.
+    """
+    lines: list[str] = []
+    size: int = 64 * messages
+    while len(lines) < messages:
+        lines = [line for line in chat(size).decode("utf-8").splitlines() if line]
+        size *= 2
+    return lines[:messages]
+
+
+def best_of(repeat: int, function: Callable[[], object]) -> float:
+    """
+    Return the shortest time in seconds of `repeat` calls of `function`.
+    """
+    times: list[float] = []
+    for _ in range(repeat):
+        start: float = perf_counter()
+        function()
+        times.append(perf_counter() - start)
+    return min(times)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    lines: list[str] = chat_lines(args.messages)
+    compressor, decompressor = Compression(), Decompression()
+    single: list[bytearray] = [compressor.payload_compression(line) for line in lines]
+    packed, offsets = compressor.compress_many(lines)
+    assert [bytes(packed[offsets[i]:offsets[i + 1]]) for i in range(len(lines))] == list(map(bytes, single))
+    output, output_offsets = decompressor.decompress_many(packed, offsets)
+    assert [output[output_offsets[i]:output_offsets[i + 1]].decode("utf-8") for i in range(len(lines))] == lines
+
+    print(f"{len(lines)} messages, {sum(map(len, lines)) / len(lines):.1f} bytes on average")
+    print(f"{'':<12} {'loop ms':>9} {'batch ms':>9} {'speedup':>8}")
+    for name, loop, batch in (
+            ("compress", lambda: [compressor.payload_compression(line) for line in lines],
+             lambda: compressor.compress_many(lines)),
+            ("decompress", lambda: [decompressor.payload_decompression(payload) for payload in single],
+             lambda: decompressor.decompress_many(packed, offsets))):
+        loop_time: float = best_of(args.repeat, loop)
+        batch_time: float = best_of(args.repeat, batch)
+        print(f"{name:<12} {loop_time * 1e3:>9.1f} {batch_time * 1e3:>9.1f} {loop_time / batch_time:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
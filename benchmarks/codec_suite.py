@@ -0,0 +1,252 @@
+"""
+Codec benchmark suite with baseline regression tracking.
+
+Runs compression and decompression for every codec over every content type
+and size of the corpus, and reports throughput (MB/s and ns/byte), compression
+ratio (compressed size / original size), and the memory behaviour of a single
+call: the tracemalloc peak and the number of memory blocks the call leaves
+allocated. The stdlib zlib and lzma codecs are included as reference points.
+Throughput is the best of `--repeat` timings, each repeating the call for at
+least `MIN_TIME`, taken in separate rounds over the whole suite so that a slow
+spell of the machine does not count.
+
+Results can be written as JSON and compared against a stored run. Throughput
+is compared relative to zlib timed under the same load, since a shared or
+throttled machine can run a whole suite a third slower than the last one. Any
+Predictor measurement whose throughput drops by more than `--threshold`, any
+Predictor codec whose throughput drops by more than `--mean-threshold` on
+average, and any measurement whose ratio grows by more than `--ratio-threshold`
+is reported and makes the script exit with status 1. Single timings still vary,
+so the per-measurement threshold is loose; the ratio is deterministic and its
+threshold tight.
+
+Usage:
+    python benchmarks/codec_suite.py [--quick | --sizes BYTES ...] [--output run.json]
+                                     [--baseline baseline.json] [--threshold 0.35]
+                                     [--mean-threshold 0.1] [--ratio-threshold 0.01] [--repeat 5]
+"""
+import argparse
+import json
+import lzma
+import math
+import os
+import platform
+import statistics
+import sys
+import tracemalloc
+import zlib
+from time import perf_counter
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import CONTENT_TYPES
+from PayloadCompression import Compression, Decompression, StreamCompressor, StreamDecompressor
+
+SIZES: tuple[int, ...] = (64, 1024, 16 * 1024, 256 * 1024, 1024 * 1024)
+QUICK_SIZES: tuple[int, ...] = (64, 1024, 16 * 1024)
+MIN_TIME: float = 0.1
+REPEATS: int = 5
+
+
+def predictor_codec() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """The one-shot Predictor codec writing into caller-supplied buffers."""
+    compressor, decompressor = Compression(), Decompression()
+
+    def compress(data: bytes) -> bytes:
+        dst: bytearray = bytearray(compressor.max_compressed_size(len(data)))
+        return dst[:compressor.compress_into(data, dst)]
+
+    def decompress(data: bytes) -> bytes:
+        dst: bytearray = bytearray(decompressor.decompressed_size(data))
+        decompressor.decompress_into(data, dst)
+        return dst
+
+    return compress, decompress
+
+
+def stream_codec() -> tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]:
+    """The stream codec, reset before every call so each one starts from a blank table."""
+    compressor, decompressor = StreamCompressor(), StreamDecompressor()
+
+    def compress(data: bytes) -> bytes:
+        compressor.reset()
+        compressor.feed(data)
+        return compressor.flush()
+
+    def decompress(data: bytes) -> bytes:
+        decompressor.reset()
+        decompressor.feed(data)
+        return decompressor.flush()
+
+    return compress, decompress
+
+
+CODECS: dict[str, tuple[Callable, bool]] = {
+    "predictor": (predictor_codec, False),
+    "predictor-stream": (stream_codec, False),
+    "zlib": (lambda: (zlib.compress, zlib.decompress), True),
+    "lzma": (lambda: (lzma.compress, lzma.decompress), True),
+}
+
+
+def time_call(function: Callable[[bytes], bytes], data: bytes) -> float:
+    """
+    Return the mean seconds per call, repeating the call for at least `MIN_TIME`.
+    """
+    calls: int = 0
+    start: float = perf_counter()
+    while True:
+        function(data)
+        calls += 1
+        elapsed: float = perf_counter() - start
+        if elapsed >= MIN_TIME:
+            return elapsed / calls
+
+
+def memory_of_call(function: Callable[[bytes], bytes], data: bytes) -> tuple[int, int]:
+    """
+    Return the tracemalloc peak in bytes and the number of blocks left allocated by one call.
+    """
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = function(data)
+    peak: int = tracemalloc.get_traced_memory()[1]
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del result
+    blocks: int = sum(max(stat.count_diff, 0) for stat in after.compare_to(before, "lineno"))
+    return peak, blocks
+
+
+def run_suite(sizes: tuple[int, ...], repeat: int = REPEATS) -> list[dict]:
+    """
+    Measure every codec, content type and size, and return one record per measurement.
+
+    Every measurement is timed once per round, and the suite runs `repeat` rounds, so
+    the timings kept, the best of each measurement, are spread over the whole run
+    rather than taken back to back during the same slow spell of a busy machine.
+    """
+    records: list[dict] = []
+    timed: list[tuple[dict, Callable[[bytes], bytes], bytes]] = []
+    for codec_name, (factory, reference) in CODECS.items():
+        compress, decompress = factory()
+        for content, generate in CONTENT_TYPES.items():
+            for size in sizes:
+                data: bytes = generate(size)
+                compressed: bytes = bytes(compress(data))
+                if bytes(decompress(compressed)) != data:
+                    raise AssertionError(f"{codec_name} failed to round-trip {content}/{size}")
+
+                for direction, function, source in (("compress", compress, data),
+                                                    ("decompress", decompress, compressed)):
+                    peak, blocks = memory_of_call(function, source)
+                    records.append({
+                        "codec": codec_name, "reference": reference, "direction": direction,
+                        "content": content, "size": size, "seconds": float("inf"),
+                        "ratio": len(compressed) / size, "peak_bytes": peak, "allocated_blocks": blocks,
+                    })
+                    timed.append((records[-1], function, source))
+
+    # The codecs of a payload and direction are timed one after the other, so that the
+    # zlib timing they are compared with is taken under the same load.
+    point = lambda record: (record["content"], record["size"], record["direction"])
+    timed.sort(key=lambda entry: point(entry[0]))
+    relative: dict[int, list[float]] = {id(record): [] for record in records}
+    for _ in range(repeat):
+        seconds: dict[int, float] = {}
+        for record, function, source in timed:
+            seconds[id(record)] = time_call(function, source)
+            record["seconds"] = min(record["seconds"], seconds[id(record)])
+        zlib_seconds: dict[tuple, float] = {point(record): seconds[id(record)] for record, _, _ in timed
+                                            if record["codec"] == "zlib"}
+        for record, _, _ in timed:
+            relative[id(record)].append(zlib_seconds[point(record)] / seconds[id(record)])
+    for record in records:
+        best: float = record.pop("seconds")
+        record["mb_per_s"] = record["size"] / best / 1e6
+        record["ns_per_byte"] = best / record["size"] * 1e9
+        record["zlib_relative"] = statistics.median(relative[id(record)])
+    for compressed, decompressed in zip(records[::2], records[1::2]):
+        print(f"{compressed['codec']:<17} {compressed['content']:<11} {compressed['size']:>7}  "
+              f"{compressed['mb_per_s']:>8.2f} MB/s in  {decompressed['mb_per_s']:>8.2f} MB/s out  "
+              f"ratio {decompressed['ratio']:.3f}", file=sys.stderr)
+    return records
+
+
+def compare(records: list[dict], baseline: list[dict], threshold: float, mean_threshold: float,
+            ratio_threshold: float) -> list[str]:
+    """
+    Return a description of every Predictor measurement that regressed against the baseline.
+
+    Throughput is compared relative to zlib on the same payload (see `run_suite`), which
+    cancels out a machine that is slower as a whole. A measurement regresses when it drops
+    by more than `threshold`, and a codec in one direction when the geometric mean of its
+    measurements drops by more than `mean_threshold`. The ratio regresses when it grows
+    by more than `ratio_threshold`.
+    """
+    key = lambda record: (record["codec"], record["direction"], record["content"], record["size"])
+    previous: dict = {key(record): record for record in baseline}
+    regressions: list[str] = []
+    changes: dict[tuple[str, str], list[float]] = {}
+    for record in records:
+        old: dict | None = previous.get(key(record))
+        if record["reference"] or old is None:
+            continue
+        name: str = "/".join(str(part) for part in key(record))
+        # Baselines written before the zlib timings were kept compare absolute throughput.
+        field: str = "zlib_relative" if "zlib_relative" in old else "mb_per_s"
+        change: float = record[field] / old[field]
+        changes.setdefault((record["codec"], record["direction"]), []).append(change)
+        if change < 1 - threshold:
+            regressions.append(f"{name}: throughput {old['mb_per_s']:.2f} -> {record['mb_per_s']:.2f} MB/s, "
+                               f"{change - 1:+.0%} against zlib")
+        if record["ratio"] > old["ratio"] * (1 + ratio_threshold):
+            regressions.append(f"{name}: ratio {old['ratio']:.3f} -> {record['ratio']:.3f}")
+    for (codec, direction), ratios in changes.items():
+        mean: float = math.exp(sum(math.log(ratio) for ratio in ratios) / len(ratios))
+        if mean < 1 - mean_threshold:
+            regressions.append(f"{codec}/{direction}: throughput {mean - 1:+.1%} against zlib on average")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="skip the largest payloads")
+    parser.add_argument("--sizes", type=int, nargs="+", help="measure these payload sizes only")
+    parser.add_argument("--output", help="write the results to this JSON file")
+    parser.add_argument("--baseline", help="compare against the results in this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.35,
+                        help="throughput drop of one measurement counted as a regression (default 0.35)")
+    parser.add_argument("--mean-threshold", type=float, default=0.10,
+                        help="average throughput drop of a codec counted as a regression (default 0.10)")
+    parser.add_argument("--ratio-threshold", type=float, default=0.01,
+                        help="relative ratio growth counted as a regression (default 0.01)")
+    parser.add_argument("--repeat", type=int, default=REPEATS,
+                        help=f"timings per measurement, the best of which counts (default {REPEATS})")
+    args = parser.parse_args()
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+
+    records: list[dict] = run_suite(tuple(args.sizes) if args.sizes else QUICK_SIZES if args.quick else SIZES,
+                                    args.repeat)
+    run: dict = {"python": platform.python_version(), "machine": platform.machine(), "results": records}
+    if args.output:
+        with open(args.output, "w") as out:
+            json.dump(run, out, indent=1)
+
+    if args.baseline:
+        with open(args.baseline) as base:
+            regressions: list[str] = compare(records, json.load(base)["results"], args.threshold,
+                                             args.mean_threshold, args.ratio_threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,77 @@
+"""
+Deterministic sample payloads for the codec benchmarks.
+
+Every generator returns exactly `size` bytes and always the same bytes for the
+same size, so results from different runs can be compared.
+"""
+from json import dumps
+from random import Random
+
+WORDS: list[str] = ("hey hi ok thanks sure lunch meeting tomorrow today later review code push "
+                    "branch server client message compression table guess fix bug test build "
+                    "deploy the a to and is are we you it for on at with can will see").split()
+
+
+def chat(size: int) -> bytes:
+    """Short conversational lines."""
+    rng: Random = Random(1)
+    lines: list[str] = []
+    length: int = 0
+    while length < size:
+        line: str = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 12))).capitalize()
+        line += rng.choice(["?", "!", ".", ""]) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def logs(size: int) -> bytes:
+    """Timestamped application log lines."""
+    rng: Random = Random(2)
+    levels: list[str] = ["INFO", "INFO", "INFO", "DEBUG", "WARN", "ERROR"]
+    lines: list[str] = []
+    length: int = 0
+    second: int = 0
+    while length < size:
+        second += rng.randint(0, 3)
+        line: str = (f"2024-05-01 12:{second // 60 % 60:02d}:{second % 60:02d},{rng.randint(0, 999):03d} "
+                     f"{rng.choice(levels):<5} [worker-{rng.randint(1, 8)}] "
+                     f"{rng.choice(['accepted connection', 'sent message', 'closed session', 'retrying connect'])} "
+                     f"peer=10.0.{rng.randint(0, 3)}.{rng.randint(1, 254)}:{rng.randint(1024, 65535)}\n")
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def json_records(size: int) -> bytes:
+    """One JSON object per line."""
+    rng: Random = Random(3)
+    lines: list[str] = []
+    length: int = 0
+    while length < size:
+        line: str = dumps({"id": rng.randint(1, 10 ** 6), "user": rng.choice(["alice", "bob", "carol", "dave"]),
+                           "text": " ".join(rng.choice(WORDS) for _ in range(rng.randint(1, 8))),
+                           "read": rng.random() < 0.5, "ts": 1714560000 + rng.randint(0, 86400)}) + "\n"
+        lines.append(line)
+        length += len(line)
+    return "".join(lines).encode()[:size]
+
+
+def random_bytes(size: int) -> bytes:
+    """Incompressible data."""
+    return Random(4).randbytes(size)
+
+
+def repetitive(size: int) -> bytes:
+    """The same short phrase over and over."""
+    phrase: bytes = b"ping from node one to node two. "
+    return (phrase * (size // len(phrase) + 1))[:size]
+
+
+CONTENT_TYPES: dict = {
+    "chat": chat,
+    "logs": logs,
+    "json": json_records,
+    "random": random_bytes,
+    "repetitive": repetitive,
+}
@@ -0,0 +1,117 @@
+"""
+Per-message latency and peak memory of the guess table handling.
+
+Compares the reusable bytearray guess tables owned by `Compression` and
+`Decompression` against the previous behaviour, where every call built a
+fresh `[' '] * 65536` list. The memory figure is the tracemalloc peak of
+creating the codec and running the round trips, so it counts the tables and
+the per-call allocations rather than the interpreter and its imports. It is
+taken in a separate pass, after the timed one, since tracing slows every
+allocation. Each mode runs in its own interpreter, and only the compact mode
+imports `PayloadCompression`.
+
+Usage:
+    python benchmarks/guess_table.py [--messages N] [--length L]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tracemalloc
+from time import perf_counter
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MESSAGE: str = "hey, are we still on for lunch tomorrow at noon? "
+
+
+def legacy_roundtrip(S: str) -> str:
+    """
+    Compress and decompress `S` allocating a list-based guess table per call,
+    as `Compression` and `Decompression` did before the tables were reused.
+    """
+    def hash_function(substring: str) -> int:
+        hash_val = 5381
+        hash_val = ((hash_val << 5) + hash_val) ^ ord(substring[0])
+        hash_val = ((hash_val << 5) + hash_val) ^ ord(substring[1])
+        return hash_val % 65536
+
+    guess_table: list[str] = [' '] * 65536
+    leftovers: list[str] = list(S[:2])
+    flags: list[bool] = [False] * len(S)
+    for i in range(2, len(S)):
+        hash_val = hash_function(S[i - 2:i])
+        if guess_table[hash_val] == S[i]:
+            flags[i] = True
+        else:
+            leftovers.append(S[i])
+            guess_table[hash_val] = S[i]
+
+    guess_table = [' '] * 65536
+    text: list[str] = leftovers[:2]
+    leftovers_index: int = 2
+    for i in range(2, len(flags)):
+        hash_val = hash_function(''.join(text[i - 2:i]))
+        if flags[i]:
+            text.append(guess_table[hash_val])
+        else:
+            text.append(leftovers[leftovers_index])
+            guess_table[hash_val] = leftovers[leftovers_index]
+            leftovers_index += 1
+    return ''.join(text)
+
+
+def make_roundtrip(mode: str) -> Callable[[str], str]:
+    """
+    Return the round trip of the given mode, creating the codec and its tables.
+    """
+    if mode == "legacy":
+        return legacy_roundtrip
+    from PayloadCompression import Compression, Decompression
+    compressor, decompressor = Compression(), Decompression()
+    return lambda S: decompressor.payload_decompression(compressor.payload_compression(S))
+
+
+def run(mode: str, messages: int, length: int) -> None:
+    """
+    Time `messages` round trips in the given mode, measure their peak memory and print one result line.
+    """
+    payload: str = (MESSAGE * (length // len(MESSAGE) + 1))[:length]
+    roundtrip: Callable[[str], str] = make_roundtrip(mode)
+    assert roundtrip(payload) == payload
+    start: float = perf_counter()
+    for _ in range(messages):
+        roundtrip(payload)
+    elapsed: float = perf_counter() - start
+
+    tracemalloc.start()
+    roundtrip = make_roundtrip(mode)
+    for _ in range(messages):
+        roundtrip(payload)
+    peak: int = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{mode:<8} {elapsed / messages * 1e6:>12.1f} {peak / 1024:>14.1f}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--length", type=int, default=40)
+    parser.add_argument("--mode", choices=["legacy", "compact"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run(args.mode, args.messages, args.length)
+        return
+
+    print(f"{args.messages} round trips of a {args.length}-character message")
+    print(f"{'mode':<8} {'us/message':>12} {'peak (KiB)':>14}")
+    for mode in ("legacy", "compact"):
+        subprocess.run([sys.executable, __file__, "--mode", mode,
+                        "--messages", str(args.messages), "--length", str(args.length)],
+                       check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""
+Headless load generator: end-to-end latency and throughput of a running node.
+
+Connects to a running `Server` or `SelectorServer` (e.g. the server of
+`python main.py config.json`) like a `Client` does, opens a session and sends
+messages at `--rate` messages per second, or as fast as possible with a rate of 0.
+Message sizes follow `--sizes`, and their text comes from `--content`; every
+message starts with its sequence number and its send time in nanoseconds, so
+messages can be told apart and timed in the server's output as well.
+
+Latency is measured through the session handshake: a `SESSION_HELLO` on a
+connection whose session is already open is answered with the number of messages
+the server has processed, i.e. decompressed and delivered. A hello is sent behind
+every `--probe-every` messages, and every message counted by an answer is done at
+the time the answer arrives. With a rate, latency is taken from the time a message
+was due rather than the time it was sent, so a generator falling behind does not
+hide the queueing it causes.
+
+Each of the `--rates` is run for `--duration` seconds on the same session, which
+shows where the server or the codec saturates. The report lists, per rate, the
+messages per second processed by the server, the end-to-end p50/p95/p99 latency,
+and the bytes saved by compression over the wire, frame headers included.
+
+Usage:
+    python benchmarks/load_generator.py [--host H] [--port P] [--rates R,R,...] [--duration S]
+                                        [--sizes fixed:N | uniform:MIN:MAX | exp:MEAN]
+                                        [--content chat|logs|json|random] [--probe-every N]
+                                        [--dictionary PATH] [--link-rate BYTES_PER_S]
+"""
+import argparse
+import os
+import sys
+import threading
+from collections import deque
+from random import Random
+from socket import socket
+from time import monotonic_ns, perf_counter, sleep, time_ns
+from typing import Callable
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import chat, json_records, logs
+from Network import FrameReader, FrameType
+from Network.codecs import MessageCodecs
+from Network.session import SessionStream, connect, decode_welcome
+from PayloadCompression import load_dictionary
+
+CONTENTS: dict[str, Callable[[int], bytes]] = {
+    "chat": chat,
+    "logs": logs,
+    "json": json_records,
+    "random": lambda size: bytes(Random(4).choices(b"abcdefghijklmnopqrstuvwxyz0123456789 .,!?", k=size)),
+}
+CORPUS_SIZE: int = 1 << 20
+MAX_WRITE: int = 64 * 1024
+
+
+def size_distribution(spec: str, rng: Random) -> Callable[[], int]:
+    """
+    Parse a size distribution: `fixed:N`, `uniform:MIN:MAX` or `exp:MEAN`, in bytes.
+    """
+    kind, *values = spec.split(":")
+    try:
+        numbers: list[int] = [int(value) for value in values]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid size distribution '{spec}'")
+    if kind == "fixed" and len(numbers) == 1:
+        return lambda: numbers[0]
+    if kind == "uniform" and len(numbers) == 2:
+        return lambda: rng.randint(*numbers)
+    if kind == "exp" and len(numbers) == 1:
+        return lambda: max(1, round(rng.expovariate(1 / numbers[0])))
+    raise argparse.ArgumentTypeError(f"Invalid size distribution '{spec}'")
+
+
+def excerpt(corpus: bytes, size: int, rng: Random) -> str:
+    """
+    Return `size` characters of the corpus from a random offset, wrapping around its end.
+    """
+    offset: int = rng.randrange(len(corpus))
+    text: bytes = corpus[offset:offset + size]
+    while len(text) < size:
+        text += corpus[:size - len(text)]
+    return text.decode("ascii", "replace")
+
+
+def percentile(ordered: list[int], fraction: float) -> float:
+    """
+    Return the nearest-rank percentile of sorted values, or NaN without values.
+    """
+    if not ordered:
+        return float("nan")
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LoadGenerator:
+    """
+    One connection to a node's server, sending timestamped messages and timing their processing.
+
+    Attributes:
+        _sock (socket): The connection.
+        _stream (SessionStream): The session the messages are compressed in.
+        _hello (bytearray): The `SESSION_HELLO` frame sent as a probe.
+        _pending (deque[tuple[int, int]]): The number and due time of every unacknowledged message.
+        _latencies (list[int]): The latency of every acknowledged message in nanoseconds.
+        _acked (int): The number of messages the server has processed.
+        _sent (int): The number of messages sent.
+        _raw_bytes (int): The size of the messages sent before compression.
+        _wire_bytes (int): The size of their frames.
+        _lock (threading.Lock): Guards the acknowledgement state shared with the reader thread.
+        _reader (threading.Thread): The thread reading the server's answers.
+    """
+    def __init__(self, host: str, port: int, dictionary: int | None, link_rate: float) -> None:
+        self._sock: socket = connect((host, port), 5.0)
+        self._stream: SessionStream = SessionStream(dictionary=dictionary, link_rate=link_rate)
+        self._hello: bytearray = self._stream.hello()
+        self._pending: deque[tuple[int, int]] = deque()
+        self._latencies: list[int] = []
+        self._acked: int = 0
+        self._sent: int = 0
+        self._raw_bytes: int = 0
+        self._wire_bytes: int = 0
+        self._lock: threading.Lock = threading.Lock()
+
+        self._sock.sendall(self._hello)
+        reader: FrameReader = FrameReader(64)
+        while reader.recv_from(self._sock):
+            welcome: list = [payload for frame_type, payload in reader.frames()
+                             if frame_type == FrameType.SESSION_WELCOME]
+            if welcome:
+                _, _, primed, codecs = decode_welcome(welcome[0])
+                self._stream.use(codecs, primed)
+                break
+        else:
+            raise ConnectionError("Connection closed during the session handshake")
+        self._reader: threading.Thread = threading.Thread(target=self.__read_acks, args=(reader,), daemon=True)
+        self._reader.start()
+
+    def __read_acks(self, reader: FrameReader) -> None:
+        """
+        Time the messages counted by every answer to a probe.
+        """
+        try:
+            while reader.recv_from(self._sock):
+                for frame_type, payload in reader.frames():
+                    if frame_type != FrameType.SESSION_WELCOME:
+                        continue
+                    received: int = decode_welcome(payload)[1]
+                    now: int = monotonic_ns()
+                    with self._lock:
+                        while self._pending and self._pending[0][0] <= received:
+                            self._latencies.append(now - self._pending.popleft()[1])
+                        self._acked = max(self._acked, received)
+        except OSError:
+            pass
+
+    def run(self, rate: float, duration: float, sizes: Callable[[], int], corpus: bytes,
+            probe_every: int, rng: Random) -> dict:
+        """
+        Send messages at `rate` per second (0 for as fast as possible) for `duration` seconds.
+
+        Returns:
+            dict: The messages, rate, latency percentiles and bytes of the run.
+        """
+        with self._lock:
+            self._latencies = []
+        first: int = self._sent
+        raw_start, wire_start = self._raw_bytes, self._wire_bytes
+        batch: bytearray = bytearray()
+        start_ns: int = monotonic_ns()
+        end_ns: int = start_ns + int(duration * 1e9)
+        while True:
+            index: int = self._sent - first
+            due: int = start_ns + int(index * 1e9 / rate) if rate else monotonic_ns()
+            if due >= end_ns:
+                break
+            if rate and not batch:
+                pause: int = due - monotonic_ns()
+                if pause > 0:
+                    sleep(pause / 1e9)
+
+            header: str = f"{self._sent + 1} {time_ns()} "
+            message: str = header + excerpt(corpus, max(sizes() - len(header), 1), rng)
+            seq, frame = self._stream.frame(message)
+            batch += frame
+            self._sent = seq
+            self._raw_bytes += len(message)
+            self._wire_bytes += len(frame)
+            with self._lock:
+                self._pending.append((seq, due))
+
+            if not seq % probe_every:
+                batch += self._hello
+            # Coalesce the frames while behind schedule, as a client's sender thread does.
+            behind: bool = not rate or start_ns + int((index + 1) * 1e9 / rate) <= monotonic_ns()
+            if behind and len(batch) < MAX_WRITE:
+                continue
+            self._sock.sendall(batch)
+            del batch[:]
+        self._sock.sendall(batch + self._hello)
+        sent: int = self._sent - first
+
+        deadline: float = perf_counter() + max(5.0, duration)
+        while perf_counter() < deadline:
+            with self._lock:
+                if self._acked >= self._sent:
+                    break
+            sleep(0.01)
+            self._sock.sendall(self._hello)
+        elapsed: float = (monotonic_ns() - start_ns) / 1e9
+        with self._lock:
+            latencies: list[int] = sorted(self._latencies)
+            acked: int = min(self._acked, self._sent) - first
+        raw: int = self._raw_bytes - raw_start
+        wire: int = self._wire_bytes - wire_start
+        return {"rate": rate, "sent": sent, "acked": acked, "per_second": acked / elapsed,
+                "p50": percentile(latencies, 0.50) / 1e6, "p95": percentile(latencies, 0.95) / 1e6,
+                "p99": percentile(latencies, 0.99) / 1e6,
+                "max": latencies[-1] / 1e6 if latencies else float("nan"),
+                "raw_bytes": raw, "wire_bytes": wire, "saved": 1 - wire / raw if raw else 0.0}
+
+    def close(self) -> None:
+        """
+        Close the connection; the server keeps the session for its resume timeout.
+        """
+        self._sock.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--rates", default="1000,5000,0",
+                        help="comma separated messages per second, 0 for as fast as possible")
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--sizes", default="exp:64")
+    parser.add_argument("--content", choices=sorted(CONTENTS), default="chat")
+    parser.add_argument("--probe-every", type=int, default=1)
+    parser.add_argument("--dictionary", help="a dictionary file the server has loaded as well")
+    parser.add_argument("--link-rate", type=float, default=MessageCodecs.LINK_RATE)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rng: Random = Random(args.seed)
+    sizes: Callable[[], int] = size_distribution(args.sizes, rng)
+    corpus: bytes = CONTENTS[args.content](CORPUS_SIZE)
+    dictionary: int | None = load_dictionary(args.dictionary).id if args.dictionary else None
+    generator: LoadGenerator = LoadGenerator(args.host, args.port, dictionary, args.link_rate)
+
+    print(f"{args.host}:{args.port}, {args.content} messages of {args.sizes} bytes, "
+          f"{args.duration:g} s per rate")
+    print(f"{'rate':>8} {'sent':>8} {'acked':>8} {'msgs/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'max ms':>8} {'raw bytes':>11} {'wire bytes':>11} {'saved':>7}")
+    try:
+        for rate in (float(rate) for rate in args.rates.split(",")):
+            result: dict = generator.run(rate, args.duration, sizes, corpus, max(args.probe_every, 1), rng)
+            print(f"{'max' if not rate else f'{rate:g}':>8} {result['sent']:>8} {result['acked']:>8} "
+                  f"{result['per_second']:>9.0f} {result['p50']:>8.2f} {result['p95']:>8.2f} "
+                  f"{result['p99']:>8.2f} {result['max']:>8.2f} {result['raw_bytes']:>11} "
+                  f"{result['wire_bytes']:>11} {result['saved']:>7.1%}")
+    finally:
+        generator.close()
+
+
+if __name__ == "__main__":
+    main()
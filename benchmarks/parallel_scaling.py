@@ -0,0 +1,67 @@
+"""
+Throughput scaling of the parallel block codec.
+
+Compresses and decompresses the same payload with 1, 2, 4 and 8 worker
+processes and reports MB/s and the speed-up over a single worker. The pool is
+warmed up before timing so process start-up is not measured.
+
+Usage:
+    python benchmarks/parallel_scaling.py [--size-mb N] [--block-kb N]
+"""
+import argparse
+import os
+import sys
+from random import Random
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PayloadCompression.ParallelCompression import ParallelCompression, ParallelDecompression
+
+SAMPLE: bytes = (b"2024-05-01 12:00:00 INFO connection accepted from 10.0.0.7:51234\n"
+                 b"{\"user\": \"alice\", \"message\": \"see you at the standup\"}\n")
+
+
+def make_payload(size: int) -> bytes:
+    """
+    Build a payload mixing repetitive text with random bytes.
+    """
+    noise: bytes = Random(0).randbytes(len(SAMPLE))
+    unit: bytes = SAMPLE * 7 + noise
+    return (unit * (size // len(unit) + 1))[:size]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-mb", type=float, default=4.0)
+    parser.add_argument("--block-kb", type=int, default=256)
+    args = parser.parse_args()
+
+    payload: bytes = make_payload(int(args.size_mb * 1024 * 1024))
+    block_size: int = args.block_kb * 1024
+    megabytes: float = len(payload) / 1e6
+
+    print(f"{len(payload)} bytes, {block_size // 1024} KiB blocks, {os.cpu_count()} CPUs")
+    print(f"{'workers':>7} {'compress MB/s':>14} {'speed-up':>9} {'decompress MB/s':>16} {'speed-up':>9}")
+    baseline: tuple[float, float] | None = None
+    for workers in (1, 2, 4, 8):
+        with ParallelCompression(workers, block_size) as compressor, ParallelDecompression(workers) as decompressor:
+            container: bytes = compressor.compress(payload)
+            decompressor.decompress(container)
+
+            start: float = perf_counter()
+            container = compressor.compress(payload)
+            compress_time: float = perf_counter() - start
+
+            start = perf_counter()
+            restored: bytes = decompressor.decompress(container)
+            decompress_time: float = perf_counter() - start
+
+        assert restored == payload
+        baseline = baseline or (compress_time, decompress_time)
+        print(f"{workers:>7} {megabytes / compress_time:>14.2f} {baseline[0] / compress_time:>8.2f}x "
+              f"{megabytes / decompress_time:>16.2f} {baseline[1] / decompress_time:>8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
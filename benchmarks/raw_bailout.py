@@ -0,0 +1,102 @@
+"""
+CPU time and wire bytes saved by writing incompressible messages raw.
+
+Builds mixed corpora of chat messages and incompressible ones (random bytes and
+zlib output) in several proportions. Each corpus is compressed and decompressed
+with the one-shot and the stream codec, with and without adaptive mode. The
+report shows the best total time of `--repeat` runs, the output size, and what
+adaptive mode saves.
+
+Usage:
+    python benchmarks/raw_bailout.py [--messages N] [--size BYTES] [--repeat N]
+"""
+import argparse
+import os
+import sys
+import zlib
+from random import Random
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import chat, random_bytes
+from PayloadCompression import Compression, Decompression, StreamCompressor, StreamDecompressor
+
+SHARES: tuple[float, ...] = (0.0, 0.25, 0.5, 0.75, 1.0)
+
+
+def mixed_corpus(messages: int, size: int, share: float) -> list[bytes]:
+    """
+    Return `messages` payloads of about `size` bytes, a `share` of which are incompressible.
+    """
+    rng: Random = Random(7)
+    text: bytes = chat(messages * size)
+    noise: bytes = random_bytes(messages * size)
+    corpus: list[bytes] = []
+    for i in range(messages):
+        payload: bytes = text[i * size:(i + 1) * size]
+        if rng.random() < share:
+            payload = noise[i * size:(i + 1) * size]
+            if rng.random() < 0.5:
+                payload = zlib.compress(payload)[:size]
+        corpus.append(payload)
+    return corpus
+
+
+def run_oneshot(corpus: list[bytes], adaptive: bool) -> tuple[float, int]:
+    """
+    Compress and decompress every payload with the one-shot codec; return seconds and output bytes.
+    """
+    compressor, decompressor = Compression(adaptive=adaptive), Decompression()
+    wire: int = 0
+    start: float = perf_counter()
+    for payload in corpus:
+        packed: bytearray = bytearray(compressor.max_compressed_size(len(payload)))
+        end: int = compressor.compress_into(payload, packed)
+        wire += end
+        output: bytearray = bytearray(decompressor.decompressed_size(packed[:end]))
+        decompressor.decompress_into(packed[:end], output)
+    return perf_counter() - start, wire
+
+
+def run_stream(corpus: list[bytes], adaptive: bool) -> tuple[float, int]:
+    """
+    Compress and decompress the payloads as one stream; return seconds and output bytes.
+    """
+    compressor, decompressor = StreamCompressor(adaptive=adaptive), StreamDecompressor()
+    wire: int = 0
+    start: float = perf_counter()
+    for payload in corpus:
+        compressor.feed(payload)
+        packet: bytearray = compressor.flush()
+        wire += len(packet)
+        if compressor.last_packet_raw:
+            decompressor.feed_raw(packet)
+        else:
+            decompressor.feed(packet)
+        decompressor.flush()
+    return perf_counter() - start, wire
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--size", type=int, default=1024)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{args.messages} messages of {args.size} bytes")
+    print(f"{'codec':<8} {'share':>6} {'plain s':>9} {'adaptive s':>11} {'cpu saved':>10} "
+          f"{'plain bytes':>12} {'adaptive bytes':>15} {'wire saved':>11}")
+    for share in SHARES:
+        corpus: list[bytes] = mixed_corpus(args.messages, args.size, share)
+        for name, run in (("oneshot", run_oneshot), ("stream", run_stream)):
+            plain_time, plain_wire = min(run(corpus, False) for _ in range(args.repeat))
+            adaptive_time, adaptive_wire = min(run(corpus, True) for _ in range(args.repeat))
+            print(f"{name:<8} {share:>6.0%} {plain_time:>9.3f} {adaptive_time:>11.3f} "
+                  f"{1 - adaptive_time / plain_time:>10.1%} {plain_wire:>12} {adaptive_wire:>15} "
+                  f"{1 - adaptive_wire / plain_wire:>11.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Messages per second handled by `SelectorServer` for 1, 10, 100 and 1000 clients.
+
+The server runs on a thread of this process; the clients run in a separate
+process, each with its own socket and stream compressor, and send their share
+of the messages round-robin. The rate is measured from the first byte sent to
+the last message delivered by the server.
+
+Each worker count of `--decode-workers` adds a column with the messages
+decompressed by that many `DecodePool` processes instead of on the event loop;
+0 is the default in-loop decompression.
+
+Usage:
+    python benchmarks/selector_server.py [--messages N] [--port P] [--decode-workers N,N,...]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import threading
+from multiprocessing import Event, Process
+from socket import create_connection
+from time import perf_counter, sleep
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Network import Connection
+from Network.framing import FrameType, encode_frame
+from Network.selector_server import Session, SelectorServer
+from PayloadCompression import StreamCompressor
+
+MESSAGE: bytes = b"are we still on for the design review at three?"
+
+
+class CountingServer(SelectorServer):
+    """
+    SelectorServer that counts messages instead of displaying them.
+    """
+    def __init__(self, port: int, expected: int, decode_workers: int = 0) -> None:
+        connection: Connection = Connection()
+        super().__init__("127.0.0.1", port, connection, decode_workers=decode_workers)
+        self.expected: int = expected
+        self.received: int = 0
+        self.done: threading.Event = threading.Event()
+
+    def deliver(self, session: Session, message: str) -> None:
+        self.received += 1
+        if self.received == self.expected:
+            self.done.set()
+
+
+def run_clients(port: int, clients: int, messages: int, go) -> None:
+    """
+    Connect `clients` sockets and send `messages` frames round-robin once `go` is set.
+    """
+    sockets = [create_connection(("127.0.0.1", port)) for _ in range(clients)]
+    compressors = [StreamCompressor() for _ in range(clients)]
+    go.wait()
+    for i in range(messages):
+        compressor: StreamCompressor = compressors[i % clients]
+        compressor.feed(MESSAGE)
+        sockets[i % clients].sendall(encode_frame(FrameType.MESSAGE, compressor.flush()))
+    for sock in sockets:
+        sock.close()
+
+
+def measure(port: int, clients: int, messages: int, decode_workers: int) -> float:
+    """
+    Return the messages per second delivered for one client and decode worker count.
+    """
+    server: CountingServer = CountingServer(port, messages, decode_workers)
+    thread = threading.Thread(target=server.start, daemon=True)
+    thread.start()
+    while not server._running:
+        sleep(0.01)
+
+    go = Event()
+    driver = Process(target=run_clients, args=(port, clients, messages, go))
+    driver.start()
+    while server.sessions < clients:
+        server.done.wait(0.01)
+
+    start: float = perf_counter()
+    go.set()
+    server.done.wait()
+    elapsed: float = perf_counter() - start
+
+    driver.join()
+    server.close()
+    thread.join()
+    return messages / elapsed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--port", type=int, default=7300)
+    parser.add_argument("--decode-workers", default="0",
+                        help="comma separated decode pool sizes, 0 to decompress on the event loop")
+    args = parser.parse_args()
+
+    workers: list[int] = [int(count) for count in args.decode_workers.split(",")]
+    results: list[tuple[int, list[float]]] = []
+    port: int = args.port
+    for clients in (1, 10, 100, 1000):
+        rates: list[float] = []
+        for count in workers:
+            with contextlib.redirect_stdout(open(os.devnull, "w")):
+                rates.append(measure(port, clients, args.messages, count))
+            port += 1
+        results.append((clients, rates))
+
+    print(f"{args.messages} messages of {len(MESSAGE)} bytes, messages/s by decode workers")
+    print(f"{'clients':>7}" + "".join(f" {count:>12}" for count in workers))
+    for clients, rates in results:
+        print(f"{clients:>7}" + "".join(f" {rate:>12.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
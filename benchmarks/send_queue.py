@@ -0,0 +1,104 @@
+"""
+Messages per second pushed through `Client.send` with and without write coalescing.
+
+The messages are queued as fast as the caller can, then flushed. Without
+coalescing the sender thread makes one `sendall` per frame; with it, frames
+queued within the coalescing delay share a write. A thread of this process
+accepts the connection, answers the session handshake and counts the message
+frames it receives.
+
+Usage:
+    python benchmarks/send_queue.py [--messages N] [--delay SECONDS] [--bytes N] [--nodelay] [--port P]
+"""
+import argparse
+import contextlib
+import os
+import sys
+import threading
+from socket import create_server
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Metrics import MetricsRegistry
+from Network import Client, Connection, FrameReader, FrameType, SocketOptions
+from Network.codecs import negotiate
+from Network.session import decode_hello, encode_welcome
+
+MESSAGE: str = "are we still on for the design review at three?"
+
+
+def count_frames(port: int, ready: threading.Event, counts: list[int]) -> None:
+    """
+    Accept one connection, open its session and count the message frames received until it is closed.
+    """
+    with create_server(("127.0.0.1", port)) as listener:
+        ready.set()
+        conn, _ = listener.accept()
+        reader: FrameReader = FrameReader()
+        with conn:
+            while reader.recv_from(conn):
+                for frame_type, payload in reader.frames():
+                    if frame_type == FrameType.SESSION_HELLO:
+                        conn.sendall(encode_welcome(False, 0, negotiate(decode_hello(payload)[1])))
+                    else:
+                        counts[0] += 1
+
+
+def measure(port: int, messages: int, options: SocketOptions | None, **coalescing) -> tuple[float, float]:
+    """
+    Return the messages per second and the average frames per write of one run.
+    """
+    ready: threading.Event = threading.Event()
+    counts: list[int] = [0]
+    receiver = threading.Thread(target=count_frames, args=(port, ready, counts))
+    receiver.start()
+    ready.wait()
+
+    connection: Connection = Connection()
+    connection.update_state()
+    metrics: MetricsRegistry = MetricsRegistry()
+    client: Client = Client("127.0.0.1", port, connection, delay=0, metrics=metrics,
+                            socket_options=options, **coalescing)
+    client.start()
+
+    start: float = perf_counter()
+    for _ in range(messages):
+        client.send(MESSAGE)
+    client.flush()
+    elapsed: float = perf_counter() - start
+
+    writes: int = metrics.snapshot()["histograms"]["client.frames_per_write"]["count"]
+    client.close()
+    receiver.join()
+    if counts[0] != messages:
+        raise RuntimeError(f"{counts[0]} of {messages} frames arrived")
+    return messages / elapsed, messages / writes
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20000)
+    parser.add_argument("--delay", type=float, default=0.001)
+    parser.add_argument("--bytes", type=int, default=64 * 1024)
+    parser.add_argument("--nodelay", action="store_true", help="set TCP_NODELAY on the client socket")
+    parser.add_argument("--port", type=int, default=7400)
+    args = parser.parse_args()
+
+    options: SocketOptions | None = SocketOptions(nodelay=True) if args.nodelay else None
+    runs: list[tuple[str, dict]] = [("one write per frame", {"coalesce_bytes": 0}),
+                                    ("coalesced", {"coalesce_delay": args.delay, "coalesce_bytes": args.bytes})]
+    results: list[tuple[str, float, float]] = []
+    for i, (label, coalescing) in enumerate(runs):
+        with contextlib.redirect_stdout(open(os.devnull, "w")):
+            results.append((label, *measure(args.port + i, args.messages, options, **coalescing)))
+
+    print(f"{args.messages} messages of {len(MESSAGE)} characters"
+          + (", TCP_NODELAY" if args.nodelay else ""))
+    print(f"{'':<20} {'messages/s':>12} {'frames/write':>13}")
+    for label, rate, per_write in results:
+        print(f"{label:<20} {rate:>12.0f} {per_write:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
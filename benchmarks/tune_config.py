@@ -0,0 +1,93 @@
+"""
+Pick the codec configuration that compresses a sample corpus best.
+
+Tries every combination of context order, table size and hash function on the
+samples, which are either files or content types of `benchmarks/corpus.py`, and
+ranks the configurations by compression ratio, reporting the throughput of each.
+With `--message-size` every sample is cut into messages sent through one stream,
+as the chat client does; otherwise each sample is compressed on its own, as a
+container block. The best configuration is the one with the lowest ratio among
+those reaching `--min-mbps`.
+
+Usage:
+    python benchmarks/tune_config.py [--files PATH ...] [--types chat logs ...]
+                                     [--size BYTES] [--message-size BYTES]
+                                     [--min-mbps MB/S] [--top N]
+"""
+import argparse
+import os
+import sys
+from itertools import product
+from time import perf_counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from corpus import CONTENT_TYPES
+from PayloadCompression import CodecConfig, StreamCompressor
+from PayloadCompression.CodecConfig import HASH_FUNCTIONS
+
+ORDERS: tuple[int, ...] = tuple(range(CodecConfig.MIN_ORDER, CodecConfig.MAX_ORDER + 1))
+TABLE_BITS: tuple[int, ...] = tuple(range(CodecConfig.MIN_TABLE_BITS, CodecConfig.MAX_TABLE_BITS + 1, 2))
+
+
+def measure(config: CodecConfig, samples: list[bytes], message_size: int | None) -> tuple[float, float]:
+    """
+    Compress the samples with a configuration; return the ratio and the throughput in MB/s.
+    """
+    compressor: StreamCompressor = StreamCompressor(config=config)
+    raw: int = 0
+    coded: int = 0
+    start: float = perf_counter()
+    for sample in samples:
+        compressor.reset()
+        step: int = message_size or len(sample)
+        for offset in range(0, len(sample), step):
+            compressor.feed(sample[offset:offset + step])
+            coded += len(compressor.flush())
+        raw += len(sample)
+    elapsed: float = perf_counter() - start
+    return coded / raw, raw / elapsed / 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--files", nargs="+", default=[])
+    parser.add_argument("--types", nargs="+", choices=sorted(CONTENT_TYPES), default=[])
+    parser.add_argument("--size", type=int, default=64 * 1024)
+    parser.add_argument("--message-size", type=int, default=None)
+    parser.add_argument("--min-mbps", type=float, default=0.0)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    samples: list[bytes] = []
+    for path in args.files:
+        with open(path, "rb") as file:
+            samples.append(file.read())
+    types: list[str] = args.types or ([] if args.files else ["chat", "logs", "json"])
+    samples += [CONTENT_TYPES[name](args.size) for name in types]
+
+    results: list[tuple[float, float, CodecConfig]] = []
+    for order, table_bits, hash_name in product(ORDERS, TABLE_BITS, HASH_FUNCTIONS):
+        config: CodecConfig = CodecConfig(order, table_bits, hash_name)
+        ratio, mbps = measure(config, samples, args.message_size)
+        results.append((ratio, -mbps, config))
+    results.sort(key=lambda result: result[:2])
+
+    print(f"{sum(map(len, samples))} sample bytes, "
+          + (f"{args.message_size}-byte messages" if args.message_size else "whole samples"))
+    print(f"{'order':>5} {'table':>8} {'hash':>10} {'ratio':>7} {'MB/s':>7}")
+    for ratio, mbps, config in results[:args.top]:
+        print(f"{config.order:>5} {config.table_size:>8} {config.hash_name:>10} {ratio:>7.3f} {-mbps:>7.2f}")
+
+    eligible: list[tuple[float, float, CodecConfig]] = [result for result in results if -result[1] >= args.min_mbps]
+    if not eligible:
+        print(f"No configuration reaches {args.min_mbps} MB/s")
+        return
+    ratio, mbps, best = eligible[0]
+    default_ratio: float = next(result[0] for result in results if result[2].is_default)
+    print(f"Best: {best!r} (header bytes {best.encode().hex()}), ratio {ratio:.3f} "
+          f"vs {default_ratio:.3f} for the default, {-mbps:.2f} MB/s")
+
+
+if __name__ == "__main__":
+    main()
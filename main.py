@@ -1,7 +1,11 @@
+import asyncio
 import threading
+from concurrent.futures import ThreadPoolExecutor
 from json import load
 from sys import argv
-from Network import Client, Server, Connection
+from Metrics import MetricsRegistry, Profiler
+from Network import Client, Server, Connection, AsyncClient, AsyncServer, SelectorServer, SessionStream, SocketOptions
+from PayloadCompression import load_dictionary
 
 class Node:
     """
@@ -13,14 +17,20 @@ class Node:
         _connection (Connection): A shared connection object for managing the state of the connection.
         _server (Server): The server instance to listen for incoming connections.
         _client (Client): The client instance to connect to a peer node.
+        _metrics (MetricsRegistry): The registry the client, the server and their codecs publish into.
 
     Methods:
+        metrics -> MetricsRegistry: The metrics of the node, e.g. to attach observers or take snapshots.
         __connect() -> None: Starts the server in a new thread and attempts to connect the client to a peer.
         __disconnect() -> None: Disconnects the node by updating the connection state.
         start_chat() -> None: Initiates the chat by connecting, handling client interaction, and then disconnecting.
     """
 
-    def __init__(self, my_host: str, my_port: int, peer_host: str, peer_port: int) -> None:
+    def __init__(self, my_host: str, my_port: int, peer_host: str, peer_port: int,
+                 metrics: MetricsRegistry | None = None,
+                 socket_options: SocketOptions | None = None,
+                 dictionary: int | None = None,
+                 decode_workers: int = 0) -> None:
         """
         Initialize the Node with the addresses and ports for both the server and client.
 
@@ -29,16 +39,37 @@ class Node:
             my_port (int): The port number for the server node.
             peer_host (str): The peer client's host address to connect to.
             peer_port (int): The peer client's port number.
+            metrics (MetricsRegistry | None, optional): The registry to publish into. Default is
+                                                        a new registry owned by the node.
+            socket_options (SocketOptions | None, optional): TCP options for the sockets of the
+                                                             client and the server. Default is None.
+            dictionary (int | None, optional): The id of a loaded dictionary to prime the sessions
+                                               of the client with. Default is None.
+            decode_workers (int, optional): The number of processes the server decompresses
+                                            with. Default is 0, which decompresses on its thread.
 
         The connection object is shared between both the client and the server, and both
         are attached as observers to the connection state.
         """
+        self._metrics: MetricsRegistry = metrics if metrics is not None else MetricsRegistry()
         self._connection: Connection = Connection()
-        self._server: Server = Server(my_host, my_port, self._connection)
-        self._client: Client = Client(peer_host,peer_port, self._connection)
+        self._server: Server = Server(my_host, my_port, self._connection, metrics=self._metrics,
+                                      socket_options=socket_options, decode_workers=decode_workers)
+        self._client: Client = Client(peer_host,peer_port, self._connection, metrics=self._metrics,
+                                      socket_options=socket_options, dictionary=dictionary)
         self._connection.attach(self._server)
         self._connection.attach(self._client)
 
+    @property
+    def metrics(self) -> MetricsRegistry:
+        """
+        Get the metrics registry of the node.
+
+        Returns:
+            MetricsRegistry: The registry the client, the server and their codecs publish into.
+        """
+        return self._metrics
+
     def __connect(self):
         """
         Start the server in a separate thread and attempt to connect the client to a peer.
@@ -62,9 +93,10 @@ class Node:
         Disconnect the node by updating the connection state.
 
         This method updates the connection state to indicate that the client has disconnected
-        from the chat session.
+        from the chat session, unless the client or the server already did.
         """
-        self._connection.update_state()
+        if self._connection.state:
+            self._connection.update_state()
 
     def start_chat(self) -> None:
         """
@@ -78,58 +110,428 @@ class Node:
         self._client.handler()
         self.__disconnect()
 
-def get_addresses(filename: str)->tuple[str, int, str, int]:
+class MeshNode:
+    """
+    A chat node of a group, connected to every other node of it.
+
+    The node serves all of its peers with one `SelectorServer` and keeps one `Client`
+    per peer. The clients share a single `SessionStream`: a message is compressed once
+    and the same frame is queued to every client, whose sender threads only write it
+    to their sockets. A peer that cannot follow the shared stream is compressed for
+    separately by its client (see `Client`).
+
+    Attributes:
+        _connection (Connection): A shared connection object for managing the state of the connection.
+        _server (SelectorServer): The server instance accepting the connections of all peers.
+        _clients (list[Client]): One client per peer, the unreachable ones dropped by `start_chat`.
+        _peers (list[tuple[str, int]]): The host address and port of every peer.
+        _stream (SessionStream): The session the messages to all peers are compressed in.
+        _metrics (MetricsRegistry): The registry the clients, the server and their codecs publish into.
+
+    Methods:
+        metrics -> MetricsRegistry: The metrics of the node, e.g. to attach observers or take snapshots.
+        broadcast(msg: str) -> int: Compresses a message once and queues it to every peer.
+        __connect() -> None: Starts the server in a new thread and connects to every peer at once.
+        handler() -> None: Handles user input and broadcasts messages in a loop.
+        start_chat() -> None: Connects, hands control to the handler, and then disconnects.
+    """
+
+    def __init__(self, my_host: str, my_port: int, peers: list[tuple[str, int]],
+                 metrics: MetricsRegistry | None = None,
+                 socket_options: SocketOptions | None = None,
+                 dictionary: int | None = None,
+                 decode_workers: int = 0) -> None:
+        """
+        Initialize the MeshNode with the address of its server and of every peer.
+
+        Args:
+            my_host (str): The host address of the server node.
+            my_port (int): The port number for the server node.
+            peers (list[tuple[str, int]]): The host address and port of every peer.
+            metrics (MetricsRegistry | None, optional): The registry to publish into. Default is
+                                                        a new registry owned by the node.
+            socket_options (SocketOptions | None, optional): TCP options for the sockets of the
+                                                             clients. Default is None.
+            dictionary (int | None, optional): The id of a loaded dictionary to prime the shared
+                                               session with. Default is None.
+            decode_workers (int, optional): The number of processes the server decompresses the
+                                            peers' messages with. Default is 0, which decompresses
+                                            on its event loop.
+        """
+        self._metrics: MetricsRegistry = metrics if metrics is not None else MetricsRegistry()
+        self._connection: Connection = Connection()
+        self._stream: SessionStream = SessionStream(self._metrics, dictionary, shared=True)
+        self._server: SelectorServer = SelectorServer(my_host, my_port, self._connection,
+                                                      metrics=self._metrics, decode_workers=decode_workers)
+        self._clients: list[Client] = [Client(peer_host, peer_port, self._connection, metrics=self._metrics,
+                                              socket_options=socket_options, stream=self._stream)
+                                       for peer_host, peer_port in peers]
+        self._peers: list[tuple[str, int]] = peers
+        self._connection.attach(self._server)
+        for client in self._clients:
+            self._connection.attach(client)
+
+    @property
+    def metrics(self) -> MetricsRegistry:
+        """
+        Get the metrics registry of the node.
+
+        Returns:
+            MetricsRegistry: The registry the clients, the server and their codecs publish into.
+        """
+        return self._metrics
+
+    def broadcast(self, msg: str) -> int:
+        """
+        Compress a message once and queue the same frame to every peer.
+
+        Args:
+            msg (str): The message.
+
+        Returns:
+            int: The number of peers the message was queued to.
+
+        Raises:
+            ValueError: If the message is empty.
+        """
+        framed: tuple[int, bytes] = self._stream.frame(msg)
+        queued: int = 0
+        for client in self._clients:
+            try:
+                client.send(msg, framed)
+                queued += 1
+            except ConnectionError:
+                continue
+        return queued
+
+    def __connect(self) -> None:
+        """
+        Start the server in a separate thread and connect to every peer in parallel.
+
+        Every client retries with backoff while its peer starts up. The peers that cannot 
+        be reached are dropped, and the node exits if none can. All clients are connected 
+        before the first message is compressed, so each of them carries the shared session 
+        from its start.
+        """
+        server_thread = threading.Thread(target=self._server.start)
+        self._connection.update_state()
+        server_thread.start()
+
+        unreachable: list[Client] = []
+        def start(client: Client, peer: tuple[str, int]) -> None:
+            try:
+                client.start()
+            except ConnectionAbortedError:
+                print(f"Leaving out unreachable peer {peer[0]}:{peer[1]}")
+                unreachable.append(client)
+        starters = [threading.Thread(target=start, args=(client, peer))
+                    for client, peer in zip(self._clients, self._peers)]
+        for starter in starters:
+            starter.start()
+        for starter in starters:
+            starter.join()
+
+        for client in unreachable:
+            self._clients.remove(client)
+            self._connection.detach(client)
+        if not self._clients:
+            self._connection.update_state()
+            exit(1)
+        print(f"Connected to {len(self._clients)} peers")
+
+    def handler(self) -> None:
+        """
+        Handle user input and broadcast messages to the peers.
+
+        The user can type 'exit' to leave the group, which tells every peer, or 
+        '/send <path>' to send a file to every peer. The loop ends once no peer 
+        can be reached any more.
+        """
+        while True:
+            message = input("")
+            if message.lower() == 'exit':
+                print("Exiting chat...")
+                self.broadcast('exit')
+                for client in self._clients:
+                    try:
+                        client.flush()
+                    except ConnectionError:
+                        continue
+                break
+            if message.startswith('/send '):
+                for client in self._clients:
+                    try:
+                        client.send_file(message[len('/send '):].strip())
+                    except ConnectionError:
+                        continue
+                continue
+            try:
+                if not self.broadcast(message):
+                    break
+            except ValueError as e:
+                print(str(e))
+
+    def start_chat(self) -> None:
+        """
+        Initiate the group chat by connecting to the peers, handling user interaction, and then disconnecting.
+        """
+        self.__connect()
+        self.handler()
+        if self._connection.state:
+            self._connection.update_state()
+
+class AsyncNode:
+    """
+    asyncio counterpart of `Node`, running its server and client on one event loop.
+
+    Attributes:
+        _connection (Connection): A shared connection object for managing the state of the connection.
+        _server (AsyncServer): The server instance to listen for incoming connections.
+        _client (AsyncClient): The client instance to connect to a peer node.
+
+    Methods:
+        start_chat() -> None: Runs the chat session on a new event loop.
+    """
+
+    def __init__(self, my_host: str, my_port: int, peer_host: str, peer_port: int,
+                 executor: ThreadPoolExecutor | None = None) -> None:
+        """
+        Initialize the AsyncNode with the addresses and ports for both the server and client.
+
+        Args:
+            my_host (str): The host address of the server node.
+            my_port (int): The port number for the server node.
+            peer_host (str): The peer client's host address to connect to.
+            peer_port (int): The peer client's port number.
+            executor (ThreadPoolExecutor | None, optional): Thread pool the codec work is offloaded
+                                                            to. Default is to run it on the event loop.
+        """
+        self._connection: Connection = Connection()
+        self._server: AsyncServer = AsyncServer(my_host, my_port, self._connection,
+                                                executor=executor, close_on_exit=True)
+        self._client: AsyncClient = AsyncClient(peer_host, peer_port, self._connection,
+                                                executor=executor)
+        self._connection.attach(self._server)
+        self._connection.attach(self._client)
+
+    async def __chat(self) -> None:
+        """
+        Start the server, connect the client, and hand control to the client's handler.
+        """
+        self._connection.update_state()
+        server_task = asyncio.create_task(self._server.start())
+        try:
+            await self._client.start()
+            await self._client.handler()
+        except ConnectionAbortedError:
+            pass
+        finally:
+            if self._connection.state:
+                self._connection.update_state()
+            server_task.cancel()
+            await self._server.wait_closed()
+
+    def start_chat(self) -> None:
+        """
+        Run the chat session until either side exits.
+        """
+        asyncio.run(self.__chat())
+
+def load_config(filename: str) -> dict:
     """
-    Parse the JSON file to extract server and peer addresses and ports.
+    Read the JSON configuration file of a node.
 
     Args:
-        filename (str): The name of the JSON file containing address configuration.
+        filename (str): The name of the JSON file containing the node configuration.
 
     Returns:
-        tuple: A tuple containing the host address, port, peer address, and peer port.
+        dict: The parsed configuration, passed to the `get_*` helpers.
 
     Raises:
         FileNotFoundError: If the file doesn't end with .json or the file is not found.
-        ValueError: If port or peer_port is missing in the JSON file.
+        ValueError: If the file is not valid JSON or does not hold a JSON object.
     """
-    address: str = "127.0.0.1"
-    peer_address: str = "127.0.0.1"
-
     if not filename.endswith('.json'):
         raise FileNotFoundError("Invalid suffix.")
 
     with open(filename) as js:
-        addressess = load(js)
-        if "address" in addressess:
-            address = addressess["address"]
-        if "peer_address" in addressess:
-            peer_address = addressess["peer_address"]
-        if "port" not in addressess:
-            raise ValueError("Port is not provided in JSON file.")
-        if "peer_port" not in addressess:
-            raise ValueError("Peer port is not provided in JSON file.")
-        
-        port = addressess["port"]
-        peer_port = addressess["peer_port"]
-
-    return address, port, peer_address, peer_port
+        config = load(js)
+    if not isinstance(config, dict):
+        raise ValueError("The configuration must be a JSON object.")
+    return config
+
+def get_addresses(config: dict)->tuple[str, int, str, int | None]:
+    """
+    Extract server and peer addresses and ports from the configuration.
+
+    Args:
+        config (dict): The node configuration, see `load_config`.
+
+    Returns:
+        tuple: A tuple containing the host address, port, peer address, and peer port.
+
+    Raises:
+        ValueError: If port is missing in the JSON file, or peer_port is missing without a "peers" list.
+
+    The peer port is None for a file listing its "peers" instead, see `get_peers`.
+    """
+    address: str = config.get("address", "127.0.0.1")
+    peer_address: str = config.get("peer_address", "127.0.0.1")
+    if "port" not in config:
+        raise ValueError("Port is not provided in JSON file.")
+    if "peer_port" not in config and "peers" not in config:
+        raise ValueError("Peer port is not provided in JSON file.")
+
+    return address, config["port"], peer_address, config.get("peer_port")
+
+def get_peers(config: dict) -> list[tuple[str, int]]:
+    """
+    Parse the optional "peers" list of the configuration, the nodes of a group chat.
+
+    Args:
+        config (dict): The node configuration, see `load_config`.
+
+    Returns:
+        list[tuple[str, int]]: The address and port of every peer, empty if the file has no list.
+
+    Raises:
+        ValueError: If "peers" is not a non-empty list of objects with a port.
+    """
+    peers = config.get("peers", [])
+    if not isinstance(peers, list):
+        raise ValueError("Peers must be a JSON list.")
+    if "peers" in config and not peers:
+        raise ValueError("Peers must list at least one node.")
+    addresses: list[tuple[str, int]] = []
+    for peer in peers:
+        if not isinstance(peer, dict) or "port" not in peer:
+            raise ValueError("Every peer must be a JSON object with a port.")
+        addresses.append((peer.get("address", "127.0.0.1"), peer["port"]))
+    return addresses
+
+def get_socket_options(config: dict) -> SocketOptions | None:
+    """
+    Parse the optional "socket" object of the configuration into socket options.
+
+    Args:
+        config (dict): The node configuration, see `load_config`.
+
+    Returns:
+        SocketOptions | None: The options, or None if the file has no "socket" object.
+
+    Raises:
+        ValueError: If the "socket" object holds an unknown key or an invalid value.
+    """
+    options = config.get("socket")
+    if options is None:
+        return None
+    if not isinstance(options, dict):
+        raise ValueError("Socket options must be a JSON object.")
+    return SocketOptions.from_dict(options)
+
+def get_dictionary(config: dict) -> int | None:
+    """
+    Load the dictionary named by the optional "dictionary" entry of the configuration.
+
+    Args:
+        config (dict): The node configuration, see `load_config`.
+
+    Returns:
+        int | None: The id of the loaded dictionary, or None if the file names none.
+
+    Raises:
+        ValueError: If the entry is not a path or the file is not a dictionary.
+        FileNotFoundError: If the dictionary file is not found.
+    """
+    path = config.get("dictionary")
+    if path is None:
+        return None
+    if not isinstance(path, str):
+        raise ValueError("Dictionary must be the path of a dictionary file.")
+    return load_dictionary(path).id
+
+def get_decode_workers(config: dict) -> int:
+    """
+    Read the optional "decode_workers" entry of the configuration.
+
+    Args:
+        config (dict): The node configuration, see `load_config`.
+
+    Returns:
+        int: The number of processes the server decompresses with, 0 if the file sets none.
+
+    Raises:
+        ValueError: If the entry is not a non-negative integer.
+    """
+    workers = config.get("decode_workers", 0)
+    if not isinstance(workers, int) or isinstance(workers, bool) or workers < 0:
+        raise ValueError("Decode workers must be a non-negative integer.")
+    return workers
+
+def get_profiler(config: dict) -> Profiler | None:
+    """
+    Build the profiler asked for by the `PREDICTOR_PROFILE` environment variable or the
+    optional "profile" object of the configuration, the environment taking precedence.
+
+    Args:
+        config (dict): The node configuration, see `load_config`.
+
+    Returns:
+        Profiler | None: The profiler, or None if neither asks for one.
+
+    Raises:
+        ValueError: If the "profile" object holds an unknown key or an invalid value.
+    """
+    profiler: Profiler | None = Profiler.from_env()
+    if profiler is not None:
+        return profiler
+    options = config.get("profile")
+    if options is None:
+        return None
+    if not isinstance(options, dict):
+        raise ValueError("Profile options must be a JSON object.")
+    return Profiler.from_dict(options)
 
 def main():
     """
     Main entry point for the chat node application.
 
     This function parses the command-line arguments, extracts the address configuration 
-    from the provided JSON file, and starts the Node for the chat session.
+    from the provided JSON file, and starts the Node for the chat session. Passing 
+    `--async` after the file name runs the asyncio based AsyncNode instead. A file with a 
+    "peers" list starts a MeshNode chatting with all of them. The optional "socket" object 
+    of the file sets the TCP options of the Node's sockets, and the optional "dictionary" 
+    path loads a dictionary the peers prime their sessions with. The optional "decode_workers" 
+    count moves the server's decompression to that many processes. These three are not 
+    supported by the AsyncNode and are rejected with `--async`. Profiling is switched on 
+    by the `PREDICTOR_PROFILE` environment variable or the optional "profile" object.
     
     If an error occurs during loading of the JSON file or if the provided arguments 
     are invalid, an error message is printed and the program terminates.
     """
     try:
-        if len(argv) != 2:
+        if len(argv) not in (2, 3) or (len(argv) == 3 and argv[2] != "--async"):
             raise ValueError("Invalid number of command line arguments")
-        host, port, peer_host, peer_port = get_addresses(argv[1])
+        config = load_config(argv[1])
+        host, port, peer_host, peer_port = get_addresses(config)
+        peers = get_peers(config)
+        profiler = get_profiler(config)
+        if profiler is not None:
+            profiler.install()
 
-        node = Node(host, port, peer_host, peer_port)
+        if peers:
+            if len(argv) == 3:
+                raise ValueError("A group of peers cannot run with --async")
+            node = MeshNode(host, port, peers, socket_options=get_socket_options(config),
+                            dictionary=get_dictionary(config), decode_workers=get_decode_workers(config))
+        elif len(argv) == 3:
+            unsupported = [key for key in ("socket", "dictionary", "decode_workers") if key in config]
+            if unsupported:
+                raise ValueError(f"{', '.join(unsupported)} cannot be used with --async")
+            node = AsyncNode(host, port, peer_host, peer_port)
+        else:
+            node = Node(host, port, peer_host, peer_port, socket_options=get_socket_options(config),
+                        dictionary=get_dictionary(config), decode_workers=get_decode_workers(config))
         node.start_chat()
     except ValueError as e:
         print(f"Error while loading: {e}")